@@ -8,7 +8,10 @@ from .adapter_base import (
     UIInfo,
 )
 from .configure_server_form import ConfigParamDescriptor, ConfigureServerForm
+from .download_scheduler import DownloadPriority, DownloadQueueStats
+from .http_session import HTTPPoolStats
 from .manager import AdapterManager, DownloadProgress, Result, SearchResult
+from .rate_limiter import RateLimitStats
 
 __all__ = (
     "Adapter",
@@ -19,7 +22,11 @@ __all__ = (
     "ConfigParamDescriptor",
     "ConfigurationStore",
     "ConfigureServerForm",
+    "DownloadPriority",
     "DownloadProgress",
+    "DownloadQueueStats",
+    "HTTPPoolStats",
+    "RateLimitStats",
     "Result",
     "SearchResult",
     "SongCacheStatus",
@@ -2,13 +2,16 @@ import abc
 import copy
 import hashlib
 import uuid
+from contextlib import nullcontext
 from dataclasses import dataclass
-from datetime import timedelta
+from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
 from typing import (
     Any,
+    Callable,
     cast,
+    ContextManager,
     Dict,
     Iterable,
     List,
@@ -40,6 +43,7 @@ from .api_objects import (
     SearchResult,
     Song,
 )
+from .http_session import PooledSession
 from ..util import this_decade
 
 
@@ -375,6 +379,16 @@ class Adapter(abc.ABC):
         when Sublime Music goes from online to offline mode or vice versa.
         """
 
+    @property
+    def http_session(self) -> Optional[PooledSession]:
+        """
+        The HTTP session that the adapter uses to make requests to the server. If the
+        adapter has one, it is also used to download the URIs returned by the adapter
+        (such as :class:`get_cover_art_uri` and :class:`get_song_file_uri`) so that the
+        downloads reuse the adapter's connections.
+        """
+        return None
+
     @property
     @abc.abstractmethod
     def ping_status(self) -> bool:
@@ -579,12 +593,21 @@ class Adapter(abc.ABC):
         """
         raise self._check_can_error("get_playlists")
 
-    def get_playlist_details(self, playlist_id: str) -> Playlist:
+    def get_playlist_details(
+        self,
+        playlist_id: str,
+        on_page: Optional[Callable[[Sequence[Song]], None]] = None,
+    ) -> Playlist:
         """
         Get the details for the given ``playlist_id``. If the playlist_id does not
         exist, then this function should throw an exception.
 
         :param playlist_id: The ID of the playlist to retrieve.
+        :param on_page: If the adapter receives the songs of the playlist in batches,
+            it can call this with each batch of songs, in order, as soon as it is
+            received, so that they can be ingested without holding all of them in
+            memory. The songs that are passed to ``on_page`` must not be included in
+            the returned playlist.
         :returns: A :class:`sublime_music.adapter.api_objects.Play` object for the given
             playlist.
         """
@@ -688,10 +711,16 @@ class Adapter(abc.ABC):
         """
         raise self._check_can_error("scrobble_song")
 
-    def get_artists(self) -> Sequence[Artist]:
+    def get_artists(
+        self, on_page: Optional[Callable[[Sequence[Artist]], None]] = None
+    ) -> Sequence[Artist]:
         """
         Get a list of all of the artists known to the adapter.
 
+        :param on_page: If the adapter receives the artists in batches, it can call this
+            with each batch of artists, in order, as soon as it is received, so that
+            they can be ingested without holding all of them in memory. The artists
+            that are passed to ``on_page`` must not be included in the returned list.
         :returns: A list of all of the :class:`sublime_music.adapter.api_objects.Artist`
             objects known to the adapter.
         """
@@ -716,7 +745,10 @@ class Adapter(abc.ABC):
         raise self._check_can_error("get_ignored_articles")
 
     def get_albums(
-        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
+        self,
+        query: AlbumSearchQuery,
+        sort_direction: str = "ascending",
+        on_page: Optional[Callable[[Sequence[Album]], None]] = None,
     ) -> Sequence[Album]:
         """
         Get a list of all of the albums known to the adapter for the given query.
@@ -728,6 +760,9 @@ class Adapter(abc.ABC):
 
         :param query: An :class:`AlbumSearchQuery` object representing the types of
             albums to return.
+        :param on_page: If the adapter gets the albums a page at a time, it should call
+            this with each page of albums, in order, as soon as it is received, so that
+            the UI can show the first albums before all of them have been received.
         :returns: A list of all of the :class:`sublime_music.adapter.api_objects.Album`
             objects known to the adapter that match the query.
         """
@@ -841,6 +876,18 @@ class CachingAdapter(Adapter):
 
     ping_status = True
 
+    @property
+    def download_staging_directory(self) -> Optional[Path]:
+        """
+        A directory on the same filesystem as the cache into which files can be
+        downloaded before they are passed to :class:`ingest_new_data`. Completed
+        downloads in this directory are named by the SHA-1 hash of their contents, so
+        the adapter can move them into place without re-reading them.
+
+        If this is ``None``, downloads will go to a temporary directory instead.
+        """
+        return None
+
     # Data Ingestion Methods
     # ==================================================================================
     class CachedDataKey(Enum):
@@ -882,6 +929,62 @@ class CachingAdapter(Adapter):
         :param data: the data that was returned by the ground truth adapter.
         """
 
+    def ingest_new_data_page(
+        self, data_key: CachedDataKey, param: Optional[str], page: Sequence[Any]
+    ):
+        """
+        This function will be called with each batch of objects that the ground truth
+        adapter receives for a request which has not finished yet. Once the request has
+        finished, :class:`ingest_paged_data` is called with the rest of the data.
+
+        This is only used for :class:`CachedDataKey.ARTISTS` (with batches of artists)
+        and :class:`CachedDataKey.PLAYLIST_DETAILS` (with batches of the playlist's
+        songs).
+
+        By default, the pages are kept in memory until :class:`ingest_paged_data` is
+        called. Adapters should override both of these functions if they can ingest
+        the pages as they are received.
+
+        :param data_key: the type of data that the page is a part of.
+        :param param: the parameter that uniquely identifies the data.
+        :param page: the batch of objects.
+        """
+        if not hasattr(self, "_data_pages"):
+            self._data_pages: Dict[Tuple[CachingAdapter.CachedDataKey, Any], Any] = {}
+        pages = self._data_pages.setdefault((data_key, param), {})
+        pages.update((o.id, o) for o in page)
+
+    def ingest_paged_data(
+        self,
+        data_key: CachedDataKey,
+        param: Optional[str],
+        data: Any,
+        page_ids: Sequence[str],
+    ):
+        """
+        This function will be called instead of :class:`ingest_new_data` once a request
+        whose objects were passed to :class:`ingest_new_data_page` has finished.
+
+        By default, the objects from the pages are put back into ``data``, and it is
+        ingested with :class:`ingest_new_data`.
+
+        :param data_key: the type of data to be ingested.
+        :param param: the parameter that uniquely identifies the data.
+        :param data: the data that was returned by the ground truth adapter, without
+            the objects that were in the pages.
+        :param page_ids: the IDs of the objects that were in the pages, in order.
+        """
+        # The pages from a previous request that failed may still be here, so only the
+        # objects from this request are used.
+        pages = getattr(self, "_data_pages", {}).pop((data_key, param), {})
+        objects = [pages[id_] for id_ in page_ids]
+        if data_key == CachingAdapter.CachedDataKey.ARTISTS:
+            data = [*objects, *data]
+        elif data_key == CachingAdapter.CachedDataKey.PLAYLIST_DETAILS:
+            data = copy.copy(data)
+            data.songs = [*objects, *data.songs]
+        self.ingest_new_data(data_key, param, data)
+
     @abc.abstractmethod
     def invalidate_data(self, data_key: CachedDataKey, param: Optional[str]):
         """
@@ -915,6 +1018,68 @@ class CachingAdapter(Adapter):
 
     # Cache-Specific Methods
     # ==================================================================================
+    def get_last_ingestion_time(
+        self, data_key: CachedDataKey, param: Optional[str]
+    ) -> Optional[datetime]:
+        """
+        Returns the time that the given data was last ingested. This is used to
+        determine when the cached data has expired and should be refreshed.
+
+        :param data_key: the type of data.
+        :param param: the parameter that uniquely identifies the data.
+        :returns: the time that the data was last ingested, or ``None`` if it is not
+            known or the data is not in the cache (or is invalid). If ``None``, the data
+            will never be refreshed automatically.
+        """
+        return None
+
+    def set_cache_size_limit(self, size_limit: Optional[int]):
+        """
+        Limit the total size of the files (such as songs and cover art) in the cache.
+        Adapters should evict the least recently used files to stay under the limit,
+        but must never evict the files that are cached permanently.
+
+        :param size_limit: the maximum size of the cached files in bytes, or ``None``
+            if there is no limit.
+        """
+
+    def batch_writes(self) -> ContextManager[None]:
+        """
+        Returns a context manager which groups all of the calls to
+        :class:`ingest_new_data`, :class:`invalidate_data`, and :class:`delete_data`
+        made inside of it so that they can be written together (for example, in a
+        single transaction). Each of the calls may still fail individually.
+
+        The :class:`AdapterManager` makes all of its writes to the caching adapter on a
+        single thread, in batches.
+        """
+        return nullcontext()
+
+    def initialize_read_thread(self):
+        """
+        Called on each of the threads that the :class:`AdapterManager` uses to read
+        from the cache, before any reads happen on that thread. Adapters can use this to
+        set up per-thread state such as database connections.
+        """
+
+    def get_songs_details(self, song_ids: Sequence[str]) -> Dict[str, Song]:
+        """
+        Get the details for multiple songs at once. Adapters should override this if
+        they can retrieve the songs more efficiently than one at a time.
+
+        :param song_ids: the IDs of the songs to get the details for.
+        :returns: a dictionary of song ID to song details for each of the songs that is
+            in the cache and valid. Songs which would cause a ``CacheMissError`` are
+            omitted.
+        """
+        songs = {}
+        for song_id in song_ids:
+            try:
+                songs[song_id] = self.get_song_details(song_id)
+            except CacheMissError:
+                pass
+        return songs
+
     @abc.abstractmethod
     def get_cached_statuses(
         self, song_ids: Sequence[str]
@@ -0,0 +1,206 @@
+"""
+Defines the scheduler that decides which song downloads run, and in what order.
+"""
+import logging
+import threading
+from collections import deque, OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from time import monotonic
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class DownloadPriority(Enum):
+    """
+    The priority class of a song download. Lower values are scheduled first.
+
+    * :class:`DownloadPriority.NOW_PLAYING` -- the song that is currently playing.
+      These downloads are started immediately, even if the concurrent download limit
+      has already been reached.
+    * :class:`DownloadPriority.PREFETCH` -- songs that are going to be played soon.
+    * :class:`DownloadPriority.BATCH` -- user-requested downloads and background
+      syncs. The download slots are shared fairly between all of the batch jobs.
+    """
+
+    NOW_PLAYING = 0
+    PREFETCH = 1
+    BATCH = 2
+
+
+@dataclass
+class DownloadQueueStats:
+    """
+    A snapshot of the state of a :class:`DownloadScheduler`.
+
+    **Fields:**
+
+    * :class:`DownloadQueueStats.active` -- the number of downloads currently running
+    * :class:`DownloadQueueStats.queued` -- the number of downloads waiting for a slot
+      for each priority
+    * :class:`DownloadQueueStats.mean_wait` -- the average time (in seconds) that
+      downloads of each priority have waited for a slot
+    * :class:`DownloadQueueStats.max_wait` -- the longest time (in seconds) that a
+      download of each priority has waited for a slot
+    """
+
+    active: int
+    queued: Dict[DownloadPriority, int]
+    mean_wait: Dict[DownloadPriority, float]
+    max_wait: Dict[DownloadPriority, float]
+
+
+@dataclass
+class _Ticket:
+    job_id: Hashable
+    start: Callable[[Callable[[], None]], None]
+    enqueued_at: float = field(default_factory=monotonic)
+
+
+@dataclass
+class _WaitTimes:
+    count: int = 0
+    total: float = 0
+    max: float = 0
+
+    def record(self, wait: float):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+
+class DownloadScheduler:
+    """
+    Limits the number of concurrent song downloads and decides which download gets the
+    next available slot.
+
+    Downloads are submitted with a ``start`` function. When the download is given a
+    slot, ``start`` is called with a ``release`` function which must be called once the
+    download is finished (whether it succeeded or not) to free the slot. The ``start``
+    function should not block; it should kick off the actual work on an executor.
+
+    Within a priority, downloads are taken from each job in turn so that one large job
+    (for example, downloading a 500 song playlist) can't starve the others.
+    """
+
+    def __init__(self, concurrent_download_limit: int):
+        self.concurrent_download_limit = max(1, concurrent_download_limit)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues: Dict[
+            DownloadPriority, "OrderedDict[Hashable, Deque[_Ticket]]"
+        ] = {priority: OrderedDict() for priority in DownloadPriority}
+        self._wait_times = {priority: _WaitTimes() for priority in DownloadPriority}
+
+    def submit(
+        self,
+        job_id: Hashable,
+        priority: DownloadPriority,
+        start: Callable[[Callable[[], None]], None],
+    ):
+        """
+        Queue a download.
+
+        :param job_id: identifies the job that the download belongs to. Used for
+            fairness between jobs and for :class:`cancel_job`.
+        :param priority: the :class:`DownloadPriority` of the download.
+        :param start: the function to call once the download has a slot.
+        """
+        with self._lock:
+            jobs = self._queues[priority]
+            if job_id not in jobs:
+                jobs[job_id] = deque()
+            jobs[job_id].append(_Ticket(job_id, start))
+        self._dispatch()
+
+    def cancel_job(self, job_id: Hashable) -> int:
+        """
+        Remove all of the queued downloads for the given job. Downloads that have
+        already started are not affected.
+
+        :returns: the number of downloads that were removed from the queue.
+        """
+        removed = 0
+        with self._lock:
+            for jobs in self._queues.values():
+                if tickets := jobs.pop(job_id, None):
+                    removed += len(tickets)
+        return removed
+
+    def clear(self):
+        """Remove all of the queued downloads."""
+        with self._lock:
+            for jobs in self._queues.values():
+                jobs.clear()
+
+    def stats(self) -> DownloadQueueStats:
+        with self._lock:
+            return DownloadQueueStats(
+                active=self._active,
+                queued={
+                    priority: sum(map(len, jobs.values()))
+                    for priority, jobs in self._queues.items()
+                },
+                mean_wait={
+                    priority: (w.total / w.count if w.count else 0)
+                    for priority, w in self._wait_times.items()
+                },
+                max_wait={priority: w.max for priority, w in self._wait_times.items()},
+            )
+
+    def _next_ticket(self) -> Optional[Tuple[DownloadPriority, _Ticket]]:
+        # Must be called with the lock held.
+        for priority in DownloadPriority:
+            jobs = self._queues[priority]
+            if not jobs:
+                continue
+            if (
+                priority != DownloadPriority.NOW_PLAYING
+                and self._active >= self.concurrent_download_limit
+            ):
+                return None
+
+            # Take the first download from the job at the front of the line, and then
+            # move that job to the back of the line.
+            job_id, tickets = jobs.popitem(last=False)
+            ticket = tickets.popleft()
+            if tickets:
+                jobs[job_id] = tickets
+            return priority, ticket
+
+        return None
+
+    def _dispatch(self):
+        to_start: List[_Ticket] = []
+        with self._lock:
+            while next_ticket := self._next_ticket():
+                priority, ticket = next_ticket
+                self._active += 1
+                wait = monotonic() - ticket.enqueued_at
+                self._wait_times[priority].record(wait)
+                logging.debug(
+                    f"Starting {priority} download for job {ticket.job_id} after "
+                    f"waiting {wait:.2f}s ({self._active} active)"
+                )
+                to_start.append(ticket)
+
+        for ticket in to_start:
+            release = self._create_release_fn()
+            try:
+                ticket.start(release)
+            except Exception:
+                logging.exception(f"Failed to start download for job {ticket.job_id}")
+                release()
+
+    def _create_release_fn(self) -> Callable[[], None]:
+        released = False
+
+        def release():
+            nonlocal released
+            with self._lock:
+                if released:
+                    return
+                released = True
+                self._active -= 1
+            self._dispatch()
+
+        return release
@@ -2,16 +2,33 @@ import hashlib
 import logging
 import shutil
 import threading
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, cast, Dict, Iterable, Optional, Sequence, Set, Tuple
+from typing import (
+    Any,
+    Callable,
+    cast,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from gi.repository import Gtk
-from peewee import fn, prefetch
+from peewee import chunked, fn
+from playhouse.migrate import migrate, SqliteMigrator
 
 from sublime_music.adapters import api_objects as API
 
 from . import models
+from .blob_store import BlobStore, create_blob_table
+from .ingestion import BulkIngester, MAX_VARIABLES
+from .migrations import FILE_TRACKING_VERSION, MIGRATIONS, SCHEMA_VERSION
+from .search_index import create_search_index, search_candidates
 from .. import (
     AlbumSearchQuery,
     CacheMissError,
@@ -25,6 +42,35 @@ from .. import (
 
 KEYS = CachingAdapter.CachedDataKey
 
+# Partial downloads older than this are deleted on startup instead of being resumed.
+PARTIAL_DOWNLOAD_MAX_AGE = timedelta(days=7)
+
+# How often the times that the cached files were used are written to the database,
+# which is also how often the size of the cache is checked.
+FILE_ACCESS_FLUSH_INTERVAL = timedelta(minutes=1)
+
+# How often the files in the cache are checked against the database, to find the files
+# that were added or removed without going through the adapter.
+RECONCILIATION_INTERVAL = timedelta(hours=1)
+
+# The maximum number of files that are evicted from the cache in one transaction.
+EVICTION_BATCH_SIZE = 100
+
+# The number of files that are checked in each transaction while reconciling.
+RECONCILIATION_BATCH_SIZE = 500
+
+# The pragmas that are set on every connection to the cache database. In WAL mode,
+# reads don't wait for writes (such as a big ingestion) to finish and vice versa. With
+# WAL, synchronous=normal can only lose the most recent transactions on power loss,
+# which is fine for a cache.
+DATABASE_PRAGMAS = (
+    ("journal_mode", "wal"),
+    ("synchronous", "normal"),
+    ("cache_size", -16 * 1024),  # in KiB
+    ("mmap_size", 128 * 1024 * 1024),
+    ("temp_store", "memory"),
+)
+
 
 class FilesystemAdapter(CachingAdapter):
     """
@@ -62,34 +108,280 @@ class FilesystemAdapter(CachingAdapter):
 
     def __init__(self, config: dict, data_directory: Path, is_cache: bool = False):
         self.data_directory = data_directory
-        self.cover_art_dir = self.data_directory.joinpath("cover_art")
         self.music_dir = self.data_directory.joinpath("music")
+        self.staging_dir = self.data_directory.joinpath("staging")
 
-        self.cover_art_dir.mkdir(parents=True, exist_ok=True)
+        # All of the cached files are stored in the blob store. The song files are also
+        # put at their paths from the server in the music directory.
+        self.blob_store = BlobStore(self.data_directory.joinpath("blobs"))
         self.music_dir.mkdir(parents=True, exist_ok=True)
 
+        # Cover art used to be stored in its own directory, named by its hash.
+        if (legacy_cover_art_dir := self.data_directory.joinpath("cover_art")).exists():
+            for cover_art in legacy_cover_art_dir.iterdir():
+                self.blob_store.add(cover_art, cover_art.name, link=True)
+            shutil.rmtree(legacy_cover_art_dir)
+
+        # Completed downloads left in the staging directory are from a previous
+        # session. Partial downloads are kept for a while so that they can be resumed.
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        partial_download_cutoff = datetime.now() - PARTIAL_DOWNLOAD_MAX_AGE
+        for staged_file in self.staging_dir.iterdir():
+            if (
+                staged_file.suffix != ".part"
+                or datetime.fromtimestamp(staged_file.stat().st_mtime)
+                < partial_download_cutoff
+            ):
+                staged_file.unlink(missing_ok=True)
+
         self.is_cache = is_cache
 
-        self.db_write_lock: threading.Lock = threading.Lock()
+        # This is re-entrant so that the writes in a batch can take it again.
+        self.db_write_lock = threading.RLock()
         database_filename = data_directory.joinpath("cache.db")
-        models.database.init(database_filename)
+        models.database.init(database_filename, pragmas=DATABASE_PRAGMAS)
         models.database.connect()
 
         with self.db_write_lock, models.database.atomic():
+            untracked_files = self._migrate_db()
             models.database.create_tables(models.ALL_TABLES)
-            self._migrate_db()
+            create_search_index()
+            create_blob_table()
+
+        # The cache keys that have cache infos, which are only ever deleted all at once.
+        # This is only updated while holding the database write lock.
+        self._cache_keys: Set[CachingAdapter.CachedDataKey] = set(
+            models.CacheInfo.select(models.CacheInfo.cache_key).distinct().scalars()
+        )
+
+        # The files in the cache are maintained by a background thread:
+        # * it checks which files are actually on disk (on startup and periodically),
+        #   so that the cache statuses can come from the database without any stats,
+        # * it writes the times that files were used (which are collected in memory),
+        # * and it evicts the least recently used files when the files in the cache are
+        #   over the size limit (if there is one).
+        self._cache_size_limit: Optional[int] = None
+        self._reconciliation_requested = True
+        self._accessed_files: Set[int] = set()
+        self._accessed_files_lock = threading.Lock()
+        self._maintenance_requested = threading.Event()
+        self._maintenance_stopped = False
+        self._maintenance_thread: Optional[threading.Thread] = None
+        if is_cache and untracked_files:
+            # Until the files that were cached before they were tracked are found, they
+            # would look like they aren't cached, so find them before the cache is used.
+            logging.info("Finding the files that are already in the cache")
+            self._reconcile_cached_files()
+        if is_cache:
+            self._maintenance_thread = threading.Thread(
+                target=self._run_maintenance, name="cache-maintenance", daemon=True
+            )
+            self._maintenance_thread.start()
 
     def initial_sync(self):
         # TODO (#188) this is where scanning the fs should potentially happen?
         pass
 
     def shutdown(self):
+        if self._maintenance_thread:
+            self._maintenance_stopped = True
+            self._maintenance_requested.set()
+            self._maintenance_thread.join()
+
+        # Once the last connection to the database is closed, SQLite checkpoints the
+        # WAL into the database file.
+        models.database.close()
         logging.info("Shutdown complete")
 
     # Database Migration
     # ==================================================================================
-    def _migrate_db(self):
-        pass
+    def _migrate_db(self) -> bool:
+        """
+        Migrate the database to the current schema. Returns whether the database is
+        from before the sizes and access times of the cached files were tracked.
+        """
+        if not models.Version.table_exists():
+            # This is a new database, so all of the tables will be created with the
+            # current schema.
+            models.Version.create_table()
+            models.Version.update_version(SCHEMA_VERSION)
+            return False
+
+        untracked_files = models.Version.is_less_than(FILE_TRACKING_VERSION)
+        migrator = SqliteMigrator(models.database)
+        for version, migration in MIGRATIONS:
+            if models.Version.is_less_than(version):
+                logging.info(f"Migrating the cache database to version {version}")
+                migrate(*migration(migrator))
+                models.Version.update_version(version)
+        return untracked_files
+
+    # Cache Maintenance
+    # ==================================================================================
+    def set_cache_size_limit(self, size_limit: Optional[int]):
+        self._cache_size_limit = size_limit
+        self._maintenance_requested.set()
+
+    def _compute_cached_filename(self, cache_info: models.CacheInfo) -> Path:
+        if cache_info.cache_key == KEYS.COVER_ART_FILE:
+            return self.blob_store.path(cache_info.file_hash)
+        return self._compute_song_filename(cache_info)
+
+    def _track_cached_file(self, cache_info: models.CacheInfo, filename: Path):
+        cache_info.disk_size = filename.stat().st_size
+        cache_info.last_access_time = datetime.now()  # type: ignore
+        # This won't run until the current transaction is done since it needs the
+        # database write lock.
+        self._maintenance_requested.set()
+
+    def _record_file_access(self, cache_info: models.CacheInfo):
+        with self._accessed_files_lock:
+            self._accessed_files.add(cache_info.id)
+
+    def _request_reconciliation(self):
+        self._reconciliation_requested = True
+        self._maintenance_requested.set()
+
+    def _run_maintenance(self):
+        next_reconciliation = datetime.now()
+        while not self._maintenance_stopped:
+            try:
+                if (
+                    self._reconciliation_requested
+                    or datetime.now() >= next_reconciliation
+                ):
+                    self._reconciliation_requested = False
+                    next_reconciliation = datetime.now() + RECONCILIATION_INTERVAL
+                    self._reconcile_cached_files()
+                    with self.db_write_lock, models.database.atomic():
+                        self.blob_store.collect_garbage(include_orphans=True)
+                self._flush_file_accesses()
+                if self._cache_size_limit is not None:
+                    self._evict_files()
+                with self.db_write_lock, models.database.atomic():
+                    self.blob_store.collect_garbage()
+            except Exception:
+                logging.exception("Failed to maintain the files in the cache")
+
+            self._maintenance_requested.wait(FILE_ACCESS_FLUSH_INTERVAL.total_seconds())
+            self._maintenance_requested.clear()
+
+        models.database.close()
+
+    def _flush_file_accesses(self):
+        with self._accessed_files_lock:
+            accessed_files, self._accessed_files = self._accessed_files, set()
+        if not accessed_files:
+            return
+
+        now = datetime.now()
+        with self.db_write_lock, models.database.atomic():
+            for chunk in chunked(accessed_files, MAX_VARIABLES - 1):
+                models.CacheInfo.update(last_access_time=now).where(
+                    models.CacheInfo.id.in_(chunk),
+                    models.CacheInfo.last_access_time.is_null(False),
+                ).execute()
+
+    def _reconcile_cached_files(self):
+        """
+        Make the cache infos match the files that are actually in the cache. This finds
+        the files that were deleted (or added) without going through the adapter, and
+        the files that were cached before the sizes and access times of the cached files
+        were tracked, or before the blob store.
+        """
+        CacheInfo = models.CacheInfo
+        last_id = 0
+        while not self._maintenance_stopped:
+            with self.db_write_lock, models.database.atomic():
+                cache_infos = list(
+                    CacheInfo.select()
+                    .where(
+                        CacheInfo.id > last_id,
+                        CacheInfo.cache_key.in_((KEYS.SONG_FILE, KEYS.COVER_ART_FILE)),
+                        CacheInfo.file_hash.is_null(False),
+                    )
+                    .order_by(CacheInfo.id)
+                    .limit(RECONCILIATION_BATCH_SIZE)
+                )
+                if not cache_infos:
+                    return
+
+                for cache_info in cache_infos:
+                    if not self.blob_store.path(cache_info.file_hash).exists():
+                        self._adopt_legacy_file(cache_info)
+                    try:
+                        disk_size = (
+                            self._compute_cached_filename(cache_info).stat().st_size
+                        )
+                    except OSError:
+                        disk_size = None
+
+                    if disk_size == cache_info.disk_size:
+                        continue
+                    logging.debug(
+                        f"Reconciling {cache_info.cache_key} {cache_info.id}: "
+                        f"{cache_info.disk_size} -> {disk_size}"
+                    )
+                    cache_info.disk_size = disk_size
+                    if disk_size is None:
+                        cache_info.last_access_time = None
+                    elif cache_info.last_access_time is None:
+                        cache_info.last_access_time = cache_info.last_ingestion_time
+                    cache_info.save()
+                last_id = cache_infos[-1].id
+
+    def _adopt_legacy_file(self, cache_info: models.CacheInfo):
+        """
+        Add the file of a cache info that was cached before the blob store to the blob
+        store. Songs without a path used to be stored by hash in the music directory.
+        """
+        file_hash = cache_info.file_hash
+        if (filename := self._compute_cached_filename(cache_info)).exists():
+            self.blob_store.add(filename, file_hash, link=True)
+        elif (legacy_filename := self.music_dir.joinpath(file_hash)).exists():
+            self.blob_store.add(legacy_filename, file_hash, link=True)
+            legacy_filename.unlink()
+
+    def _evict_files(self):
+        CacheInfo = models.CacheInfo
+        cached_files = CacheInfo.last_access_time.is_null(False)
+        while (size_limit := self._cache_size_limit) is not None:
+            # Evict based on the latest accesses, including any that were made just
+            # before the limit was changed.
+            self._flush_file_accesses()
+            with self.db_write_lock, models.database.atomic():
+                cache_size = (
+                    CacheInfo.select(fn.SUM(CacheInfo.disk_size))
+                    .where(cached_files)
+                    .scalar()
+                ) or 0
+                if cache_size <= size_limit or self._maintenance_stopped:
+                    return
+
+                least_recently_used = (
+                    CacheInfo.select()
+                    .where(
+                        cached_files,
+                        CacheInfo.cache_permanently.is_null()
+                        | ~CacheInfo.cache_permanently,
+                    )
+                    .order_by(CacheInfo.last_access_time)
+                    .limit(EVICTION_BATCH_SIZE)
+                )
+                evicted = 0
+                for cache_info in least_recently_used:
+                    if cache_size <= size_limit:
+                        break
+                    logging.debug(f"Evicting {cache_info.cache_key} {cache_info.id}")
+                    self._do_delete_data(cache_info.cache_key, cache_info.parameter)
+                    cache_size -= cache_info.disk_size or 0
+                    evicted += 1
+
+                if evicted == 0:
+                    logging.warning(
+                        "The permanently cached files are over the cache size limit"
+                    )
+                    return
 
     # Usage and Availability Properties
     # ==================================================================================
@@ -114,8 +406,7 @@ class FilesystemAdapter(CachingAdapter):
 
         # As long as there's something in the cache (even if it's not valid) it may be
         # returned in a cache miss error.
-        query = models.CacheInfo.select().where(models.CacheInfo.cache_key == cache_key)
-        return query.count() > 0
+        return cache_key in self._cache_keys
 
     @property
     def can_get_playlists(self) -> bool:
@@ -133,6 +424,10 @@ class FilesystemAdapter(CachingAdapter):
     def can_get_genres(self) -> bool:
         return self._can_get_key(KEYS.GENRES)
 
+    @property
+    def download_staging_directory(self) -> Optional[Path]:
+        return self.staging_dir if self.is_cache else None
+
     supported_schemes = ("file",)
     supported_artist_query_types = {
         AlbumSearchQuery.Type.RANDOM,
@@ -208,48 +503,80 @@ class FilesystemAdapter(CachingAdapter):
         except Exception:
             pass
 
-        # Fall back to using the song file hash as the filename. This shouldn't happen
-        # with good servers, but just to be safe.
-        return self.music_dir.joinpath(cache_info.file_hash)
+        # Fall back to using the blob itself. This shouldn't happen with good servers,
+        # but just to be safe.
+        return self.blob_store.path(cache_info.file_hash)
+
+    def _compute_file_hash(self, filename: Path) -> str:
+        # Files in the staging directory are named by the hash of their contents.
+        if filename.parent == self.staging_dir:
+            return filename.name
+
+        file_hash = hashlib.sha1()
+        with open(filename, "rb") as f:
+            while chunk := f.read(64 * 1024):
+                file_hash.update(chunk)
+
+        return file_hash.hexdigest()
+
+    def _add_blob(self, source: Path, file_hash: str) -> Path:
+        # Files from the staging directory are on the same filesystem as the cache and
+        # are never modified, so they are hardlinked into the blob store instead of
+        # being copied. The staging file is deleted by the caller that downloaded it
+        # once it has been ingested, since other callers may be ingesting it too.
+        return self.blob_store.add(
+            source, file_hash, link=source.parent == self.staging_dir
+        )
 
     # Data Retrieval Methods
     # ==================================================================================
     def get_cached_statuses(
         self, song_ids: Sequence[str]
     ) -> Dict[str, SongCacheStatus]:
-        def compute_song_cache_status(song: models.Song) -> SongCacheStatus:
-            try:
-                file = song.file
-                if self._compute_song_filename(file).exists():
-                    if file.valid:
-                        if file.cache_permanently:
-                            return SongCacheStatus.PERMANENTLY_CACHED
-                        return SongCacheStatus.CACHED
-
-                    # The file is on disk, but marked as stale.
-                    return SongCacheStatus.CACHED_STALE
-            except Exception:
-                pass
-
-            return SongCacheStatus.NOT_CACHED
-
+        # Whether each file is on disk is tracked in the database, so this doesn't
+        # need to touch the filesystem.
         cached_statuses = {song_id: SongCacheStatus.NOT_CACHED for song_id in song_ids}
+        CacheInfo = models.CacheInfo
         try:
-            file_models = models.CacheInfo.select().where(
-                models.CacheInfo.cache_key == KEYS.SONG_FILE
-            )
-            song_models = models.Song.select().where(models.Song.id.in_(song_ids))
-            cached_statuses.update(
-                {
-                    s.id: compute_song_cache_status(s)
-                    for s in prefetch(song_models, file_models)
-                }
-            )
+            for chunk in chunked(song_ids, MAX_VARIABLES):
+                cached_files = (
+                    models.Song.select(
+                        models.Song.id, CacheInfo.valid, CacheInfo.cache_permanently
+                    )
+                    .join(CacheInfo, on=(models.Song.file == CacheInfo.id))
+                    .where(
+                        models.Song.id.in_(chunk),
+                        CacheInfo.last_access_time.is_null(False),
+                    )
+                )
+                for song_id, valid, cache_permanently in cached_files.tuples():
+                    if not valid:
+                        # The file is on disk, but marked as stale.
+                        cached_statuses[song_id] = SongCacheStatus.CACHED_STALE
+                    elif cache_permanently:
+                        cached_statuses[song_id] = SongCacheStatus.PERMANENTLY_CACHED
+                    else:
+                        cached_statuses[song_id] = SongCacheStatus.CACHED
         except Exception:
-            pass
+            logging.exception("Failed to get the cached statuses")
 
         return cached_statuses
 
+    def get_last_ingestion_time(
+        self, data_key: CachingAdapter.CachedDataKey, param: Optional[str]
+    ) -> Optional[datetime]:
+        cache_info = models.CacheInfo.get_or_none(
+            models.CacheInfo.cache_key == data_key,
+            models.CacheInfo.parameter == param,
+            models.CacheInfo.valid == True,  # noqa: 712
+        )
+        return cache_info.last_ingestion_time if cache_info else None
+
+    def initialize_read_thread(self):
+        # Peewee keeps a separate connection for each thread. Open this thread's
+        # connection now so that the first read doesn't have to.
+        models.database.connect(reuse_if_open=True)
+
     _playlists = None
 
     def get_playlists(self, ignore_cache_miss: bool = False) -> Sequence[API.Playlist]:
@@ -264,7 +591,12 @@ class FilesystemAdapter(CachingAdapter):
         )
         return self._playlists
 
-    def get_playlist_details(self, playlist_id: str) -> API.Playlist:
+    def get_playlist_details(
+        self,
+        playlist_id: str,
+        on_page: Optional[Callable[[Sequence[API.Song]], None]] = None,
+    ) -> API.Playlist:
+        # The cached songs are all read at once, so there are no pages to publish.
         return self._get_object_details(
             models.Playlist, playlist_id, CachingAdapter.CachedDataKey.PLAYLIST_DETAILS
         )
@@ -274,13 +606,18 @@ class FilesystemAdapter(CachingAdapter):
             models.CacheInfo.cache_key == CachingAdapter.CachedDataKey.COVER_ART_FILE,
             models.CacheInfo.parameter == cover_art_id,
         )
-        if cover_art:
-            filename = self.cover_art_dir.joinpath(str(cover_art.file_hash))
+        # Deleted cover art stays in the blob store until it's garbage collected, so
+        # only use the cover art that is still in the cache.
+        if cover_art and cover_art.disk_size is not None:
+            filename = self.blob_store.path(cover_art.file_hash)
             if filename.exists():
+                self._record_file_access(cover_art)
                 if cover_art.valid:
                     return str(filename)
                 else:
                     raise CacheMissError(partial_data=str(filename))
+            # The file was deleted without going through the adapter.
+            self._request_reconciliation()
 
         raise CacheMissError()
 
@@ -293,15 +630,17 @@ class FilesystemAdapter(CachingAdapter):
                 raise Exception(f"Song {song_id} does not exist.")
 
         try:
-            if (song_file := song.file) and (
-                filename := self._compute_song_filename(song_file)
-            ):
+            if (song_file := song.file) and song_file.disk_size is not None:
+                filename = self._compute_song_filename(song_file)
                 if filename.exists():
+                    self._record_file_access(song_file)
                     file_uri = f"file://{filename}"
                     if song_file.valid:
                         return file_uri
                     else:
                         raise CacheMissError(partial_data=file_uri)
+                # The file was deleted without going through the adapter.
+                self._request_reconciliation()
         except models.CacheInfo.DoesNotExist:
             pass
 
@@ -314,7 +653,38 @@ class FilesystemAdapter(CachingAdapter):
             CachingAdapter.CachedDataKey.SONG,
         )
 
-    def get_artists(self, ignore_cache_miss: bool = False) -> Sequence[API.Artist]:
+    def get_songs_details(self, song_ids: Sequence[str]) -> Dict[str, API.Song]:
+        # Each ID is used twice in the query, so this keeps the number of parameters
+        # below SQLite's default limit of 999.
+        chunk_size = 450
+        songs = {}
+        for i in range(0, len(song_ids), chunk_size):
+            songs.update(self._get_songs_details(song_ids[i : i + chunk_size]))
+        return songs
+
+    def _get_songs_details(self, song_ids: Sequence[str]) -> Dict[str, API.Song]:
+        query = models.Song.select_hydrated().where(models.Song.id.in_(song_ids))
+
+        if self.is_cache:
+            # Only return the songs that have been ingested and are still valid.
+            query = query.where(
+                models.Song.id.in_(
+                    models.CacheInfo.select(models.CacheInfo.parameter).where(
+                        models.CacheInfo.cache_key == KEYS.SONG,
+                        models.CacheInfo.valid == True,  # noqa: 712
+                        models.CacheInfo.parameter.in_(song_ids),
+                    )
+                )
+            )
+
+        return {song.id: song for song in query}
+
+    def get_artists(
+        self,
+        on_page: Optional[Callable[[Sequence[API.Artist]], None]] = None,
+        ignore_cache_miss: bool = False,
+    ) -> Sequence[API.Artist]:
+        # The cached artists are all read at once, so there are no pages to publish.
         return self._get_list(
             models.Artist,
             CachingAdapter.CachedDataKey.ARTISTS,
@@ -330,9 +700,10 @@ class FilesystemAdapter(CachingAdapter):
     def get_albums(
         self,
         query: AlbumSearchQuery,
-        sort_direction: str = "ascending"
-        # TODO (#208) deal with sort dir here?
+        sort_direction: str = "ascending",  # TODO (#208) deal with sort dir here?
+        on_page: Optional[Callable[[Sequence[API.Album]], None]] = None,
     ) -> Sequence[API.Album]:
+        # The cached albums are all read at once, so there are no pages to publish.
         strhash = query.strhash()
         query_result = models.AlbumQueryResult.get_or_none(
             models.AlbumQueryResult.query_hash == strhash
@@ -416,21 +787,41 @@ class FilesystemAdapter(CachingAdapter):
         return self._get_list(models.Genre, CachingAdapter.CachedDataKey.GENRES)
 
     def search(self, query: str) -> API.SearchResult:
+        # Only the best candidates from the search index are ranked by their similarity
+        # to the query. The artists are selected with the albums and songs since their
+        # names are ranked too.
+        def candidates(query_: Any, kind: str, *where_clauses: Any) -> Sequence:
+            if not (ids := search_candidates(query, kind)):
+                return []
+            return query_.where(query_.model.id.in_(ids), *where_clauses)
+
         search_result = API.SearchResult(query)
-        search_result.add_results("albums", self.get_all_albums())
-        search_result.add_results("artists", self.get_artists(ignore_cache_miss=True))
+        search_result.add_results(
+            "albums",
+            candidates(
+                models.Album.select(models.Album, models.Artist).join(models.Artist),
+                "album",
+                ~(models.Album.id.startswith("invalid:")),
+            ),
+        )
+        search_result.add_results(
+            "artists",
+            candidates(
+                models.Artist.select(),
+                "artist",
+                ~(models.Artist.id.startswith("invalid:")),
+            ),
+        )
         search_result.add_results(
             "songs",
-            self._get_list(
-                models.Song,
-                CachingAdapter.CachedDataKey.SONG,
-                ignore_cache_miss=True,
-                where_clauses=(models.Song.artist.is_null(False),),
+            candidates(
+                models.Song.select_hydrated(),
+                "song",
+                models.Song.artist.is_null(False),
             ),
         )
         search_result.add_results(
-            "playlists",
-            self.get_playlists(ignore_cache_miss=True),
+            "playlists", candidates(models.Playlist.select(), "playlist")
         )
         return search_result
 
@@ -439,6 +830,13 @@ class FilesystemAdapter(CachingAdapter):
     def _strhash(self, string: str) -> str:
         return hashlib.sha1(bytes(string, "utf8")).hexdigest()
 
+    @contextmanager
+    def batch_writes(self) -> Iterator[None]:
+        # Each write in the batch is a savepoint inside of this transaction, so a write
+        # that fails doesn't affect the others.
+        with self.db_write_lock, models.database.atomic():
+            yield
+
     def ingest_new_data(
         self,
         data_key: CachingAdapter.CachedDataKey,
@@ -452,6 +850,43 @@ class FilesystemAdapter(CachingAdapter):
         with self.db_write_lock, models.database.atomic():
             self._do_ingest_new_data(data_key, param, data)
 
+    def ingest_paged_data(
+        self,
+        data_key: CachingAdapter.CachedDataKey,
+        param: Optional[str],
+        data: Any,
+        page_ids: Sequence[str],
+    ):
+        assert self.is_cache, "FilesystemAdapter is not in cache mode!"
+
+        # The pages have already been ingested by ingest_new_data_page, so only their
+        # IDs are needed.
+        with self.db_write_lock, models.database.atomic():
+            self._do_ingest_new_data(data_key, param, data, page_ids=page_ids)
+
+    def ingest_new_data_page(
+        self,
+        data_key: CachingAdapter.CachedDataKey,
+        param: Optional[str],
+        page: Sequence[Any],
+    ):
+        assert self.is_cache, "FilesystemAdapter is not in cache mode!"
+
+        # The objects in the page are ingested just like the objects in the rest of the
+        # data will be (see _do_ingest_new_data), but the cache info for the data
+        # itself isn't touched until all of it has been ingested.
+        ingester = BulkIngester(self._strhash)
+        for obj in page:
+            if data_key == KEYS.ARTISTS:
+                ingester.add_artist(obj, partial=True)
+            elif data_key == KEYS.PLAYLIST_DETAILS:
+                ingester.add_song(obj)
+            else:
+                raise ValueError(f"{data_key} can't be ingested in pages.")
+
+        with self.db_write_lock, models.database.atomic():
+            self._cache_keys.update(ingester.flush())
+
     def invalidate_data(self, key: CachingAdapter.CachedDataKey, param: Optional[str]):
         assert self.is_cache, "FilesystemAdapter is not in cache mode!"
 
@@ -474,12 +909,14 @@ class FilesystemAdapter(CachingAdapter):
         param: Optional[str],
         data: Any,
         partial: bool = False,
+        page_ids: Sequence[str] = (),
     ) -> Any:
-        # TODO (#201): this entire function is not exactly efficient due to the nested
-        # dependencies and everything. I'm not sure how to improve it, and I'm not sure
-        # if it needs improving at this point.
+        # Lists of objects (and playlists, which can have thousands of songs) are
+        # ingested with a BulkIngester, which writes each table with a few statements
+        # instead of ingesting each nested object one at a time.
+        # The data is only formatted if debug logging is enabled since it can be huge.
         logging.debug(
-            f"_do_ingest_new_data param={param} data_key={data_key} data={data}"
+            "_do_ingest_new_data param=%s data_key=%s data=%s", param, data_key, data
         )
 
         def getattrs(obj: Any, keys: Iterable[str]) -> Dict[str, Any]:
@@ -490,14 +927,6 @@ class FilesystemAdapter(CachingAdapter):
                 if v is not None:
                     setattr(obj, k, v)
 
-        def compute_file_hash(filename: str) -> str:
-            file_hash = hashlib.sha1()
-            with open(filename, "rb") as f:
-                while chunk := f.read(8192):
-                    file_hash.update(chunk)
-
-            return file_hash.hexdigest()
-
         return_val = None
 
         # Set the cache info.
@@ -521,9 +950,12 @@ class FilesystemAdapter(CachingAdapter):
                 "valid": not partial,
             },
         )
+        self._cache_keys.add(cache_info.cache_key)
         if not cache_info_created:
             cache_info.valid = cache_info.valid or not partial
-            cache_info.last_ingestion_time = now
+            # Partial data doesn't make the existing data any fresher.
+            if not partial:
+                cache_info.last_ingestion_time = now
             cache_info.save()
 
         if data_key == KEYS.ALBUM:
@@ -581,10 +1013,12 @@ class FilesystemAdapter(CachingAdapter):
             return_val = db_album
 
         elif data_key == KEYS.ALBUMS:
-            albums = [
-                self._do_ingest_new_data(KEYS.ALBUM, a.id, a, partial=True)
-                for a in data
-            ]
+            ingester = BulkIngester(self._strhash)
+            albums = []
+            for a in data:
+                albums.append(ingester.add_album(a, partial=True))
+                ingester.flush_if_full()
+            self._cache_keys.update(ingester.flush())
             album_query_result, created = models.AlbumQueryResult.get_or_create(
                 query_hash=param, defaults={"query_hash": param, "albums": albums}
             )
@@ -652,22 +1086,38 @@ class FilesystemAdapter(CachingAdapter):
             return_val = db_artist
 
         elif data_key == KEYS.ARTISTS:
+            ingester = BulkIngester(self._strhash)
             for a in data:
-                self._do_ingest_new_data(KEYS.ARTIST, a.id, a, partial=True)
-            models.Artist.delete().where(
-                models.Artist.id.not_in([a.id for a in data])
-                & ~models.Artist.id.startswith("invalid")
-            ).execute()
+                ingester.add_artist(a, partial=True)
+                ingester.flush_if_full()
+            self._cache_keys.update(ingester.flush())
+
+            # Delete the artists that no longer exist. The IDs are compared here rather
+            # than in a NOT IN clause because there can be more artists than SQLite
+            # allows parameters in a single statement.
+            artist_ids = {a.id for a in data}.union(page_ids)
+            stale_artist_ids = [
+                artist_id
+                for (artist_id,) in models.database.execute(
+                    models.Artist.select(models.Artist.id).where(
+                        ~models.Artist.id.startswith("invalid")
+                    )
+                )
+                if artist_id not in artist_ids
+            ]
+            for chunk in chunked(stale_artist_ids, MAX_VARIABLES):
+                models.Artist.delete().where(models.Artist.id.in_(chunk)).execute()
 
         elif data_key == KEYS.COVER_ART_FILE:
             cache_info.file_id = param
 
             if data is not None:
-                file_hash = compute_file_hash(data)
+                file_hash = self._compute_file_hash(Path(data))
                 cache_info.file_hash = file_hash
 
-                # Copy the actual cover art file
-                shutil.copy(str(data), str(self.cover_art_dir.joinpath(file_hash)))
+                # Store the actual cover art file
+                filename = self._add_blob(Path(data), file_hash)
+                self._track_cached_file(cache_info, filename)
 
         elif data_key == KEYS.DIRECTORY:
             api_directory = cast(API.Directory, data)
@@ -726,70 +1176,37 @@ class FilesystemAdapter(CachingAdapter):
             ).execute()
 
         elif data_key == KEYS.PLAYLIST_DETAILS:
-            api_playlist = cast(API.Playlist, data)
-            playlist_data: Dict[str, Any] = {
-                **getattrs(
-                    api_playlist,
-                    [
-                        "id",
-                        "name",
-                        "song_count",
-                        "duration",
-                        "created",
-                        "changed",
-                        "comment",
-                        "owner",
-                        "public",
-                    ],
-                ),
-                "_cover_art": (
-                    self._do_ingest_new_data(
-                        KEYS.COVER_ART_FILE, api_playlist.cover_art, None
-                    )
-                    if api_playlist.cover_art
-                    else None
-                ),
-            }
-
-            if not partial:
-                # If it's partial, then don't ingest the songs.
-                playlist_data["_songs"] = [
-                    self._do_ingest_new_data(KEYS.SONG, s.id, s)
-                    for s in api_playlist.songs
-                ]
-
-            playlist, playlist_created = models.Playlist.get_or_create(
-                id=playlist_data["id"], defaults=playlist_data
+            ingester = BulkIngester(self._strhash)
+            ingester.add_playlist(
+                cast(API.Playlist, data), partial=partial, page_song_ids=page_ids
             )
-
-            # Update the values if the playlist already existed.
-            if not playlist_created:
-                setattrs(playlist, playlist_data)
-                playlist.save()
-
-            return_val = playlist
+            self._cache_keys.update(ingester.flush())
 
         elif data_key == KEYS.PLAYLISTS:
             self._playlists = None
+            ingester = BulkIngester(self._strhash)
             for p in data:
-                self._do_ingest_new_data(KEYS.PLAYLIST_DETAILS, p.id, p, partial=True)
+                ingester.add_playlist(p, partial=True)
+            self._cache_keys.update(ingester.flush())
             models.Playlist.delete().where(
                 models.Playlist.id.not_in([p.id for p in data])
             ).execute()
 
         elif data_key == KEYS.SEARCH_RESULTS:
             data = cast(API.SearchResult, data)
+            ingester = BulkIngester(self._strhash)
             for a in data._artists.values():
-                self._do_ingest_new_data(KEYS.ARTIST, a.id, a, partial=True)
+                ingester.add_artist(a, partial=True)
 
             for a in data._albums.values():
-                self._do_ingest_new_data(KEYS.ALBUM, a.id, a, partial=True)
+                ingester.add_album(a, partial=True)
 
             for s in data._songs.values():
-                self._do_ingest_new_data(KEYS.SONG, s.id, s, partial=True)
+                ingester.add_song(s, partial=True)
 
             for p in data._playlists.values():
-                self._do_ingest_new_data(KEYS.PLAYLIST_DETAILS, p.id, p, partial=True)
+                ingester.add_playlist(p, partial=True)
+            self._cache_keys.update(ingester.flush())
 
         elif data_key == KEYS.SONG:
             api_song = cast(API.Song, data)
@@ -857,13 +1274,15 @@ class FilesystemAdapter(CachingAdapter):
                 cache_info.size = size
 
             if buffer_filename:
-                cache_info.file_hash = compute_file_hash(buffer_filename)
+                file_hash = self._compute_file_hash(Path(buffer_filename))
+                cache_info.file_hash = file_hash
 
-                # Copy the actual song file from the download buffer dir to the cache
-                # dir.
+                # Store the actual song file from the download buffer dir in the blob
+                # store, and put it at its path from the server.
+                self._add_blob(Path(buffer_filename), file_hash)
                 filename = self._compute_song_filename(cache_info)
-                filename.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy(str(buffer_filename), str(filename))
+                self.blob_store.materialize(file_hash, filename)
+                self._track_cached_file(cache_info, filename)
 
         cache_info.save()
         return return_val if return_val is not None else cache_info
@@ -911,11 +1330,15 @@ class FilesystemAdapter(CachingAdapter):
             models.CacheInfo.parameter == param,
         )
 
+        # Once the cached files aren't referenced any more, their blobs are deleted by
+        # the garbage collector. It can't run until this transaction is done since it
+        # needs the database write lock.
+        if data_key in (KEYS.COVER_ART_FILE, KEYS.SONG_FILE):
+            self._maintenance_requested.set()
+
         if data_key == KEYS.COVER_ART_FILE:
             if cache_info:
-                self.cover_art_dir.joinpath(str(cache_info.file_hash)).unlink(
-                    missing_ok=True
-                )
+                cache_info.last_access_time = cache_info.disk_size = None
 
         elif data_key == KEYS.PLAYLIST_DETAILS:
             # Delete the playlist and corresponding cover art.
@@ -927,18 +1350,27 @@ class FilesystemAdapter(CachingAdapter):
 
         elif data_key == KEYS.SONG_FILE:
             if cache_info:
-                self._compute_song_filename(cache_info).unlink(missing_ok=True)
+                filename = self._compute_song_filename(cache_info)
+                if self.blob_store.directory not in filename.parents:
+                    filename.unlink(missing_ok=True)
+                cache_info.last_access_time = cache_info.disk_size = None
 
         elif data_key == KEYS.ALL_SONGS:
             shutil.rmtree(str(self.music_dir))
-            shutil.rmtree(str(self.cover_art_dir))
             self.music_dir.mkdir(parents=True, exist_ok=True)
-            self.cover_art_dir.mkdir(parents=True, exist_ok=True)
+            self.blob_store.clear()
+
+            # Release the staging hardlinks as well, otherwise the disk space won't be
+            # freed until the next startup. In-progress downloads are left alone.
+            for staged_file in self.staging_dir.iterdir():
+                if staged_file.suffix != ".part":
+                    staged_file.unlink(missing_ok=True)
 
-            models.CacheInfo.update({"valid": False}).where(
+            deleted_file = {"valid": False, "last_access_time": None, "disk_size": None}
+            models.CacheInfo.update(deleted_file).where(
                 models.CacheInfo.cache_key == KEYS.SONG_FILE
             ).execute()
-            models.CacheInfo.update({"valid": False}).where(
+            models.CacheInfo.update(deleted_file).where(
                 models.CacheInfo.cache_key == KEYS.COVER_ART_FILE
             ).execute()
 
@@ -946,6 +1378,7 @@ class FilesystemAdapter(CachingAdapter):
             self._do_delete_data(KEYS.ALL_SONGS, None)
             for table in models.ALL_TABLES:
                 table.truncate_table()
+            self._cache_keys.clear()
 
         if cache_info:
             cache_info.valid = False
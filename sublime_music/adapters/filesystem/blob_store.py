@@ -0,0 +1,178 @@
+"""
+A content-addressed store of the files (songs and cover art) in the cache.
+
+Each file is stored once, named by the SHA-1 hash of its contents, in a directory
+sharded by the first two characters of the hash. Song files are materialized at the
+paths that the server gives them as hardlinks to their blobs, so duplicate files only
+use the disk space of one.
+
+The :class:`models.Blob` table counts the cache infos that reference each blob (the
+ones that have the blob's hash as their ``file_hash`` and are in the cache). The counts
+are kept up to date by triggers, and the blobs that are no longer referenced are
+deleted by :class:`BlobStore.collect_garbage`.
+"""
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import List
+
+from peewee import chunked
+
+from . import models
+from .ingestion import MAX_VARIABLES
+
+_REFERENCED = "{row}.file_hash IS NOT NULL AND {row}.disk_size IS NOT NULL"
+
+
+def _add_reference_sql(where: str) -> str:
+    # Triggers can't use INSERT OR IGNORE since the conflict resolution of the statement
+    # that fired the trigger is used instead.
+    return (
+        "INSERT INTO blob (hash, ref_count) SELECT new.file_hash, 0 WHERE "
+        f"{where} AND NOT EXISTS (SELECT 1 FROM blob WHERE hash = new.file_hash); "
+        "UPDATE blob SET ref_count = ref_count + 1 "
+        f"WHERE hash = new.file_hash AND {where}"
+    )
+
+
+def _remove_reference_sql(where: str) -> str:
+    return (
+        "UPDATE blob SET ref_count = ref_count - 1 "
+        f"WHERE hash = old.file_hash AND {where}"
+    )
+
+
+def _trigger_sql() -> List[str]:
+    new, old = _REFERENCED.format(row="new"), _REFERENCED.format(row="old")
+    changed = (
+        "old.file_hash IS NOT new.file_hash OR "
+        "(old.disk_size IS NULL) IS NOT (new.disk_size IS NULL)"
+    )
+    trigger = "CREATE TRIGGER IF NOT EXISTS cacheinfo_blob"
+    return [
+        f"{trigger}_insert AFTER INSERT ON cacheinfo BEGIN "
+        f"{_add_reference_sql(new)}; END",
+        f"{trigger}_update AFTER UPDATE OF file_hash, disk_size ON cacheinfo "
+        f"WHEN {changed} BEGIN "
+        f"{_remove_reference_sql(old)}; {_add_reference_sql(new)}; END",
+        f"{trigger}_delete AFTER DELETE ON cacheinfo BEGIN "
+        f"{_remove_reference_sql(old)}; END",
+    ]
+
+
+def create_blob_table():
+    """
+    Create the blob table and the triggers that keep its reference counts up to date.
+    If the table doesn't exist yet, the reference counts are computed from the
+    existing data.
+
+    This must be used inside of a transaction while holding the database write lock.
+    """
+    rebuild = not models.Blob.table_exists()
+    models.Blob.create_table()
+    for sql in _trigger_sql():
+        models.database.execute_sql(sql)
+
+    if rebuild:
+        models.database.execute_sql(
+            "INSERT INTO blob (hash, ref_count) SELECT file_hash, COUNT(*) "
+            f"FROM cacheinfo AS c WHERE {_REFERENCED.format(row='c')} "
+            "GROUP BY file_hash"
+        )
+
+
+class BlobStore:
+    """
+    The files of a content-addressed blob store. All of the methods that change the
+    store must be used while holding the database write lock, so that blobs aren't
+    collected while they are being added.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, file_hash: str) -> Path:
+        return self.directory.joinpath(file_hash[:2], file_hash)
+
+    def add(self, source: Path, file_hash: str, link: bool = False) -> Path:
+        """
+        Add the file at ``source`` (whose contents have the given hash) to the store if
+        it isn't already there. The source file is left alone.
+
+        :param link: whether to hardlink the source file into the store instead of
+            copying it. The source file must never be modified in place since that
+            would change the blob as well.
+        :returns: the path of the blob.
+        """
+        blob = self.path(file_hash)
+        if not blob.exists():
+            self._link(source, blob, copy=not link)
+        return blob
+
+    def materialize(self, file_hash: str, destination: Path):
+        """
+        Put the blob with the given hash at ``destination``, replacing anything that is
+        already there.
+        """
+        blob = self.path(file_hash)
+        if destination != blob:
+            self._link(blob, destination)
+
+    def clear(self):
+        shutil.rmtree(self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def collect_garbage(self, include_orphans: bool = False) -> int:
+        """
+        Delete the blobs that are no longer referenced by any cache info.
+
+        :param include_orphans: whether to look through all of the files in the store
+            for the ones that aren't in the database at all (for example, because the
+            transaction that added them was rolled back).
+        :returns: the number of blobs that were deleted.
+        """
+        Blob = models.Blob
+        unreferenced = list(Blob.select(Blob.hash).where(Blob.ref_count <= 0).scalars())
+        for file_hash in unreferenced:
+            self.path(file_hash).unlink(missing_ok=True)
+        for chunk in chunked(unreferenced, MAX_VARIABLES):
+            Blob.delete().where(Blob.hash.in_(chunk)).execute()
+
+        deleted = len(unreferenced)
+        if include_orphans:
+            referenced = set(Blob.select(Blob.hash).scalars())
+            for shard in self.directory.iterdir():
+                for blob in shard.iterdir():
+                    if blob.name not in referenced:
+                        blob.unlink(missing_ok=True)
+                        deleted += 1
+
+        if deleted:
+            logging.info(f"Deleted {deleted} unreferenced blobs")
+        return deleted
+
+    @staticmethod
+    def _link(source: Path, destination: Path, copy: bool = False):
+        """
+        Hardlink (or copy) ``source`` to ``destination``. If the filesystem doesn't
+        support hardlinks, the file is copied instead.
+        """
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        tmp_destination = destination.with_name(f".{destination.name}.tmp")
+        tmp_destination.unlink(missing_ok=True)
+        try:
+            if copy:
+                shutil.copy(str(source), str(tmp_destination))
+            else:
+                try:
+                    os.link(source, tmp_destination)
+                except OSError:
+                    logging.warning(
+                        f"Unable to hardlink {source}. Falling back to copy."
+                    )
+                    shutil.copy(str(source), str(tmp_destination))
+            os.replace(tmp_destination, destination)
+        finally:
+            tmp_destination.unlink(missing_ok=True)
@@ -0,0 +1,393 @@
+"""
+Set-based ingestion of API objects into the cache database.
+"""
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+from peewee import Case, chunked, EXCLUDED, Field, fn, Insert
+
+from sublime_music.adapters import api_objects as API
+from sublime_music.adapters.adapter_base import CachingAdapter
+
+from . import models
+
+KEYS = CachingAdapter.CachedDataKey
+
+# SQLite's default limit on the number of parameters in a single statement.
+MAX_VARIABLES = 999
+
+# The number of objects that a BulkIngester collects before flush_if_full writes them.
+BATCH_SIZE = 5000
+
+_CacheInfoKey = Tuple[CachingAdapter.CachedDataKey, Optional[str]]
+
+
+class BulkIngester:
+    """
+    Flattens API objects (and all of the objects nested inside of them) into rows for
+    each table, and then writes each table with a few ``INSERT ... ON CONFLICT``
+    statements. The result is the same as ingesting each object individually with
+    :class:`FilesystemAdapter._do_ingest_new_data`:
+
+    * existing rows are only updated with the values that are not ``None``,
+    * partial data never makes a :class:`models.CacheInfo` row valid, nor does it
+      update the ingestion time of an existing row.
+
+    Like :class:`FilesystemAdapter._do_ingest_new_data`, this must be used inside of a
+    transaction while holding the database write lock.
+
+    To ingest a huge list of objects without holding all of their rows in memory, call
+    :class:`flush_if_full` after adding each object. Since existing rows are only
+    updated with the values that are not ``None``, writing the rows in several batches
+    has the same result as writing them all at once.
+    """
+
+    def __init__(self, strhash: Callable[[str], str]):
+        self._strhash = strhash
+        self._now = datetime.now()
+        self._flushed_cache_keys: Set[CachingAdapter.CachedDataKey] = set()
+        self._reset()
+
+    def _reset(self):
+        self._cache_infos: Dict[_CacheInfoKey, Dict[str, Any]] = {}
+        self._genres: Dict[str, Dict[str, Any]] = {}
+        self._artists: Dict[str, Dict[str, Any]] = {}
+        self._albums: Dict[str, Dict[str, Any]] = {}
+        self._songs: Dict[str, Dict[str, Any]] = {}
+        self._playlists: Dict[str, Dict[str, Any]] = {}
+        self._similar_artists: Dict[str, List[str]] = {}
+        self._playlist_songs: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def _merge(rows: Dict[str, Dict[str, Any]], row: Dict[str, Any], key: str):
+        if (existing := rows.get(key)) is None:
+            rows[key] = row
+        else:
+            existing.update({k: v for k, v in row.items() if v is not None})
+
+    def _add_cache_info(
+        self,
+        cache_key: CachingAdapter.CachedDataKey,
+        param: Optional[str],
+        partial: bool = False,
+        **fields: Any,
+    ) -> _CacheInfoKey:
+        key = (cache_key, param)
+        if (cache_info := self._cache_infos.get(key)) is None:
+            cache_info = self._cache_infos[key] = {
+                "cache_key": cache_key,
+                "parameter": param,
+                "valid": False,
+                "last_ingestion_time": self._now,
+                "file_id": None,
+                "path": None,
+                "size": None,
+            }
+        cache_info["valid"] = cache_info["valid"] or not partial
+        cache_info.update({k: v for k, v in fields.items() if v})
+        return key
+
+    def _add_cover_art(self, cover_art: Optional[str]) -> Optional[_CacheInfoKey]:
+        if not cover_art:
+            return None
+        return self._add_cache_info(KEYS.COVER_ART_FILE, cover_art, file_id=cover_art)
+
+    # Collecting Rows
+    # ==================================================================================
+    def add_genre(self, genre: API.Genre) -> str:
+        self._add_cache_info(KEYS.GENRE, None)
+        row = {
+            "name": genre.name,
+            "song_count": genre.song_count,
+            "album_count": genre.album_count,
+        }
+        self._merge(self._genres, row, genre.name)
+        return genre.name
+
+    def add_artist(self, artist: API.Artist, partial: bool = False) -> str:
+        self._add_cache_info(KEYS.ARTIST, artist.id, partial)
+        artist_id = artist.id or f"invalid:{self._strhash(artist.name)}"
+        if artist.similar_artists:
+            self._similar_artists[artist_id] = [
+                a.id for a in artist.similar_artists if a.id
+            ]
+
+        for album in artist.albums or []:
+            self.add_album(album, partial=True)
+
+        row = {
+            "id": artist_id,
+            "name": artist.name,
+            "album_count": artist.album_count,
+            "starred": artist.starred,
+            "biography": artist.biography,
+            "music_brainz_id": artist.music_brainz_id,
+            "last_fm_url": artist.last_fm_url,
+            "_artist_image_url": self._add_cover_art(artist.artist_image_url),
+        }
+        self._merge(self._artists, row, artist_id)
+        return artist_id
+
+    def add_album(self, album: API.Album, partial: bool = False) -> str:
+        self._add_cache_info(KEYS.ALBUM, album.id, partial)
+        album_id = album.id or f"invalid:{self._strhash(album.name)}"
+        row: Dict[str, Any] = {
+            "id": album_id,
+            "name": album.name,
+            "created": album.created,
+            "duration": album.duration,
+            "play_count": album.play_count,
+            "song_count": album.song_count,
+            "starred": album.starred,
+            "year": album.year,
+            "genre": self.add_genre(g) if (g := album.genre) else None,
+            "artist": (
+                self.add_artist(ar, partial=True) if (ar := album.artist) else None
+            ),
+        }
+        if not partial:
+            for song in album.songs or []:
+                self.add_song(song)
+        row["_cover_art"] = self._add_cover_art(album.cover_art)
+
+        self._merge(self._albums, row, album_id)
+        return album_id
+
+    def add_song(self, song: API.Song, partial: bool = False) -> str:
+        self._add_cache_info(KEYS.SONG, song.id, partial)
+        row = {
+            "id": song.id,
+            "title": song.title,
+            "track": song.track,
+            "year": song.year,
+            "duration": song.duration,
+            "parent_id": song.parent_id,
+            "genre": self.add_genre(g) if (g := song.genre) else None,
+            "artist": (
+                self.add_artist(ar, partial=True) if (ar := song.artist) else None
+            ),
+            "album": self.add_album(al, partial=True) if (al := song.album) else None,
+            "_cover_art": self._add_cover_art(song.cover_art),
+            "file": (
+                self._add_cache_info(
+                    KEYS.SONG_FILE,
+                    song.id,
+                    file_id=song.id,
+                    path=song.path,
+                    size=song.size,
+                )
+                if song.path
+                else None
+            ),
+        }
+        self._merge(self._songs, row, song.id)
+        return song.id
+
+    def add_playlist(
+        self,
+        playlist: API.Playlist,
+        partial: bool = False,
+        page_song_ids: Sequence[str] = (),
+    ) -> str:
+        """
+        Add the playlist, and its songs unless it is ``partial``.
+
+        :param page_song_ids: the IDs of the songs at the start of the playlist that
+            were already ingested in pages, and aren't in ``playlist.songs``.
+        """
+        if not partial:
+            # If it's partial, then don't ingest the songs. The songs are added first
+            # since they may be flushed, and the playlist's rows have to be in the same
+            # flush as its cover art's cache info.
+            song_ids = list(page_song_ids)
+            for song in playlist.songs:
+                song_ids.append(self.add_song(song))
+                self.flush_if_full()
+            self._playlist_songs[playlist.id] = song_ids
+
+        self._add_cache_info(KEYS.PLAYLIST_DETAILS, playlist.id, partial)
+        row = {
+            "id": playlist.id,
+            "name": playlist.name,
+            "song_count": playlist.song_count,
+            "duration": playlist.duration,
+            "created": playlist.created,
+            "changed": playlist.changed,
+            "comment": playlist.comment,
+            "owner": playlist.owner,
+            "public": playlist.public,
+            "_cover_art": self._add_cover_art(playlist.cover_art),
+        }
+        self._merge(self._playlists, row, playlist.id)
+        return playlist.id
+
+    # Writing Rows
+    # ==================================================================================
+    def flush_if_full(self):
+        """Write the collected rows once there are :class:`BATCH_SIZE` objects."""
+        if len(self._cache_infos) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> Set[CachingAdapter.CachedDataKey]:
+        """
+        Write all of the collected rows to the database.
+
+        :returns: the cache keys of all of the cache infos that have been written by
+            this ingester.
+        """
+        cache_info_ids = self._write_cache_infos()
+        for rows in (self._artists, self._albums, self._songs, self._playlists):
+            for row in rows.values():
+                for field_name in ("_artist_image_url", "_cover_art", "file"):
+                    if (key := row.get(field_name)) is not None:
+                        row[field_name] = cache_info_ids.get(key)
+
+        # Write the tables in dependency order.
+        _upsert(models.Genre, self._genres.values())
+        _upsert(models.Artist, self._artists.values())
+        _upsert(models.Album, self._albums.values())
+        _upsert(models.Song, self._songs.values())
+        _upsert(models.Playlist, self._playlists.values())
+
+        for artist_id, similar_artist_ids in self._similar_artists.items():
+            models.SimilarArtist.delete().where(
+                models.SimilarArtist.artist == artist_id,
+                models.SimilarArtist.similar_artist.not_in(similar_artist_ids),
+            ).execute()
+            _insert(
+                models.SimilarArtist,
+                [
+                    {"artist": artist_id, "similar_artist": a, "order": i}
+                    for i, a in enumerate(similar_artist_ids)
+                ],
+            )
+
+        if self._playlist_songs:
+            playlist_songs = models.Playlist._songs.get_through_model()
+            for playlist_ids in chunked(self._playlist_songs, MAX_VARIABLES):
+                playlist_songs.delete().where(
+                    playlist_songs.playlist.in_(playlist_ids)
+                ).execute()
+            _insert(
+                playlist_songs,
+                [
+                    {"playlist": playlist_id, "song": song_id, "position": i}
+                    for playlist_id, song_ids in self._playlist_songs.items()
+                    for i, song_id in enumerate(song_ids)
+                ],
+            )
+
+        self._flushed_cache_keys.update(cache_key for cache_key, _ in self._cache_infos)
+        self._reset()
+        return set(self._flushed_cache_keys)
+
+    def _write_cache_infos(self) -> Dict[_CacheInfoKey, int]:
+        CacheInfo = models.CacheInfo
+        cache_infos = self._cache_infos.values()
+
+        # NULL parameters never conflict with each other in the unique index, so the
+        # (rare) rows without a parameter have to be looked up individually.
+        for cache_info in (c for c in cache_infos if c["parameter"] is None):
+            existing = CacheInfo.get_or_none(
+                CacheInfo.cache_key == cache_info["cache_key"],
+                CacheInfo.parameter.is_null(),
+            )
+            if existing is None:
+                CacheInfo.create(**cache_info)
+                continue
+            existing.valid = existing.valid or cache_info["valid"]
+            if cache_info["valid"]:
+                existing.last_ingestion_time = self._now
+            for field_name in ("file_id", "path", "size"):
+                if (value := cache_info[field_name]) is not None:
+                    setattr(existing, field_name, value)
+            existing.save()
+
+        _upsert(
+            CacheInfo,
+            [c for c in cache_infos if c["parameter"] is not None],
+            conflict_target=[CacheInfo.cache_key, CacheInfo.parameter],
+            update={
+                CacheInfo.valid: CacheInfo.valid | EXCLUDED.valid,
+                CacheInfo.last_ingestion_time: Case(
+                    None,
+                    [(EXCLUDED.valid, EXCLUDED.last_ingestion_time)],
+                    CacheInfo.last_ingestion_time,
+                ),
+            },
+        )
+
+        # Only the IDs of the rows that are referenced by other rows are needed.
+        cache_info_ids: Dict[_CacheInfoKey, int] = {}
+        for cache_key in (KEYS.COVER_ART_FILE, KEYS.SONG_FILE):
+            params = [p for k, p in self._cache_infos if k == cache_key]
+            for chunk in chunked(params, MAX_VARIABLES - 1):
+                query = CacheInfo.select(CacheInfo.id, CacheInfo.parameter).where(
+                    CacheInfo.cache_key == cache_key, CacheInfo.parameter.in_(chunk)
+                )
+                cache_info_ids.update(
+                    {(cache_key, parameter): id_ for id_, parameter in query.tuples()}
+                )
+        return cache_info_ids
+
+
+def _execute_many(query: Insert, fields: List[Field], rows: List[Dict[str, Any]]):
+    """
+    Run ``query`` (an insert of the first row) for every row. The SQL is only generated
+    once, which is much faster than letting peewee generate a multi-row insert.
+    """
+    sql, params = query.sql()
+    assert len(params) == len(fields)
+    models.database.cursor().executemany(
+        sql, ([f.db_value(row[f.name]) for f in fields] for row in rows)
+    )
+
+
+def _insert(model: Type[models.BaseModel], rows: List[Dict[str, Any]]):
+    """Insert the rows, replacing any existing rows that conflict with them."""
+    if not rows:
+        return
+    fields = [model._meta.fields[name] for name in rows[0]]
+    query = model.insert_many([rows[0]], fields=fields).on_conflict_replace()
+    _execute_many(query, fields, rows)
+
+
+def _upsert(
+    model: Type[models.BaseModel],
+    rows: Iterable[Dict[str, Any]],
+    conflict_target: Optional[List[Field]] = None,
+    update: Optional[Dict[Field, Any]] = None,
+):
+    """
+    Insert the rows, or update the existing rows with all of the values that aren't
+    ``None``. Every row must have the same keys.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+
+    primary_key = model._meta.primary_key
+    fields = [model._meta.fields[name] for name in rows[0]]
+    update = {
+        **{
+            field: fn.COALESCE(getattr(EXCLUDED, field.column_name), field)
+            for field in fields
+            if field is not primary_key
+        },
+        **(update or {}),
+    }
+    query = model.insert_many([rows[0]], fields=fields).on_conflict(
+        conflict_target=conflict_target or [primary_key], update=update
+    )
+    _execute_many(query, fields, rows)
@@ -0,0 +1,56 @@
+"""
+Migrations of existing cache databases to the current schema.
+
+Each migration is keyed by the schema version that it updates the database to, and
+returns the schema operations that update a database from the previous version. New
+databases are created with the current schema, so the migrations are only run on
+databases from older versions, before any new tables are created. A migration that needs
+a new table has to create it.
+
+The names of the indexes that are created by :class:`SchemaMigrator.add_index` match
+the names of the indexes that are declared on the models.
+"""
+from typing import Callable, Iterable, List, Tuple
+
+from peewee import IntegerField
+from playhouse.migrate import Operation, SchemaMigrator
+
+from .sqlite_extensions import TzDateTimeField
+
+
+def _add_secondary_indexes(migrator: SchemaMigrator) -> Iterable[Operation]:
+    return (
+        migrator.add_index("cacheinfo", ("cache_key", "valid")),
+        migrator.add_index("directory", ("parent_id",)),
+        migrator.add_index("song", ("parent_id",)),
+        migrator.add_index("album", ("name",)),
+        migrator.add_index("album", ("created",)),
+        migrator.add_index("album", ("play_count",)),
+        migrator.add_index("album", ("year", "name")),
+        migrator.drop_index("album", "album_genre_id"),
+        migrator.add_index("album", ("genre_id", "name")),
+    )
+
+
+def _add_file_access_tracking(migrator: SchemaMigrator) -> Iterable[Operation]:
+    # The sizes and access times of the files that are already in the cache are filled
+    # in by the FilesystemAdapter, which knows where the files are, once the database
+    # has been migrated.
+    return (
+        migrator.add_column(
+            "cacheinfo", "last_access_time", TzDateTimeField(null=True)
+        ),
+        migrator.add_column("cacheinfo", "disk_size", IntegerField(null=True)),
+        migrator.add_index("cacheinfo", ("last_access_time", "disk_size")),
+    )
+
+
+MIGRATIONS: List[Tuple[str, Callable[[SchemaMigrator], Iterable[Operation]]]] = [
+    ("0.11.17", _add_secondary_indexes),
+    ("0.11.18", _add_file_access_tracking),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# The version that started tracking the sizes and access times of the cached files.
+FILE_TRACKING_VERSION = "0.11.18"
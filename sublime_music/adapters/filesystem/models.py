@@ -5,21 +5,25 @@ from peewee import (
     BooleanField,
     ForeignKeyField,
     IntegerField,
+    JOIN,
     Model,
-    prefetch,
+    ModelSelect,
     Query,
     SqliteDatabase,
     TextField,
 )
+from playhouse.sqlite_ext import FTS5Model, RowIDField, SearchField
 
 from .sqlite_extensions import (
     CacheConstantsField,
     DurationField,
+    search_grams,
     SortedManyToManyField,
     TzDateTimeField,
 )
 
 database = SqliteDatabase(None)
+database.register_function(search_grams, "search_grams", 1, deterministic=True)
 
 
 # Models
@@ -34,11 +38,15 @@ class CacheInfo(BaseModel):
     valid = BooleanField(default=False)
     cache_key = CacheConstantsField()
     parameter = TextField(null=True, default="")
-    # TODO (#2) actually use this for cache expiry.
     last_ingestion_time = TzDateTimeField(null=False)
 
     class Meta:
-        indexes = ((("cache_key", "parameter"), True),)
+        indexes = (
+            (("cache_key", "parameter"), True),
+            (("cache_key", "valid"), False),
+            # For finding the least recently used files, and their total size.
+            (("last_access_time", "disk_size"), False),
+        )
 
     # Used for cached files.
     file_id = TextField(null=True)
@@ -47,6 +55,21 @@ class CacheInfo(BaseModel):
     path = TextField(null=True)
     cache_permanently = BooleanField(null=True)
 
+    # Both of these are only set while the file is in the cache.
+    last_access_time = TzDateTimeField(null=True)
+    disk_size = IntegerField(null=True)
+
+
+class Blob(BaseModel):
+    """
+    A file in the blob store, and the number of cache infos that reference it. This is
+    kept in sync with the cache infos by triggers (see :mod:`.blob_store`) so it is not
+    in :data:`ALL_TABLES`.
+    """
+
+    hash = TextField(primary_key=True)
+    ref_count = IntegerField(default=0)
+
 
 class Genre(BaseModel):
     name = TextField(unique=True, primary_key=True)
@@ -103,10 +126,21 @@ class Album(BaseModel):
     year = IntegerField(null=True)
 
     artist = ForeignKeyField(Artist, null=True, backref="albums")
-    genre = ForeignKeyField(Genre, null=True, backref="albums")
+    # Indexed with the name instead.
+    genre = ForeignKeyField(Genre, null=True, backref="albums", index=False)
 
     _cover_art = ForeignKeyField(CacheInfo, null=True)
 
+    class Meta:
+        # The sort orders of the album lists.
+        indexes = (
+            (("name",), False),
+            (("created",), False),
+            (("play_count",), False),
+            (("year", "name"), False),
+            (("genre", "name"), False),
+        )
+
     @property
     def cover_art(self) -> Optional[str]:
         try:
@@ -116,10 +150,8 @@ class Album(BaseModel):
 
     @property
     def songs(self) -> List["Song"]:
-        albums = Album.select()
-        artists = Album.select()
         return sorted(
-            prefetch(self._songs, albums, artists),
+            Song.select_hydrated().where(Song.album == self.id),
             key=lambda s: (s.disc_number or 1, s.track),
         )
 
@@ -136,7 +168,7 @@ class IgnoredArticle(BaseModel):
 class Directory(BaseModel):
     id = TextField(unique=True, primary_key=True)
     name = TextField(null=True)
-    parent_id = TextField(null=True)
+    parent_id = TextField(null=True, index=True)
 
     _children: Optional[List[Union["Directory", "Song"]]] = None
 
@@ -145,7 +177,7 @@ class Directory(BaseModel):
         if not self._children:
             self._children = list(
                 Directory.select().where(Directory.parent_id == self.id)
-            ) + list(Song.select().where(Song.parent_id == self.id))
+            ) + list(Song.select_hydrated().where(Song.parent_id == self.id))
         return self._children
 
     @children.setter
@@ -158,7 +190,7 @@ class Song(BaseModel):
     title = TextField()
     duration = DurationField(null=True)
 
-    parent_id = TextField(null=True)
+    parent_id = TextField(null=True, index=True)
     album = ForeignKeyField(Album, null=True, backref="_songs")
     artist = ForeignKeyField(Artist, null=True)
     genre = ForeignKeyField(Genre, null=True, backref="songs")
@@ -195,6 +227,23 @@ class Song(BaseModel):
     user_rating = IntegerField(null=True)
     starred = TzDateTimeField(null=True)
 
+    @classmethod
+    def select_hydrated(cls) -> ModelSelect:
+        """
+        Select songs along with their album, artist, genre, file, and cover art so that
+        accessing any of them doesn't run another query for each song.
+        """
+        SongFile = CacheInfo.alias()
+        SongCoverArt = CacheInfo.alias()
+        return (
+            cls.select(cls, Album, Artist, Genre, SongFile, SongCoverArt)
+            .join_from(cls, Album, JOIN.LEFT_OUTER, on=cls.album)
+            .join_from(cls, Artist, JOIN.LEFT_OUTER, on=cls.artist)
+            .join_from(cls, Genre, JOIN.LEFT_OUTER, on=cls.genre)
+            .join_from(cls, SongFile, JOIN.LEFT_OUTER, on=cls.file)
+            .join_from(cls, SongCoverArt, JOIN.LEFT_OUTER, on=cls._cover_art)
+        )
+
 
 class Playlist(BaseModel):
     id = TextField(unique=True, primary_key=True)
@@ -211,9 +260,13 @@ class Playlist(BaseModel):
 
     @property
     def songs(self) -> List[Song]:
-        albums = Album.select()
-        artists = Album.select()
-        return prefetch(self._songs, albums, artists)
+        PlaylistSong = Playlist._songs.get_through_model()
+        return list(
+            Song.select_hydrated()
+            .join_from(Song, PlaylistSong, on=(PlaylistSong.song == Song.id))
+            .where(PlaylistSong.playlist == self.id)
+            .order_by(PlaylistSong.position)
+        )
 
     _cover_art = ForeignKeyField(CacheInfo, null=True)
 
@@ -226,6 +279,8 @@ class Playlist(BaseModel):
 
 
 class Version(BaseModel):
+    """The version of the database schema."""
+
     id = IntegerField(unique=True, primary_key=True)
     major = IntegerField()
     minor = IntegerField()
@@ -233,20 +288,37 @@ class Version(BaseModel):
 
     @staticmethod
     def is_less_than(semver: str) -> bool:
-        major, minor, patch = map(int, semver.split("."))
-        version, created = Version.get_or_create(
-            id=0, defaults={"major": major, "minor": minor, "patch": patch}
-        )
-        if created:
+        version = Version.get_or_none(Version.id == 0)
+        if version is None:
             # There was no version before, definitely out-of-date
             return True
 
-        return version.major < major or version.minor < minor or version.patch < patch
+        return (version.major, version.minor, version.patch) < tuple(
+            map(int, semver.split("."))
+        )
 
     @staticmethod
     def update_version(semver: str):
         major, minor, patch = map(int, semver.split("."))
-        Version.update(major=major, minor=minor, patch=patch)
+        Version.replace(id=0, major=major, minor=minor, patch=patch).execute()
+
+
+class SearchIndex(FTS5Model):
+    """
+    The grams of the names of the artists, albums, songs, and playlists. This is kept
+    in sync with those tables by triggers (see :mod:`.search_index`) so it is not in
+    :data:`ALL_TABLES`.
+    """
+
+    # The rowid of the indexed row times the number of kinds, plus the kind's index.
+    rowid = RowIDField()
+    kind = SearchField()
+    grams = SearchField()
+    item_id = SearchField(unindexed=True)
+
+    class Meta:
+        database = database
+        options = {"tokenize": "unicode61"}
 
 
 ALL_TABLES = (
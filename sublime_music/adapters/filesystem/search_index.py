@@ -0,0 +1,125 @@
+"""
+A full-text index of everything that can be searched for in the cache database.
+
+Each artist, album, song, and playlist is indexed by the two-character grams of its
+name (and the name of its artist). Searching the index only finds the rows that share
+grams with the query. This is a good, cheap approximation of the fuzzy similarity that
+the search results are ranked by, including for misspelled queries.
+"""
+from typing import Dict, List, Tuple
+
+from . import models
+from .sqlite_extensions import search_words, word_grams
+
+# The maximum number of candidates of each kind to get from the index. Only these
+# candidates are ranked by their similarity to the query.
+SEARCH_CANDIDATE_LIMIT = 100
+
+# kind: (index, table, columns that are indexed, the indexed text of the ``{row}``)
+_KINDS: Dict[str, Tuple[int, str, Tuple[str, ...], str]] = {
+    "artist": (0, "artist", ("name",), "{row}.name"),
+    "album": (
+        1,
+        "album",
+        ("name", "artist_id"),
+        "COALESCE({row}.name, '') || ' ' || "
+        "COALESCE((SELECT name FROM artist WHERE id = {row}.artist_id), '')",
+    ),
+    "song": (
+        2,
+        "song",
+        ("title", "artist_id"),
+        "COALESCE({row}.title, '') || ' ' || "
+        "COALESCE((SELECT name FROM artist WHERE id = {row}.artist_id), '')",
+    ),
+    "playlist": (3, "playlist", ("name",), "{row}.name"),
+}
+
+
+def _index_rows_sql(kind: str, row: str, where: str = "") -> str:
+    index, table, _, text = _KINDS[kind]
+    rowid = f"{row}.rowid * {len(_KINDS)} + {index}"
+    return (
+        "INSERT INTO searchindex (rowid, kind, grams, item_id) "
+        f"SELECT {rowid}, '{kind}', search_grams({text.format(row=row)}), {row}.id "
+        f"FROM {table} AS {row} {where}"
+    )
+
+
+def _reindex_rows_sql(kind: str, where: str) -> str:
+    # Triggers can't use INSERT OR REPLACE since the conflict resolution of the
+    # statement that fired the trigger is used instead.
+    index, table, _, _ = _KINDS[kind]
+    return (
+        "DELETE FROM searchindex WHERE rowid IN "
+        f"(SELECT t.rowid * {len(_KINDS)} + {index} FROM {table} AS t {where}); "
+        + _index_rows_sql(kind, "t", where)
+    )
+
+
+def _trigger_sql() -> List[str]:
+    statements = []
+    for kind, (index, table, columns, _) in _KINDS.items():
+        index_new = _index_rows_sql(kind, "t", "WHERE t.rowid = new.rowid")
+        reindex_new = _reindex_rows_sql(kind, "WHERE t.rowid = new.rowid")
+        changed = " OR ".join(f"old.{c} IS NOT new.{c}" for c in columns)
+        if kind == "artist":
+            # The names of the artist's albums and songs are indexed with it.
+            reindex_new += "; " + "; ".join(
+                _reindex_rows_sql(k, "WHERE t.artist_id = new.id")
+                for k in ("album", "song")
+            )
+
+        trigger = f"CREATE TRIGGER IF NOT EXISTS {table}_search"
+        statements += [
+            f"{trigger}_insert AFTER INSERT ON {table} BEGIN {index_new}; END",
+            f"{trigger}_update AFTER UPDATE OF {', '.join(columns)} ON {table}"
+            f" WHEN {changed} BEGIN {reindex_new}; END",
+            f"{trigger}_delete AFTER DELETE ON {table} BEGIN DELETE FROM searchindex"
+            f" WHERE rowid = old.rowid * {len(_KINDS)} + {index}; END",
+        ]
+    return statements
+
+
+def create_search_index():
+    """
+    Create the search index and the triggers that keep it up to date. If the index
+    doesn't exist yet, it's populated from the existing data.
+
+    This must be used inside of a transaction while holding the database write lock.
+    """
+    rebuild = not models.SearchIndex.table_exists()
+    models.SearchIndex.create_table()
+    for sql in _trigger_sql():
+        models.database.execute_sql(sql)
+
+    if rebuild:
+        for kind in _KINDS:
+            models.database.execute_sql(_index_rows_sql(kind, "t"))
+
+
+def search_candidates(
+    query: str, kind: str, limit: int = SEARCH_CANDIDATE_LIMIT
+) -> List[str]:
+    """
+    Get the IDs of (at most ``limit``) rows of the given ``kind`` that share grams with
+    the ``query``, best matches first.
+    """
+    terms: Dict[str, None] = {}
+    for word in search_words(query):
+        # A single character matches any gram that starts with it.
+        if len(word) == 1:
+            terms[f'"{word}"*'] = None
+        else:
+            terms.update({f'"{g}"': None for g in word_grams(word)})
+    if not terms:
+        return []
+
+    SearchIndex = models.SearchIndex
+    candidates = (
+        SearchIndex.select(SearchIndex.item_id)
+        .where(SearchIndex.match(f"kind : {kind} AND ({' OR '.join(terms)})"))
+        .order_by(SearchIndex.rank())
+        .limit(limit)
+    )
+    return [item_id for (item_id,) in candidates.tuples()]
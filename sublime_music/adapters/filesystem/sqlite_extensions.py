@@ -1,5 +1,6 @@
+import re
 from datetime import datetime, timedelta
-from typing import Any, Optional, Sequence
+from typing import Any, List, Optional, Sequence
 
 from peewee import (
     DoubleField,
@@ -23,8 +24,11 @@ class CacheConstantsField(TextField):
     def db_value(self, value: CachingAdapter.CachedDataKey) -> str:
         return value.value
 
-    def python_value(self, value: str) -> CachingAdapter.CachedDataKey:
-        return CachingAdapter.CachedDataKey(value)
+    def python_value(
+        self, value: Optional[str]
+    ) -> Optional[CachingAdapter.CachedDataKey]:
+        # The value is None when the row comes from an outer join with no match.
+        return CachingAdapter.CachedDataKey(value) if value else None
 
 
 class DurationField(DoubleField):
@@ -43,6 +47,33 @@ class TzDateTimeField(TextField):
         return datetime.fromisoformat(value) if value else None
 
 
+# Search Functions
+# =============================================================================
+_NON_WORD_CHARACTERS_RE = re.compile(r"[\W_]+")
+
+
+def search_words(text: Optional[str]) -> List[str]:
+    """Split ``text`` into lowercase words, ignoring punctuation."""
+    return [w for w in _NON_WORD_CHARACTERS_RE.split((text or "").lower()) if w]
+
+
+def word_grams(word: str) -> List[str]:
+    """
+    Get the overlapping two-character grams of ``word``. A one-character word is its own
+    gram.
+    """
+    return [word[i : i + 2] for i in range(max(len(word) - 1, 1))]
+
+
+def search_grams(text: Optional[str]) -> str:
+    """
+    Get the grams of all of the words in ``text`` separated by spaces. This is
+    registered as an SQL function so that the search index can be kept up to date by
+    triggers.
+    """
+    return " ".join(g for w in search_words(text) for g in word_grams(w))
+
+
 # Sorted M-N Association Field
 # =============================================================================
 class SortedManyToManyQuery(ManyToManyQuery):
@@ -0,0 +1,146 @@
+"""
+Defines the HTTP session that is shared by all of the requests to a server.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .rate_limiter import RateLimiter
+
+
+@dataclass
+class HTTPPoolStats:
+    """
+    A snapshot of the connection pools of a :class:`PooledSession`.
+
+    **Fields:**
+
+    * :class:`HTTPPoolStats.hosts` -- the number of hosts that have a connection pool
+    * :class:`HTTPPoolStats.requests` -- the number of requests that have been made
+    * :class:`HTTPPoolStats.connections` -- the number of connections that have been
+      opened
+    * :class:`HTTPPoolStats.reused_connections` -- the number of requests that were
+      made on an existing connection instead of opening a new one
+    * :class:`HTTPPoolStats.idle_connections` -- the number of open connections that
+      are waiting in the pools to be reused
+    """
+
+    hosts: int
+    requests: int
+    connections: int
+    reused_connections: int
+    idle_connections: int
+
+
+class PooledSession:
+    """
+    An HTTP session that keeps connections alive and reuses them for all of the
+    requests to the same host, so that most requests don't have to wait for a TCP and
+    TLS handshake.
+
+    The connection pools are shared by all threads, but each thread gets its own
+    :class:`requests.Session` (which isn't thread safe) that uses the shared pools.
+    A forked process (such as the ping process of the Subsonic adapter) gets new pools
+    so that it never uses the parent's connections.
+
+    If the session has a :class:`RateLimiter`, every request waits for its endpoint
+    class's budget before it's sent. A streamed request holds its place in the budget
+    until the response headers are received.
+    """
+
+    def __init__(
+        self,
+        verify: Union[bool, str] = True,
+        max_hosts: int = 4,
+        max_connections_per_host: int = 16,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        """
+        :param verify: whether to verify the server's TLS certificate (or the path of
+            the CA bundle to verify it with).
+        :param max_hosts: the maximum number of hosts to keep connection pools for.
+        :param max_connections_per_host: the maximum number of connections that are
+            kept alive for each host. More requests can be in flight at once, but the
+            extra connections are closed when the requests are done.
+        :param rate_limiter: the rate limiter for the requests, if any.
+        """
+        self.verify = verify
+        self.max_hosts = max_hosts
+        self.max_connections_per_host = max_connections_per_host
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._create_pools()
+
+    def _create_pools(self):
+        self._pid = os.getpid()
+        self._adapter = HTTPAdapter(
+            pool_connections=self.max_hosts, pool_maxsize=self.max_connections_per_host
+        )
+        self._local = threading.local()
+        if self.rate_limiter:
+            # The locks of the parent's rate limiter may have been held when it forked.
+            self.rate_limiter.reset()
+
+    @property
+    def session(self) -> requests.Session:
+        """The :class:`requests.Session` for the current thread."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._create_pools()
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.verify = self.verify
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            self._local.session = session
+        return session
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        """
+        Make a GET request. This takes the same arguments as :class:`requests.get`.
+
+        Streamed responses must be closed (or read to the end) so that their connection
+        goes back to the pool.
+        """
+        session = self.session
+        if self.rate_limiter is None:
+            return session.get(url, **kwargs)
+
+        with self.rate_limiter.request(url) as permit:
+            response = session.get(url, **kwargs)
+            permit.record_response(
+                response.status_code, response.headers.get("Retry-After")
+            )
+            return response
+
+    def stats(self) -> HTTPPoolStats:
+        pools = self._adapter.poolmanager.pools
+        with pools.lock:
+            host_pools = [pools[key] for key in pools.keys()]
+
+        num_requests = sum(pool.num_requests for pool in host_pools)
+        num_connections = sum(pool.num_connections for pool in host_pools)
+        return HTTPPoolStats(
+            hosts=len(host_pools),
+            requests=num_requests,
+            connections=num_connections,
+            reused_connections=max(num_requests - num_connections, 0),
+            # The pool queues hold a placeholder for each connection that hasn't been
+            # opened yet.
+            idle_connections=sum(
+                sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                for pool in host_pools
+                if pool.pool
+            ),
+        )
+
+    def close(self):
+        """Close all of the idle connections."""
+        self._adapter.close()
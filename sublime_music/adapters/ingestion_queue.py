@@ -0,0 +1,224 @@
+"""
+Defines the queue that writes new data into the caching adapter in batches.
+"""
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import timedelta
+from time import monotonic
+from typing import Callable, Deque, Generic, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Long enough to batch the writes from a burst of requests, but short enough that the
+# writes are visible to other processes (and survive a crash) almost immediately.
+DEFAULT_BATCH_WINDOW = timedelta(milliseconds=50)
+
+
+@dataclass
+class IngestionQueueStats:
+    """
+    A snapshot of the state of an :class:`IngestionQueue`.
+
+    **Fields:**
+
+    * :class:`IngestionQueueStats.depth` -- the number of writes waiting to be written
+    * :class:`IngestionQueueStats.max_depth` -- the most writes that have ever been
+      waiting at once
+    * :class:`IngestionQueueStats.batches` -- the number of batches that have been
+      written
+    * :class:`IngestionQueueStats.writes` -- the number of writes that have been
+      written
+    * :class:`IngestionQueueStats.mean_commit_latency` -- the average time (in
+      seconds) that it took to write a batch
+    * :class:`IngestionQueueStats.max_commit_latency` -- the longest time (in seconds)
+      that it took to write a batch
+    * :class:`IngestionQueueStats.mean_wait` -- the average time (in seconds) from
+      when a write was queued until it was written
+    * :class:`IngestionQueueStats.max_wait` -- the longest time (in seconds) from when
+      a write was queued until it was written
+    """
+
+    depth: int
+    max_depth: int
+    batches: int
+    writes: int
+    mean_commit_latency: float
+    max_commit_latency: float
+    mean_wait: float
+    max_wait: float
+
+
+class IngestionQueue(Generic[T]):
+    """
+    Writes data on a single writer thread. Writes are grouped into batches so that many
+    small writes (such as the results of all of the requests made to load a page) are
+    written with a single call to ``write_batch``.
+
+    A batch is written once it has ``max_batch_size`` writes, once its oldest write has
+    waited for ``batch_window``, or as soon as a reader calls :class:`flush`. Writes are
+    always written in the order that they were queued.
+
+    The queue holds at most ``max_size`` writes. Once it's full, :class:`put` blocks
+    until the writer catches up, except on the main thread (which runs the UI).
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[T]], None],
+        max_size: int = 1000,
+        max_batch_size: int = 100,
+        batch_window: timedelta = DEFAULT_BATCH_WINDOW,
+    ):
+        """
+        :param write_batch: the function that writes a batch of writes. It's only ever
+            called on the writer thread.
+        :param max_size: the maximum number of writes that can be waiting.
+        :param max_batch_size: the maximum number of writes in each batch.
+        :param batch_window: the longest that a write waits for more writes to be
+            batched with it.
+        """
+        self.max_size = max_size
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window.total_seconds()
+        self._write_batch = write_batch
+        self._condition = threading.Condition()
+        self._pending: Deque[Tuple[T, float]] = deque()
+        self._queued = 0
+        self._written = 0
+        self._flush_waiters = 0
+        self._stopped = False
+
+        self._max_depth = 0
+        self._batches = 0
+        self._commit_latency_total = 0.0
+        self._commit_latency_max = 0.0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._writer = threading.Thread(
+            target=self._run, name="cache-writer", daemon=True
+        )
+        self._writer.start()
+
+    def put(self, write: T) -> bool:
+        """
+        Queue ``write`` to be written. This blocks while the queue is full, unless it's
+        called on the main thread.
+
+        :returns: whether the write was queued. Writes are dropped once the queue has
+            been shut down.
+        """
+        # The writer can't wait for itself to make room, and the main thread must never
+        # be blocked, so their writes can go over the limit.
+        can_wait = threading.current_thread() not in (
+            self._writer,
+            threading.main_thread(),
+        )
+        with self._condition:
+            while (
+                len(self._pending) >= self.max_size and not self._stopped and can_wait
+            ):
+                self._condition.wait()
+            if self._stopped:
+                logging.warning("The ingestion queue is stopped. Dropping a write.")
+                return False
+
+            self._pending.append((write, monotonic()))
+            self._queued += 1
+            self._max_depth = max(self._max_depth, len(self._pending))
+            self._condition.notify_all()
+            return True
+
+    @property
+    def pending(self) -> bool:
+        """Whether there are queued writes that haven't been written yet."""
+        return self._written < self._queued
+
+    def flush(self):
+        """
+        Wait until all of the writes that were queued before this was called have been
+        written.
+        """
+        # Once this thread's writes have been written, there's no need to take the
+        # lock. This is the case for almost all reads.
+        if self._written >= self._queued:
+            return
+        if threading.current_thread() is self._writer:
+            return
+
+        with self._condition:
+            target = self._queued
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            try:
+                while self._written < target and self._writer.is_alive():
+                    self._condition.wait()
+            finally:
+                self._flush_waiters -= 1
+
+    def shutdown(self):
+        """Write all of the queued writes, and stop the writer thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._writer.join()
+
+    def stats(self) -> IngestionQueueStats:
+        with self._condition:
+            return IngestionQueueStats(
+                depth=len(self._pending),
+                max_depth=self._max_depth,
+                batches=self._batches,
+                writes=self._written,
+                mean_commit_latency=(
+                    self._commit_latency_total / self._batches if self._batches else 0
+                ),
+                max_commit_latency=self._commit_latency_max,
+                mean_wait=self._wait_total / self._written if self._written else 0,
+                max_wait=self._wait_max,
+            )
+
+    def _next_batch(self) -> List[Tuple[T, float]]:
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+
+            # Give more writes a chance to join the batch, unless someone is waiting
+            # for the queued writes.
+            deadline = self._pending[0][1] + self.batch_window if self._pending else 0
+            while (
+                len(self._pending) < self.max_batch_size
+                and not self._flush_waiters
+                and not self._stopped
+                and (remaining := deadline - monotonic()) > 0
+            ):
+                self._condition.wait(remaining)
+
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(len(self._pending), self.max_batch_size))
+            ]
+            # Wake up anything that is waiting for room in the queue.
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while batch := self._next_batch():
+            start = monotonic()
+            try:
+                self._write_batch([write for write, _ in batch])
+            except Exception:
+                logging.exception(f"Failed to write a batch of {len(batch)} writes")
+            end = monotonic()
+
+            with self._condition:
+                self._written += len(batch)
+                self._batches += 1
+                self._commit_latency_total += end - start
+                self._commit_latency_max = max(self._commit_latency_max, end - start)
+                for _, queued_at in batch:
+                    self._wait_total += end - queued_at
+                    self._wait_max = max(self._wait_max, end - queued_at)
+                self._condition.notify_all()
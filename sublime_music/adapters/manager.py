@@ -5,9 +5,15 @@ import os
 import random
 import tempfile
 import threading
-from concurrent.futures import Future, ThreadPoolExecutor
-from dataclasses import dataclass
-from datetime import timedelta
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    InvalidStateError,
+    ThreadPoolExecutor,
+)
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from enum import Enum
 from functools import partial
 from pathlib import Path
@@ -49,7 +55,12 @@ from .api_objects import (
     SearchResult,
     Song,
 )
+from .download_scheduler import DownloadPriority, DownloadQueueStats, DownloadScheduler
 from .filesystem import FilesystemAdapter
+from .http_session import HTTPPoolStats
+from .ingestion_queue import IngestionQueue, IngestionQueueStats
+from .object_cache import ObjectCache
+from .rate_limiter import RateLimitStats
 from .subsonic import SubsonicAdapter
 from ..util import resolve_path
 
@@ -69,6 +80,31 @@ DOWNLOAD_BLOCK_DELAY: Optional[float] = None
 if delay_str := os.environ.get("DOWNLOAD_BLOCK_DELAY"):
     DOWNLOAD_BLOCK_DELAY = float(delay_str)
 
+# How long cached data of each kind is considered fresh. Expired data is still served
+# from the cache, but it is refreshed from the ground truth adapter in the background.
+# Kinds of data which are not listed here never expire.
+CACHE_TTLS: Dict[CachingAdapter.CachedDataKey, timedelta] = {
+    CachingAdapter.CachedDataKey.ALBUM: timedelta(days=1),
+    CachingAdapter.CachedDataKey.ALBUMS: timedelta(hours=6),
+    CachingAdapter.CachedDataKey.ARTIST: timedelta(days=1),
+    CachingAdapter.CachedDataKey.ARTISTS: timedelta(hours=6),
+    CachingAdapter.CachedDataKey.DIRECTORY: timedelta(days=1),
+    CachingAdapter.CachedDataKey.GENRES: timedelta(days=1),
+    CachingAdapter.CachedDataKey.IGNORED_ARTICLES: timedelta(days=7),
+    CachingAdapter.CachedDataKey.PLAYLIST_DETAILS: timedelta(minutes=30),
+    CachingAdapter.CachedDataKey.PLAYLISTS: timedelta(minutes=30),
+    CachingAdapter.CachedDataKey.SONG: timedelta(days=7),
+}
+
+# The maximum number of song details requests that get_songs_details sends to the
+# ground truth adapter at once.
+SONG_DETAILS_CONCURRENCY = 8
+
+# The maximum number of background refreshes to run at once, and how long to wait
+# before trying to refresh the same data again.
+MAX_BACKGROUND_REFRESHES = 2
+BACKGROUND_REFRESH_RETRY_INTERVAL = timedelta(minutes=5)
+
 T = TypeVar("T")
 
 
@@ -87,7 +123,7 @@ class Result(Generic[T]):
 
     def __init__(
         self,
-        data_resolver: Union[T, Callable[[], T]],
+        data_resolver: Union[T, Callable[[], T], Future],
         *args,
         is_download: bool = False,
         default_value: T = None,
@@ -96,12 +132,16 @@ class Result(Generic[T]):
         """
         Creates a :class:`Result` object.
 
-        :param data_resolver: the actual data, or a function that will return the actual
-            data. If the latter, the function will be executed by the thread pool.
+        :param data_resolver: the actual data, a function that will return the actual
+            data, or a :class:`concurrent.futures.Future` that will resolve to the
+            actual data. If a function, it will be executed by the thread pool.
         :param is_download: whether or not this result requires a file download. If it
             does, then it uses a separate executor.
         """
-        if callable(data_resolver):
+        if isinstance(data_resolver, Future):
+            self._future = data_resolver
+            self._future.add_done_callback(self._on_future_complete)
+        elif callable(data_resolver):
             if is_download:
                 self._future = AdapterManager.download_executor.submit(
                     data_resolver, *args
@@ -193,10 +233,103 @@ class DownloadProgress:
         return self.current_bytes / self.total_bytes
 
 
+@dataclass
+class _DownloadFlight:
+    """
+    An in-flight download which is shared by all of the callers requesting the same
+    resource.
+    """
+
+    future: Future = field(default_factory=Future)
+    waiters: int = 0
+    cancelled: bool = False
+
+
+class _PageStream:
+    """
+    The pages of data that an in-flight ground truth request has received so far. Each
+    listener gets all of the pages in order, even if it subscribes after some of them
+    have been received.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: List[Sequence[Any]] = []
+        self._listeners: List[Callable[[Sequence[Any]], None]] = []
+
+    def publish(self, page: Sequence[Any]):
+        # The listeners are called while holding the lock so that a listener which is
+        # subscribing can't miss a page or get it twice.
+        with self._lock:
+            self._pages.append(page)
+            for listener in self._listeners:
+                try:
+                    listener(page)
+                except Exception:
+                    logging.exception("Page listener failed")
+
+    def subscribe(self, listener: Callable[[Sequence[Any]], None]):
+        with self._lock:
+            for page in self._pages:
+                listener(page)
+            self._listeners.append(listener)
+
+
+@dataclass
+class _RequestFlight:
+    """
+    An in-flight ground truth request which is shared by all of the callers making the
+    same request.
+    """
+
+    result: Result
+    pages: _PageStream
+    waiters: int = 0
+
+
+@dataclass
+class _CacheWrite:
+    """
+    A write to the caching adapter which is waiting in the ingestion queue.
+    """
+
+    data_key: CachingAdapter.CachedDataKey
+    param: Optional[str]
+    apply: Callable[[], None]
+    # Resolves once the write has been committed.
+    done: Future = field(default_factory=Future)
+
+
+def _create_waiter(source: Future) -> Future:
+    """
+    Create a future that resolves with the outcome of ``source``. This allows each
+    caller waiting on a shared future to cancel its own wait without cancelling the
+    shared future.
+    """
+    waiter: Future = Future()
+
+    def on_source_done(f: Future):
+        if f.cancelled():
+            waiter.cancel()
+            return
+        if not waiter.set_running_or_notify_cancel():
+            return
+        if (exception := f.exception()) is not None:
+            waiter.set_exception(exception)
+        else:
+            waiter.set_result(f.result())
+
+    source.add_done_callback(on_source_done)
+    return waiter
+
+
 class AdapterManager:
     available_adapters: Set[Any] = {FilesystemAdapter, SubsonicAdapter}
     current_download_ids: Set[str] = set()
     download_set_lock = threading.Lock()
+    _download_flights: Dict[str, _DownloadFlight] = {}
+    request_flights_lock = threading.Lock()
+    _request_flights: Dict[Tuple[Any, ...], _RequestFlight] = {}
     executor: ThreadPoolExecutor = ThreadPoolExecutor()
     download_executor: ThreadPoolExecutor = ThreadPoolExecutor()
     is_shutting_down: bool = False
@@ -205,28 +338,103 @@ class AdapterManager:
     _song_download_jobs: Dict[str, Result[str]] = {}
     _cancelled_song_ids: Set[str] = set()
 
+    # The functions whose results from the caching adapter are kept in the object
+    # cache, and the fields of their results to hydrate immediately.
+    _OBJECT_CACHE_FUNCTIONS: Dict[str, Tuple[str, ...]] = {
+        "get_album": tuple(Album.__annotations__),
+        "get_albums": (),
+        "get_artist": tuple(Artist.__annotations__),
+        "get_artists": (),
+        "get_genres": (),
+        "get_playlist_details": tuple(Playlist.__annotations__),
+        "get_playlists": (),
+        "get_song_details": tuple(Song.__annotations__),
+    }
+
+    # The functions of the ground truth adapter that take an ``on_page`` callback to
+    # publish their data a page at a time.
+    _PAGED_FUNCTIONS: Set[str] = {"get_albums"}
+
+    # The functions of the ground truth adapter that take an ``on_page`` callback to
+    # pass their data to the caching adapter in batches instead of returning all of it.
+    _STREAMED_FUNCTIONS: Set[str] = {"get_artists", "get_playlist_details"}
+
     @dataclass
     class _AdapterManagerInternal:
         ground_truth_adapter: Adapter
         on_song_download_progress: Callable[[Any, str, DownloadProgress], None]
         caching_adapter: Optional[CachingAdapter] = None
         concurrent_download_limit: int = 5
+        object_cache_size: int = 64
+        cache_read_threads: int = 0
+        cache_size_limit: int = 0
+        on_cache_refreshed: Optional[
+            Callable[[CachingAdapter.CachedDataKey, Optional[str]], None]
+        ] = None
 
         def __post_init__(self):
-            self._download_dir = tempfile.TemporaryDirectory()
-            self.download_path = Path(self._download_dir.name)
-            self.download_limiter_semaphore = threading.Semaphore(
-                self.concurrent_download_limit
-            )
+            # Download directly into the caching adapter's staging directory if it has
+            # one so that the downloaded files don't need to be copied into the cache.
+            self._download_dir: Optional[tempfile.TemporaryDirectory] = None
+            if self.caching_adapter and (
+                staging_directory := self.caching_adapter.download_staging_directory
+            ):
+                self.download_path = staging_directory
+            else:
+                self._download_dir = tempfile.TemporaryDirectory()
+                self.download_path = Path(self._download_dir.name)
+            self.download_scheduler = DownloadScheduler(self.concurrent_download_limit)
+            self.object_cache = ObjectCache(self.object_cache_size * 1024 * 1024)
+            self.set_cache_size_limit(self.cache_size_limit)
+
+            # All writes to the caching adapter go through a single writer thread
+            # which writes them in batches. Reads flush the queue first (on the thread
+            # that reads the caching adapter) so that they always see the data that was
+            # written before them.
+            self.ingestion_queue: Optional[IngestionQueue[_CacheWrite]] = None
+            if self.caching_adapter:
+                self.ingestion_queue = IngestionQueue(AdapterManager._write_cache_batch)
+
+            # Reads from the caching adapter run on a dedicated pool (if enabled) so
+            # that they never block the calling thread. Each thread in the pool gets its
+            # own database connection, which is closed when the thread exits.
+            self.read_executor: Optional[ThreadPoolExecutor] = None
+            if self.caching_adapter and self.cache_read_threads > 0:
+                self.read_executor = ThreadPoolExecutor(
+                    max_workers=self.cache_read_threads,
+                    thread_name_prefix="cache-read",
+                    initializer=self.caching_adapter.initialize_read_thread,
+                )
+
+            # State for refreshing expired cache data in the background.
+            self.refresh_lock = threading.Lock()
+            self.cache_expirations: Dict[
+                Tuple[CachingAdapter.CachedDataKey, Optional[str]], datetime
+            ] = {}
+            self.refresh_attempts: Dict[Tuple[Any, ...], datetime] = {}
+            self.active_refreshes = 0
+
+        def set_cache_size_limit(self, cache_size_limit: int):
+            self.cache_size_limit = cache_size_limit
+            if self.caching_adapter:
+                self.caching_adapter.set_cache_size_limit(
+                    cache_size_limit * 1024 * 1024 if cache_size_limit > 0 else None
+                )
 
         def song_download_progress(self, file_id: str, progress: DownloadProgress):
             self.on_song_download_progress(file_id, progress)
 
         def shutdown(self):
+            self.download_scheduler.clear()
+            if self.read_executor:
+                self.read_executor.shutdown()
+            if self.ingestion_queue:
+                self.ingestion_queue.shutdown()
             self.ground_truth_adapter.shutdown()
             if self.caching_adapter:
                 self.caching_adapter.shutdown()
-            self._download_dir.cleanup()
+            if self._download_dir:
+                self._download_dir.cleanup()
 
     _instance: Optional[_AdapterManagerInternal] = None
 
@@ -272,6 +480,9 @@ class AdapterManager:
     def reset(
         config: Any,
         on_song_download_progress: Callable[[Any, str, DownloadProgress], None],
+        on_cache_refreshed: Optional[
+            Callable[[CachingAdapter.CachedDataKey, Optional[str]], None]
+        ] = None,
     ):
         from sublime_music.config import AppConfiguration
 
@@ -310,6 +521,10 @@ class AdapterManager:
             on_song_download_progress,
             caching_adapter=caching_adapter,
             concurrent_download_limit=config.concurrent_download_limit,
+            object_cache_size=config.object_cache_size,
+            cache_read_threads=config.cache_read_threads,
+            cache_size_limit=config.cache_size_limit,
+            on_cache_refreshed=on_cache_refreshed,
         )
 
     @staticmethod
@@ -320,6 +535,11 @@ class AdapterManager:
         ):
             ground_truth_adapter.on_offline_mode_change(offline_mode)
 
+    @staticmethod
+    def on_cache_size_limit_change(cache_size_limit: int):
+        if AdapterManager._instance:
+            AdapterManager._instance.set_cache_size_limit(cache_size_limit)
+
     # Data Helper Methods
     # ==================================================================================
     TAdapter = TypeVar("TAdapter", bound=Adapter)
@@ -352,7 +572,7 @@ class AdapterManager:
     def _create_ground_truth_result(
         function_name: str,
         *params: Any,
-        before_download: Callable[[], None] = None,
+        before_download: Optional[Callable[[], None]] = None,
         partial_data: Any = None,
         **kwargs,
     ) -> Result:
@@ -388,137 +608,277 @@ class AdapterManager:
     ) -> Result[str]:
         """
         Create a function to download the given URI to a temporary file, and return the
-        filename. The returned function will spin-loop if the resource is already being
-        downloaded to prevent multiple requests for the same download.
+        filename. If the resource is already being downloaded, the returned
+        :class:`Result` joins the in-flight download instead of starting a new one, so
+        every concurrent caller for the same ``id`` shares a single request.
         """
-        download_cancelled = False
+        with AdapterManager.download_set_lock:
+            flight = AdapterManager._download_flights.get(id)
+            joined = flight is not None
+            if flight is None:
+                flight = _DownloadFlight()
+                AdapterManager._download_flights[id] = flight
+                flight.future = AdapterManager.download_executor.submit(
+                    AdapterManager._do_download,
+                    flight,
+                    uri,
+                    id,
+                    before_download,
+                    expected_size,
+                )
+            flight.waiters += 1
 
-        def download_fn() -> str:
-            assert AdapterManager._instance
-            download_tmp_filename = AdapterManager._instance.download_path.joinpath(
-                hashlib.sha1(bytes(uri, "utf8")).hexdigest()
-            )
+        if joined:
+            logging.info(f"{uri} already being downloaded. Joining the download.")
+            if before_download:
+                before_download()
+        else:
 
-            resource_downloading = False
+            def on_flight_done(_: Future):
+                with AdapterManager.download_set_lock:
+                    if AdapterManager._download_flights.get(id) is flight:
+                        del AdapterManager._download_flights[id]
+
+            flight.future.add_done_callback(on_flight_done)
+
+        # Each caller gets its own future so that it can be cancelled without affecting
+        # the other callers waiting on the same download.
+        waiter = _create_waiter(flight.future)
+        waiter_released = False
+
+        def on_download_cancel():
+            nonlocal waiter_released
             with AdapterManager.download_set_lock:
-                if id in AdapterManager.current_download_ids:
-                    resource_downloading = True
-                AdapterManager.current_download_ids.add(id)
+                if waiter_released:
+                    return
+                waiter_released = True
+                flight.waiters -= 1
+                if flight.waiters > 0:
+                    return
 
-            if before_download:
-                before_download()
+                # Nobody is waiting for the download anymore, so stop it.
+                flight.cancelled = True
+            flight.future.cancel()
 
-            expected_size_exists = expected_size is not None
-            if expected_size_exists:
-                AdapterManager._instance.song_download_progress(
-                    id,
-                    DownloadProgress(
-                        DownloadProgress.Type.PROGRESS,
-                        total_bytes=expected_size,
-                        current_bytes=0,
-                    ),
-                )
+        return Result(waiter, on_cancel=on_download_cancel, **result_args)
 
-            # TODO (#122): figure out how to retry if the other request failed.
-            if resource_downloading:
-                logging.info(f"{uri} already being downloaded.")
-
-                # The resource is already being downloaded. Busy loop until it has
-                # completed. Then, just return the path to the resource.
-                t = 0.0
-                while id in AdapterManager.current_download_ids and t < 20:
-                    sleep(0.2)
-                    t += 0.2
-                    # TODO (#122): handle the timeout
-            else:
-                logging.info(f"{uri} not found. Downloading...")
-                try:
-                    if REQUEST_DELAY is not None:
-                        delay = random.uniform(*REQUEST_DELAY)
-                        logging.info(
-                            f"REQUEST_DELAY enabled. Pausing for {delay} seconds"
-                        )
-                        sleep(delay)
+    @staticmethod
+    def _create_cached_download_result(
+        download: Result[str],
+        data_key: CachingAdapter.CachedDataKey,
+        param: str,
+        get_cached_uri: Callable[[], str],
+        default_value: str = None,
+    ) -> Result[str]:
+        """
+        Create a :class:`Result` which ingests the file downloaded by ``download`` and
+        then resolves to its URI in the cache (from ``get_cached_uri``). If the file
+        can't be ingested, the result resolves to the downloaded file instead.
+        """
+        future: Future = Future()
+
+        def on_ingested(filename: str, f: Future):
+            try:
+                f.result()
+                uri = get_cached_uri()
+            except Exception:
+                logging.exception(f"Failed to cache {data_key} {param}")
+                uri = filename
+            with suppress(InvalidStateError):
+                future.set_result(uri)
 
-                    if NETWORK_ALWAYS_ERROR:
-                        raise Exception("NETWORK_ALWAYS_ERROR enabled")
+        def on_downloaded(f: Future):
+            try:
+                filename = f.result()
+            except CancelledError:
+                future.cancel()
+                return
+            except Exception as e:
+                with suppress(InvalidStateError):
+                    future.set_exception(e)
+                return
+            AdapterManager._ingest_download(
+                data_key, param, filename
+            ).add_done_callback(partial(on_ingested, filename))
 
-                    # Wait 10 seconds to connect to the server and start downloading.
-                    # Then, for each of the blocks, give 5 seconds to download (which
-                    # should be more than enough for 1 KiB).
-                    request = requests.get(uri, stream=True, timeout=(10, 5))
-                    if "json" in request.headers.get("Content-Type", ""):
-                        raise Exception("Didn't expect JSON!")
+        def on_cancel():
+            download.cancel()
 
-                    total_size = int(request.headers.get("Content-Length", 0))
-                    if expected_size_exists:
-                        if total_size != expected_size:
-                            raise Exception(
-                                f"Download content size ({total_size})is not the "
-                                f"expected size ({expected_size})."
-                            )
+        download.add_done_callback(on_downloaded)
+        return Result(future, default_value=default_value, on_cancel=on_cancel)
 
-                    block_size = 1024  # 1 KiB
-                    total_consumed = 0
-
-                    with open(download_tmp_filename, "wb+") as f:
-                        for i, data in enumerate(request.iter_content(block_size)):
-                            total_consumed += len(data)
-                            f.write(data)
-
-                            if download_cancelled:
-                                AdapterManager._instance.song_download_progress(
-                                    id,
-                                    DownloadProgress(DownloadProgress.Type.CANCELLED),
-                                )
-                                raise Exception("Download Cancelled")
-
-                            if i % 100 == 0:
-                                # Only delay (if configured) and update the progress UI
-                                # every 100 KiB.
-                                if DOWNLOAD_BLOCK_DELAY is not None:
-                                    sleep(DOWNLOAD_BLOCK_DELAY)
-
-                                if expected_size_exists:
-                                    AdapterManager._instance.song_download_progress(
-                                        id,
-                                        DownloadProgress(
-                                            DownloadProgress.Type.PROGRESS,
-                                            total_bytes=total_size,
-                                            current_bytes=total_consumed,
-                                        ),
-                                    )
-
-                    # Everything succeeded.
-                    if expected_size_exists:
+    @staticmethod
+    def _do_download(
+        flight: _DownloadFlight,
+        uri: str,
+        id: str,
+        before_download: Optional[Callable[[], None]],
+        expected_size: Optional[int],
+    ) -> str:
+        assert AdapterManager._instance
+        download_path = AdapterManager._instance.download_path
+
+        # The partial download file is named by the resource (rather than the URI, which
+        # changes with every request due to the auth salt) so that a later attempt can
+        # resume where this one left off.
+        download_tmp_filename = download_path.joinpath(
+            hashlib.sha1(bytes(f"{id}:{expected_size}", "utf8")).hexdigest() + ".part"
+        )
+
+        with AdapterManager.download_set_lock:
+            AdapterManager.current_download_ids.add(id)
+
+        if before_download:
+            before_download()
+
+        offset = 0
+        if download_tmp_filename.exists():
+            offset = download_tmp_filename.stat().st_size
+            if expected_size is not None and offset >= expected_size:
+                # The partial file can't be right, so start over.
+                offset = 0
+
+        expected_size_exists = expected_size is not None
+        if expected_size_exists:
+            AdapterManager._instance.song_download_progress(
+                id,
+                DownloadProgress(
+                    DownloadProgress.Type.PROGRESS,
+                    total_bytes=expected_size,
+                    current_bytes=offset,
+                ),
+            )
+
+        logging.info(f"{uri} not found. Downloading...")
+        request = None
+        try:
+            if REQUEST_DELAY is not None:
+                delay = random.uniform(*REQUEST_DELAY)
+                logging.info(f"REQUEST_DELAY enabled. Pausing for {delay} seconds")
+                sleep(delay)
+
+            if NETWORK_ALWAYS_ERROR:
+                raise Exception("NETWORK_ALWAYS_ERROR enabled")
+
+            # Wait 10 seconds to connect to the server and start downloading. Then, for
+            # each of the blocks, give 5 seconds to download (which should be more than
+            # enough for 64 KiB).
+            # Download using the ground truth adapter's session (if it has one) so that
+            # the download can reuse one of its connections to the server.
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            session = AdapterManager._instance.ground_truth_adapter.http_session
+            request = (session or requests).get(
+                uri, stream=True, timeout=(10, 5), headers=headers
+            )
+            if "json" in request.headers.get("Content-Type", ""):
+                raise Exception("Didn't expect JSON!")
+
+            if request.status_code == 416:
+                # The partial file is bigger than the resource, so it can't be right.
+                download_tmp_filename.unlink(missing_ok=True)
+                raise Exception(f"Unable to resume download of {uri}.")
+
+            # Only resume if the server actually sent the requested range. Otherwise,
+            # it's sending the whole file, so start over.
+            if offset and not (
+                request.status_code == 206
+                and request.headers.get("Content-Range", "").startswith(
+                    f"bytes {offset}-"
+                )
+            ):
+                logging.info(f"{uri} can't be resumed. Restarting download.")
+                offset = 0
+
+            content_length = int(request.headers.get("Content-Length", 0))
+            total_size = offset + content_length
+            if expected_size_exists:
+                if total_size != expected_size:
+                    download_tmp_filename.unlink(missing_ok=True)
+                    raise Exception(
+                        f"Download content size ({total_size})is not the "
+                        f"expected size ({expected_size})."
+                    )
+
+            # Stream the file in large blocks and hash it as it comes in so that the
+            # caching adapter doesn't have to re-read the file to ingest it. If the
+            # download is being resumed, the hash has to include the existing data.
+            block_size = 64 * 1024  # 64 KiB
+            total_consumed = offset
+            file_hash = hashlib.sha1()
+
+            if offset:
+                logging.info(f"Resuming download of {uri} at byte {offset}.")
+                with open(download_tmp_filename, "rb") as f:
+                    while chunk := f.read(block_size):
+                        file_hash.update(chunk)
+
+            with open(download_tmp_filename, "ab" if offset else "wb") as f:
+                for data in request.iter_content(block_size):
+                    total_consumed += len(data)
+                    f.write(data)
+                    file_hash.update(data)
+
+                    if flight.cancelled:
                         AdapterManager._instance.song_download_progress(
                             id,
-                            DownloadProgress(DownloadProgress.Type.DONE),
+                            DownloadProgress(DownloadProgress.Type.CANCELLED),
                         )
-                except Exception as e:
-                    if expected_size_exists and not download_cancelled:
-                        # Something failed. Post an error.
+                        raise Exception("Download Cancelled")
+
+                    # Delay (if configured) and update the progress UI after every
+                    # block.
+                    if DOWNLOAD_BLOCK_DELAY is not None:
+                        sleep(DOWNLOAD_BLOCK_DELAY)
+
+                    if expected_size_exists:
                         AdapterManager._instance.song_download_progress(
                             id,
-                            DownloadProgress(DownloadProgress.Type.ERROR, exception=e),
+                            DownloadProgress(
+                                DownloadProgress.Type.PROGRESS,
+                                total_bytes=total_size,
+                                current_bytes=total_consumed,
+                            ),
                         )
-                    # Re-raise the exception so that we can actually handle it.
-                    raise
-                finally:
-                    # Always release the download set lock, even if there's an error.
-                    with AdapterManager.download_set_lock:
-                        AdapterManager.current_download_ids.discard(id)
 
-            logging.info(f"{uri} downloaded. Returning.")
-            return str(download_tmp_filename)
+            # The connection may have been closed before all of the data was sent. Keep
+            # what was downloaded so that the next attempt can resume.
+            if content_length and total_consumed != total_size:
+                raise Exception(
+                    f"Download ended early ({total_consumed}/{total_size} bytes)."
+                )
+
+            # Completed downloads are named by their content hash. The rename is atomic,
+            # so a partially written file is never visible under its final name.
+            downloaded_filename = download_path.joinpath(file_hash.hexdigest())
+            os.replace(download_tmp_filename, downloaded_filename)
 
-        def on_download_cancel():
-            nonlocal download_cancelled
-            download_cancelled = True
+            # Everything succeeded.
+            if expected_size_exists:
+                AdapterManager._instance.song_download_progress(
+                    id,
+                    DownloadProgress(DownloadProgress.Type.DONE),
+                )
+        except Exception as e:
+            if expected_size_exists and not flight.cancelled:
+                # Something failed. Post an error.
+                AdapterManager._instance.song_download_progress(
+                    id,
+                    DownloadProgress(DownloadProgress.Type.ERROR, exception=e),
+                )
+            # Re-raise the exception so that we can actually handle it. The partial
+            # download is kept so that it can be resumed.
+            raise
+        finally:
+            # Return the connection to the pool, even if the download didn't finish.
+            if request is not None:
+                request.close()
+
+            # Always release the download set lock, even if there's an error.
+            with AdapterManager.download_set_lock:
+                AdapterManager.current_download_ids.discard(id)
 
-        return Result(
-            download_fn, is_download=True, on_cancel=on_download_cancel, **result_args
-        )
+        logging.info(f"{uri} downloaded. Returning.")
+        return str(downloaded_filename)
 
     @staticmethod
     def _create_caching_done_callback(
@@ -534,12 +894,187 @@ class AdapterManager:
         def future_finished(f: Result):
             assert AdapterManager._instance
             assert AdapterManager._instance.caching_adapter
-            AdapterManager._instance.caching_adapter.ingest_new_data(
-                cache_key, param, f.result()
-            )
+            AdapterManager._ingest_new_data(cache_key, param, f.result())
 
         return future_finished
 
+    @staticmethod
+    def _ingest_new_data(
+        data_key: CachingAdapter.CachedDataKey, param: Optional[str], data: Any
+    ) -> Future:
+        assert AdapterManager._instance
+        assert AdapterManager._instance.caching_adapter
+        return AdapterManager._queue_cache_write(
+            data_key,
+            param,
+            partial(
+                AdapterManager._instance.caching_adapter.ingest_new_data,
+                data_key,
+                param,
+                data,
+            ),
+        )
+
+    @staticmethod
+    def _invalidate_data(data_key: CachingAdapter.CachedDataKey, param: Optional[str]):
+        assert AdapterManager._instance
+        assert AdapterManager._instance.caching_adapter
+        AdapterManager._queue_cache_write(
+            data_key,
+            param,
+            partial(
+                AdapterManager._instance.caching_adapter.invalidate_data,
+                data_key,
+                param,
+            ),
+        )
+
+    @staticmethod
+    def _delete_data(
+        data_key: CachingAdapter.CachedDataKey, param: Optional[str]
+    ) -> Future:
+        assert AdapterManager._instance
+        assert AdapterManager._instance.caching_adapter
+        return AdapterManager._queue_cache_write(
+            data_key,
+            param,
+            partial(
+                AdapterManager._instance.caching_adapter.delete_data, data_key, param
+            ),
+        )
+
+    @staticmethod
+    def _ingest_download(
+        data_key: CachingAdapter.CachedDataKey,
+        param: Optional[str],
+        filename: str,
+        data: Any = None,
+    ) -> Future:
+        """
+        Ingest the downloaded file ``filename`` (as ``data``, if given). Once the file
+        is in the cache, the download is deleted so that it doesn't keep taking up space
+        after the file is evicted from the cache.
+        """
+        ingested = AdapterManager._ingest_new_data(
+            data_key, param, filename if data is None else data
+        )
+
+        def on_ingested(f: Future):
+            if f.exception() is None:
+                Path(filename).unlink(missing_ok=True)
+
+        ingested.add_done_callback(on_ingested)
+        return ingested
+
+    @staticmethod
+    def _queue_cache_write(
+        data_key: CachingAdapter.CachedDataKey,
+        param: Optional[str],
+        apply: Callable[[], None],
+    ) -> Future:
+        """
+        Queue a write to the caching adapter. The write happens in the background, but
+        any read from the cache that starts after this returns will see it.
+
+        :returns: a future that resolves once the write has been committed.
+        """
+        assert AdapterManager._instance
+        assert AdapterManager._instance.ingestion_queue
+        write = _CacheWrite(data_key, param, apply)
+        if not AdapterManager._instance.ingestion_queue.put(write):
+            write.done.set_exception(Exception("The ingestion queue is stopped"))
+        return write.done
+
+    @staticmethod
+    def _write_cache_batch(writes: List[_CacheWrite]):
+        assert AdapterManager._instance
+        assert AdapterManager._instance.caching_adapter
+        try:
+            with AdapterManager._instance.caching_adapter.batch_writes():
+                for write in writes:
+                    # Don't let one bad write fail the rest of the batch.
+                    try:
+                        write.apply()
+                    except Exception as e:
+                        logging.exception(
+                            f"Failed to write {write.data_key} to the cache"
+                        )
+                        write.done.set_exception(e)
+        except Exception as e:
+            for write in writes:
+                if not write.done.done():
+                    write.done.set_exception(e)
+            raise
+
+        # Only invalidate the object cache once the writes are visible to the reads
+        # that will repopulate it.
+        for data_key in {write.data_key for write in writes}:
+            AdapterManager._invalidate_object_cache(data_key)
+
+        # The written data may have been refreshed, so its expiry time has to be
+        # recomputed.
+        with AdapterManager._instance.refresh_lock:
+            for write in writes:
+                AdapterManager._instance.cache_expirations.pop(
+                    (write.data_key, write.param), None
+                )
+
+        for write in writes:
+            if not write.done.done():
+                write.done.set_result(None)
+
+    @staticmethod
+    def _flush_cache_writes():
+        """
+        Wait for all of the queued writes to the caching adapter to be written. This
+        can take a while, so it shouldn't be called on the main thread.
+        """
+        if AdapterManager._instance and AdapterManager._instance.ingestion_queue:
+            AdapterManager._instance.ingestion_queue.flush()
+
+    @staticmethod
+    def _cache_writes_pending() -> bool:
+        return bool(
+            AdapterManager._instance
+            and AdapterManager._instance.ingestion_queue
+            and AdapterManager._instance.ingestion_queue.pending
+        )
+
+    @staticmethod
+    def _read_cached_file(read: Callable[[], str]) -> str:
+        """
+        Read the URI of a file from the caching adapter on the calling thread. The
+        queued writes are only waited for if the file isn't in the cache, since its
+        download may just not have been written yet.
+        """
+        try:
+            return read()
+        except CacheMissError:
+            if not AdapterManager._cache_writes_pending():
+                raise
+        AdapterManager._flush_cache_writes()
+        return read()
+
+    @staticmethod
+    def _invalidate_object_cache(data_key: CachingAdapter.CachedDataKey):
+        """
+        Remove the objects which may have been affected by a change to the given kind
+        of data from the object cache.
+        """
+        assert AdapterManager._instance
+        KEYS = CachingAdapter.CachedDataKey
+        if data_key == KEYS.COVER_ART_FILE:
+            # Cover art is only referenced by ID, so the cached objects don't change.
+            return
+        if data_key in (KEYS.SONG_FILE, KEYS.SONG_FILE_PERMANENT):
+            # Song files only change the path and size of songs, so only the objects
+            # which contain songs need to be invalidated.
+            AdapterManager._instance.object_cache.invalidate(
+                ("get_album", "get_playlist_details", "get_song_details")
+            )
+            return
+        AdapterManager._instance.object_cache.invalidate()
+
     @staticmethod
     def get_supported_artist_query_types() -> Set[AlbumSearchQuery.Type]:
         assert AdapterManager._instance
@@ -558,6 +1093,7 @@ class AdapterManager:
         use_ground_truth_adapter: bool = False,
         allow_download: bool = True,
         on_result_finished: Callable[[Result], None] = None,
+        on_page: Optional[Callable[[Sequence[Any]], None]] = None,
         **kwargs: Any,
     ) -> Result[R]:
         """
@@ -573,33 +1109,136 @@ class AdapterManager:
         :param on_result_finished: A function to run after the result received from the
             ground truth adapter. (Has no effect if the result is from the caching
             adapter.)
+        :param on_page: A function to call with each page of the data, in order, as the
+            ground truth adapter receives it (only for the :class:`_PAGED_FUNCTIONS`).
+            The returned :class:`Result` still resolves to all of the data. (Has no
+            effect if the result is from the caching adapter.)
         :param kwargs: The keyword arguments to pass to the adapter function.
         """
         assert AdapterManager._instance
         logging.info(f"START: {function_name}")
+        param_str = param.strhash() if isinstance(param, AlbumSearchQuery) else param
+        request_key = AdapterManager._request_key(function_name, param_str, kwargs)
+        use_cache = AdapterManager._can_use_cache(
+            use_ground_truth_adapter, function_name
+        )
+        if (
+            use_cache
+            and request_key is not None
+            and function_name in AdapterManager._OBJECT_CACHE_FUNCTIONS
+            # The object cache is only up to date once the queued writes are written.
+            and not AdapterManager._cache_writes_pending()
+        ):
+            # If the data is already in memory, return it immediately.
+            object_cache = AdapterManager._instance.object_cache
+            cached, expires_at = object_cache.get_with_expiry(request_key)
+            if cached is not None:
+                logging.info(f"END: {function_name}: serving from object cache")
+
+                def refresh_if_expired():
+                    AdapterManager._refresh_if_expired(
+                        function_name,
+                        param,
+                        request_key,
+                        cache_key,
+                        kwargs,
+                        AdapterManager._cache_expiry(cache_key, param),
+                    )
+
+                if expires_at is not None:
+                    AdapterManager._refresh_if_expired(
+                        function_name, param, request_key, cache_key, kwargs, expires_at
+                    )
+                elif read_executor := AdapterManager._instance.read_executor:
+                    # Getting the expiry time may query the caching adapter.
+                    read_executor.submit(refresh_if_expired)
+                else:
+                    refresh_if_expired()
+                return Result(cached)
+
+        def read() -> Result:
+            return AdapterManager._read_from_cache_or_ground_truth(
+                function_name,
+                param,
+                request_key,
+                use_cache,
+                cache_key,
+                before_download,
+                use_ground_truth_adapter,
+                allow_download,
+                on_result_finished,
+                on_page,
+                kwargs,
+            )
+
+        if use_cache and (read_executor := AdapterManager._instance.read_executor):
+            return AdapterManager._create_background_read_result(read_executor, read)
+        return read()
+
+    @staticmethod
+    def _read_from_cache_or_ground_truth(
+        function_name: str,
+        param: Optional[Union[str, AlbumSearchQuery]],
+        request_key: Optional[Tuple[Any, ...]],
+        use_cache: bool,
+        cache_key: Optional[CachingAdapter.CachedDataKey],
+        before_download: Optional[Callable[[], None]],
+        use_ground_truth_adapter: bool,
+        allow_download: bool,
+        on_result_finished: Optional[Callable[[Result], None]],
+        on_page: Optional[Callable[[Sequence[Any]], None]],
+        kwargs: Dict[str, Any],
+    ) -> Result:
+        """
+        Get data from the caching adapter, or from the ground truth adapter if it isn't
+        in the cache. See :class:`_get_from_cache_or_ground_truth` for the parameters.
+        """
+        assert AdapterManager._instance
+        param_str = param.strhash() if isinstance(param, AlbumSearchQuery) else param
         partial_data = None
-        if AdapterManager._can_use_cache(use_ground_truth_adapter, function_name):
+        if use_cache:
             assert (caching_adapter := AdapterManager._instance.caching_adapter)
+            AdapterManager._flush_cache_writes()
+            object_cache = AdapterManager._instance.object_cache
+            use_object_cache = (
+                request_key is not None
+                and function_name in AdapterManager._OBJECT_CACHE_FUNCTIONS
+            )
+            generation = object_cache.generation
             try:
                 logging.info(f"END: {function_name}: serving from cache")
+                # Get the expiry time before the data so that it's never newer than it.
+                expires_at = AdapterManager._cache_expiry(cache_key, param)
                 if param is None:
-                    return Result(getattr(caching_adapter, function_name)(**kwargs))
-                return Result(getattr(caching_adapter, function_name)(param, **kwargs))
+                    data = getattr(caching_adapter, function_name)(**kwargs)
+                else:
+                    data = getattr(caching_adapter, function_name)(param, **kwargs)
+                if use_object_cache:
+                    data = object_cache.put(
+                        request_key,
+                        data,
+                        generation,
+                        eager_fields=AdapterManager._OBJECT_CACHE_FUNCTIONS[
+                            function_name
+                        ],
+                        expires_at=expires_at,
+                    )
+                AdapterManager._refresh_if_expired(
+                    function_name, param, request_key, cache_key, kwargs, expires_at
+                )
+                return Result(data)
             except CacheMissError as e:
                 partial_data = e.partial_data
                 logging.info(f"Cache Miss on {function_name}.")
             except Exception:
                 logging.exception(f"Error on {function_name} retrieving from cache.")
 
-        param_str = param.strhash() if isinstance(param, AlbumSearchQuery) else param
         if (
             cache_key
             and AdapterManager._instance.caching_adapter
             and use_ground_truth_adapter
         ):
-            AdapterManager._instance.caching_adapter.invalidate_data(
-                cache_key, param_str
-            )
+            AdapterManager._invalidate_data(cache_key, param_str)
 
         if (
             not allow_download
@@ -612,26 +1251,388 @@ class AdapterManager:
 
             return Result(cache_miss_result)
 
-        result: Result[AdapterManager.R] = AdapterManager._create_ground_truth_result(
+        result = AdapterManager._create_shared_ground_truth_result(
             function_name,
-            *((param,) if param is not None else ()),
-            before_download=before_download,
-            partial_data=partial_data,
-            **kwargs,
+            param,
+            request_key,
+            cache_key,
+            before_download,
+            partial_data,
+            on_page,
+            kwargs,
         )
 
-        if AdapterManager._instance.caching_adapter:
-            if cache_key:
+        if AdapterManager._instance.caching_adapter and on_result_finished:
+            result.add_done_callback(on_result_finished)
+
+        logging.info(f"END: {function_name}")
+        logging.debug(result)
+        return result
+
+    @staticmethod
+    def _create_background_read_result(
+        read_executor: ThreadPoolExecutor, read: Callable[[], Result]
+    ) -> Result:
+        """
+        Create a :class:`Result` which runs ``read`` on the cache read pool and resolves
+        to the outcome of the :class:`Result` that ``read`` returns. Cancelling the
+        returned :class:`Result` cancels the inner one (for example, a request to the
+        ground truth adapter after a cache miss).
+        """
+        future: Future = Future()
+        lock = threading.Lock()
+        inner_result: Optional[Result] = None
+
+        def on_inner_done(f: Union[Future, Result]):
+            if future.done():
+                return
+            try:
+                data = f.result()
+            except CancelledError:
+                future.cancel()
+                return
+            except Exception as e:
+                with suppress(InvalidStateError):
+                    future.set_exception(e)
+                return
+            with suppress(InvalidStateError):
+                future.set_result(data)
+
+        def do_read():
+            nonlocal inner_result
+            if future.done():
+                return
+            try:
+                result = read()
+            except Exception as e:
+                with suppress(InvalidStateError):
+                    future.set_exception(e)
+                return
+            with lock:
+                inner_result = result
+            if future.cancelled():
+                result.cancel()
+                return
+            result.add_done_callback(on_inner_done)
+
+        def on_cancelled(f: Future):
+            if not f.cancelled():
+                return
+            with lock:
+                result = inner_result
+            if result:
+                result.cancel()
+
+        future.add_done_callback(on_cancelled)
+        read_executor.submit(do_read)
+        return Result(future)
+
+    @staticmethod
+    def _create_shared_ground_truth_result(
+        function_name: str,
+        param: Optional[Union[str, AlbumSearchQuery]],
+        request_key: Optional[Tuple[Any, ...]],
+        cache_key: Optional[CachingAdapter.CachedDataKey],
+        before_download: Optional[Callable[[], None]],
+        partial_data: Any,
+        on_page: Optional[Callable[[Sequence[Any]], None]],
+        kwargs: Dict[str, Any],
+    ) -> Result:
+        """
+        Create a :class:`Result` which calls ``function_name`` on the ground truth
+        adapter and ingests the data into the caching adapter. Identical requests which
+        read data share a single :class:`Result` (and the pages that it receives).
+        """
+        param_str = param.strhash() if isinstance(param, AlbumSearchQuery) else param
+
+        def create_result(pages: _PageStream) -> Result:
+            assert AdapterManager._instance
+            if (
+                function_name in AdapterManager._STREAMED_FUNCTIONS
+                and AdapterManager._instance.caching_adapter
+                and cache_key
+            ):
+                return AdapterManager._create_streamed_ground_truth_result(
+                    function_name,
+                    param_str,
+                    cache_key,
+                    before_download,
+                    partial_data,
+                    kwargs,
+                )
+            adapter_kwargs = kwargs
+            if function_name in AdapterManager._PAGED_FUNCTIONS:
+                adapter_kwargs = {**kwargs, "on_page": pages.publish}
+            result: Result = AdapterManager._create_ground_truth_result(
+                function_name,
+                *((param,) if param is not None else ()),
+                before_download=before_download,
+                partial_data=partial_data,
+                **adapter_kwargs,
+            )
+            if AdapterManager._instance.caching_adapter and cache_key:
                 result.add_done_callback(
                     AdapterManager._create_caching_done_callback(cache_key, param_str)
                 )
+            return result
+
+        # Only requests which read data can be shared. Two identical updates (for
+        # example, appending the same song to a playlist twice) must both happen.
+        if request_key is None or not function_name.startswith("get_"):
+            pages = _PageStream()
+            if on_page:
+                pages.subscribe(on_page)
+            return create_result(pages)
+        return AdapterManager._join_request_flight(
+            request_key, create_result, before_download, on_page
+        )
 
-            if on_result_finished:
-                result.add_done_callback(on_result_finished)
+    @staticmethod
+    def _create_streamed_ground_truth_result(
+        function_name: str,
+        param: Optional[str],
+        cache_key: CachingAdapter.CachedDataKey,
+        before_download: Optional[Callable[[], None]],
+        partial_data: Any,
+        kwargs: Dict[str, Any],
+    ) -> Result:
+        """
+        Create a :class:`Result` which calls ``function_name`` (one of the
+        :class:`_STREAMED_FUNCTIONS`) on the ground truth adapter. Each page of the data
+        is ingested into the caching adapter as soon as it is received, and only the IDs
+        of the objects in it are kept. Once all of the data has been ingested, the
+        result is read from the caching adapter.
+        """
+        assert AdapterManager._instance
+        assert (caching_adapter := AdapterManager._instance.caching_adapter)
+        params = (param,) if param is not None else ()
+        future: Future = Future()
+        page_ids: List[str] = []
+        page_writes: List[Future] = []
+
+        def on_page(page: Sequence[Any]):
+            page_ids.extend(o.id for o in page)
+            page_writes.append(
+                AdapterManager._queue_cache_write(
+                    cache_key,
+                    param,
+                    partial(
+                        caching_adapter.ingest_new_data_page, cache_key, param, page
+                    ),
+                )
+            )
 
-        logging.info(f"END: {function_name}")
-        logging.debug(result)
-        return result
+        def read_from_cache(ingested: Future):
+            try:
+                # The writes are committed in order, so the pages are already written.
+                for f in (*page_writes, ingested):
+                    f.result()
+                data = getattr(caching_adapter, function_name)(*params, **kwargs)
+            except Exception as e:
+                with suppress(InvalidStateError):
+                    future.set_exception(e)
+                return
+            with suppress(InvalidStateError):
+                future.set_result(data)
+
+        def on_received(f: Result):
+            try:
+                data = f.result()
+            except CancelledError:
+                future.cancel()
+                return
+            except Exception as e:
+                with suppress(InvalidStateError):
+                    future.set_exception(e)
+                return
+            ingested = AdapterManager._queue_cache_write(
+                cache_key,
+                param,
+                partial(
+                    caching_adapter.ingest_paged_data, cache_key, param, data, page_ids
+                ),
+            )
+            # Don't read from the cache on the ingestion queue's writer thread.
+            ingested.add_done_callback(
+                lambda f: AdapterManager.executor.submit(read_from_cache, f)
+            )
+
+        result: Result = AdapterManager._create_ground_truth_result(
+            function_name,
+            *params,
+            before_download=before_download,
+            partial_data=partial_data,
+            on_page=on_page,
+            **kwargs,
+        )
+        result.add_done_callback(on_received)
+
+        def on_cancel():
+            result.cancel()
+
+        return Result(future, on_cancel=on_cancel)
+
+    @staticmethod
+    def _cache_expiry(
+        cache_key: Optional[CachingAdapter.CachedDataKey],
+        param: Optional[Union[str, AlbumSearchQuery]],
+    ) -> datetime:
+        """
+        Get the time that the cached data for ``cache_key`` and ``param`` expires
+        (``datetime.max`` if it never does). This may query the caching adapter, so it
+        should only be called on the cache read pool.
+        """
+        assert AdapterManager._instance
+        instance = AdapterManager._instance
+        if (
+            cache_key is None
+            or (ttl := CACHE_TTLS.get(cache_key)) is None
+            or not instance.caching_adapter
+        ):
+            return datetime.max
+
+        # The expiry time is remembered until the cached data is written so that the
+        # caching adapter doesn't need to be queried on every read.
+        param_str = param.strhash() if isinstance(param, AlbumSearchQuery) else param
+        with instance.refresh_lock:
+            expires_at = instance.cache_expirations.get((cache_key, param_str))
+        if expires_at is None:
+            ingestion_time = instance.caching_adapter.get_last_ingestion_time(
+                cache_key, param_str
+            )
+            expires_at = ingestion_time + ttl if ingestion_time else datetime.max
+            with instance.refresh_lock:
+                instance.cache_expirations[(cache_key, param_str)] = expires_at
+        return expires_at
+
+    @staticmethod
+    def _refresh_if_expired(
+        function_name: str,
+        param: Optional[Union[str, AlbumSearchQuery]],
+        request_key: Optional[Tuple[Any, ...]],
+        cache_key: Optional[CachingAdapter.CachedDataKey],
+        kwargs: Dict[str, Any],
+        expires_at: datetime,
+    ):
+        """
+        If the cached data for the given request has expired (at ``expires_at``),
+        refresh it from the ground truth adapter in the background. The caller is
+        notified via the ``on_cache_refreshed`` callback once the new data has been
+        ingested.
+        """
+        assert AdapterManager._instance
+        instance = AdapterManager._instance
+        now = datetime.now()
+        if (
+            now < expires_at
+            or request_key is None
+            or cache_key is None
+            or not instance.caching_adapter
+            or AdapterManager._offline_mode
+            or not AdapterManager._ground_truth_can_do(function_name)
+        ):
+            return
+
+        with instance.refresh_lock:
+            last_attempt = instance.refresh_attempts.get(request_key)
+            if (
+                instance.active_refreshes >= MAX_BACKGROUND_REFRESHES
+                or last_attempt
+                and now - last_attempt < BACKGROUND_REFRESH_RETRY_INTERVAL
+            ):
+                return
+            instance.refresh_attempts[request_key] = now
+            instance.active_refreshes += 1
+
+        logging.info(f"{request_key} expired. Refreshing in the background.")
+        result = AdapterManager._create_shared_ground_truth_result(
+            function_name, param, request_key, cache_key, None, None, None, kwargs
+        )
+
+        def on_refresh_done(f: Future):
+            with instance.refresh_lock:
+                instance.active_refreshes -= 1
+            if f.cancelled() or f.exception() is not None:
+                logging.warning(f"Background refresh of {request_key} failed.")
+                return
+            if instance.on_cache_refreshed:
+                instance.on_cache_refreshed(cache_key, request_key[1])
+
+        result.add_done_callback(on_refresh_done)
+
+    @staticmethod
+    def _request_key(
+        function_name: str, param: Optional[str], kwargs: Dict[str, Any]
+    ) -> Optional[Tuple[Any, ...]]:
+        """
+        Get the key which identifies identical requests, or ``None`` if the request
+        can't be identified (because one of its arguments is not hashable).
+        """
+        key = (function_name, param, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @staticmethod
+    def _join_request_flight(
+        flight_key: Tuple[Any, ...],
+        create_result: Callable[[_PageStream], Result],
+        before_download: Optional[Callable[[], None]],
+        on_page: Optional[Callable[[Sequence[Any]], None]] = None,
+    ) -> Result:
+        """
+        Join the in-flight request identified by ``flight_key``, or start it using
+        ``create_result`` if there is no such request. All of the callers share the
+        single request to the ground truth adapter and the single ingestion of its data
+        into the caching adapter. Each caller's ``on_page`` gets all of the pages of the
+        request, including the ones received before it joined.
+        """
+        with AdapterManager.request_flights_lock:
+            flight = AdapterManager._request_flights.get(flight_key)
+            joined = flight is not None
+            if flight is None:
+                pages = _PageStream()
+                flight = _RequestFlight(create_result(pages), pages)
+                AdapterManager._request_flights[flight_key] = flight
+            flight.waiters += 1
+
+        if on_page:
+            flight.pages.subscribe(on_page)
+
+        if joined:
+            logging.info(f"{flight_key} already in flight. Joining the request.")
+            if before_download:
+                before_download()
+        else:
+
+            def on_flight_done(_: Future):
+                with AdapterManager.request_flights_lock:
+                    if AdapterManager._request_flights.get(flight_key) is flight:
+                        del AdapterManager._request_flights[flight_key]
+
+            flight.result.add_done_callback(on_flight_done)
+
+        # The waiter is resolved by a done callback which is added after the caching
+        # adapter's ingestion callback, so the data is in the cache by the time that any
+        # of the callers see it.
+        assert flight.result._future
+        waiter = _create_waiter(flight.result._future)
+        waiter_released = False
+
+        def on_request_cancel():
+            nonlocal waiter_released
+            with AdapterManager.request_flights_lock:
+                if waiter_released:
+                    return
+                waiter_released = True
+                flight.waiters -= 1
+                if flight.waiters > 0:
+                    return
+            flight.result.cancel()
+
+        return Result(waiter, on_cancel=on_request_cancel)
 
     # Usage and Availability Properties
     # ==================================================================================
@@ -741,13 +1742,13 @@ class AdapterManager:
             assert AdapterManager._instance
             assert AdapterManager._instance.caching_adapter
             if playlist := f.result():
-                AdapterManager._instance.caching_adapter.ingest_new_data(
+                AdapterManager._ingest_new_data(
                     CachingAdapter.CachedDataKey.PLAYLIST_DETAILS,
                     playlist.id,
                     playlist,
                 )
             else:
-                AdapterManager._instance.caching_adapter.invalidate_data(
+                AdapterManager._invalidate_data(
                     CachingAdapter.CachedDataKey.PLAYLISTS, None
                 )
 
@@ -795,7 +1796,7 @@ class AdapterManager:
         ground_truth_adapter.delete_playlist(playlist_id)
 
         if AdapterManager._instance.caching_adapter:
-            AdapterManager._instance.caching_adapter.delete_data(
+            AdapterManager._delete_data(
                 CachingAdapter.CachedDataKey.PLAYLIST_DETAILS, playlist_id
             )
 
@@ -841,11 +1842,16 @@ class AdapterManager:
             "http" in supported_schemes or "https" in supported_schemes
         ):
             if AdapterManager._can_use_cache(force, "get_cover_art_uri"):
-                assert AdapterManager._instance.caching_adapter
+                assert (caching_adapter := AdapterManager._instance.caching_adapter)
                 try:
                     return Result(
-                        AdapterManager._instance.caching_adapter.get_cover_art_uri(
-                            cover_art_id, "file", size=size
+                        AdapterManager._read_cached_file(
+                            partial(
+                                caching_adapter.get_cover_art_uri,
+                                cover_art_id,
+                                "file",
+                                size=size,
+                            )
                         )
                     )
                 except CacheMissError as e:
@@ -859,7 +1865,7 @@ class AdapterManager:
 
             # If we are forcing, invalidate the existing cached data.
             if AdapterManager._instance.caching_adapter and force:
-                AdapterManager._instance.caching_adapter.invalidate_data(
+                AdapterManager._invalidate_data(
                     CachingAdapter.CachedDataKey.COVER_ART_FILE, cover_art_id
                 )
 
@@ -881,11 +1887,20 @@ class AdapterManager:
                 default_value=existing_filename,
             )
 
-            if AdapterManager._instance.caching_adapter:
-                future.add_done_callback(
-                    AdapterManager._create_caching_done_callback(
-                        CachingAdapter.CachedDataKey.COVER_ART_FILE, cover_art_id
-                    )
+            if caching_adapter := AdapterManager._instance.caching_adapter:
+                # The download is deleted once it's in the cache, so resolve to the
+                # cached file instead.
+                future = AdapterManager._create_cached_download_result(
+                    future,
+                    CachingAdapter.CachedDataKey.COVER_ART_FILE,
+                    cover_art_id,
+                    partial(
+                        caching_adapter.get_cover_art_uri,
+                        cover_art_id,
+                        "file",
+                        size=size,
+                    ),
+                    default_value=existing_filename,
                 )
 
             return future
@@ -902,7 +1917,9 @@ class AdapterManager:
                 if "file" not in caching_adapter.supported_schemes:
                     raise Exception("file not a supported scheme")
 
-                return caching_adapter.get_song_file_uri(song.id, "file")
+                return AdapterManager._read_cached_file(
+                    partial(caching_adapter.get_song_file_uri, song.id, "file")
+                )
             except CacheMissError as e:
                 if e.partial_data is not None:
                     cached_song_filename = cast(str, e.partial_data)
@@ -936,6 +1953,7 @@ class AdapterManager:
         on_song_download_complete: Callable[[str], None],
         one_at_a_time: bool = False,
         delay: float = 0.0,
+        priority: DownloadPriority = DownloadPriority.BATCH,
     ) -> Result[None]:
         assert AdapterManager._instance
         if (
@@ -953,7 +1971,29 @@ class AdapterManager:
         cancelled = False
         AdapterManager._cancelled_song_ids -= set(song_ids)
 
-        def do_download_song(song_id: str) -> Result:
+        # Each batch is its own job in the download scheduler so that the download
+        # slots are shared fairly with the other batches of the same priority.
+        job_id = object()
+        remaining_song_ids = iter(song_ids)
+
+        def schedule_next_song():
+            assert AdapterManager._instance
+            if (song_id := next(remaining_song_ids, None)) is None:
+                return
+            AdapterManager._instance.download_scheduler.submit(
+                job_id,
+                priority,
+                lambda release: AdapterManager.download_executor.submit(
+                    do_download_song, song_id, release
+                ),
+            )
+
+        def on_song_finished(release: Callable[[], None]):
+            release()
+            if one_at_a_time:
+                schedule_next_song()
+
+        def do_download_song(song_id: str, release: Callable[[], None]):
             assert AdapterManager._instance
             assert AdapterManager._instance.caching_adapter
 
@@ -963,29 +2003,33 @@ class AdapterManager:
                 or cancelled
                 or song_id in AdapterManager._cancelled_song_ids
             ):
-                AdapterManager._instance.download_limiter_semaphore.release()
+                on_song_finished(release)
                 AdapterManager._instance.song_download_progress(
                     song_id,
                     DownloadProgress(DownloadProgress.Type.CANCELLED),
                 )
-                return Result("", is_download=True)
+                return
 
             logging.info(f"Downloading {song_id}")
 
             # Download the actual song file.
             try:
                 # If the song file is already cached, just indicate done immediately.
+                AdapterManager._flush_cache_writes()
                 AdapterManager._instance.caching_adapter.get_song_file_uri(
                     song_id, "file"
                 )
-                AdapterManager._instance.download_limiter_semaphore.release()
+                on_song_finished(release)
                 AdapterManager._instance.song_download_progress(
                     song_id,
                     DownloadProgress(DownloadProgress.Type.DONE),
                 )
-                return Result("", is_download=True)
+                return
             except CacheMissError:
                 # The song is not already cached.
+                pass
+
+            try:
                 if before_download:
                     before_download(song_id)
 
@@ -1002,27 +2046,38 @@ class AdapterManager:
                     lambda: before_download(song_id),
                     expected_size=song.size,
                 )
+            except Exception as e:
+                logging.exception(f"Failed to start the download of {song_id}")
+                on_song_finished(release)
+                AdapterManager._instance.song_download_progress(
+                    song_id,
+                    DownloadProgress(DownloadProgress.Type.ERROR, exception=e),
+                )
+                return
 
-                def on_download_done(f: Result):
-                    assert AdapterManager._instance
-                    assert AdapterManager._instance.caching_adapter
-                    AdapterManager._instance.download_limiter_semaphore.release()
+            def on_download_done(f: Result):
+                assert AdapterManager._instance
+                assert AdapterManager._instance.caching_adapter
+                on_song_finished(release)
+                if AdapterManager._song_download_jobs.get(song_id):
+                    del AdapterManager._song_download_jobs[song_id]
 
-                    try:
-                        AdapterManager._instance.caching_adapter.ingest_new_data(
-                            CachingAdapter.CachedDataKey.SONG_FILE,
-                            song_id,
-                            (None, f.result(), None),
-                        )
-                    finally:
-                        if AdapterManager._song_download_jobs.get(song_id):
-                            del AdapterManager._song_download_jobs[song_id]
+                try:
+                    filename = f.result()
+                except Exception:
+                    on_song_download_complete(song_id)
+                    raise
 
-                        on_song_download_complete(song_id)
+                # The song's cached status only changes once the file is in the cache.
+                AdapterManager._ingest_download(
+                    CachingAdapter.CachedDataKey.SONG_FILE,
+                    song_id,
+                    filename,
+                    (None, filename, None),
+                ).add_done_callback(lambda _: on_song_download_complete(song_id))
 
-                song_tmp_filename_result.add_done_callback(on_download_done)
-                AdapterManager._song_download_jobs[song_id] = song_tmp_filename_result
-                return song_tmp_filename_result
+            song_tmp_filename_result.add_done_callback(on_download_done)
+            AdapterManager._song_download_jobs[song_id] = song_tmp_filename_result
 
         def do_batch_download_songs():
             sleep(delay)
@@ -1041,20 +2096,15 @@ class AdapterManager:
                     DownloadProgress(DownloadProgress.Type.QUEUED),
                 )
 
-            for song_id in song_ids:
-                # Only allow a certain number of songs to be downloaded
-                # simultaneously.
-                AdapterManager._instance.download_limiter_semaphore.acquire()
-
-                result = do_download_song(song_id)
-
-                if one_at_a_time:
-                    # Wait the file to download.
-                    result.result()
+            # If only one song should be downloaded at a time, the next song is
+            # scheduled once the previous one finishes.
+            for _ in range(1 if one_at_a_time else len(song_ids)):
+                schedule_next_song()
 
         def on_cancel():
             nonlocal cancelled
             cancelled = True
+            AdapterManager._instance.download_scheduler.cancel_job(job_id)
 
             # Cancel the individual song downloads
             AdapterManager.cancel_download_songs(song_ids)
@@ -1068,6 +2118,49 @@ class AdapterManager:
 
         return Result(do_batch_download_songs, is_download=True, on_cancel=on_cancel)
 
+    @staticmethod
+    def get_download_queue_stats() -> DownloadQueueStats:
+        """
+        Get the number of running and queued song downloads and how long the downloads
+        have waited for a download slot.
+        """
+        assert AdapterManager._instance
+        return AdapterManager._instance.download_scheduler.stats()
+
+    @staticmethod
+    def get_ingestion_queue_stats() -> Optional[IngestionQueueStats]:
+        """
+        Get the number of writes waiting to be written to the caching adapter and how
+        long it has taken to write them, or ``None`` if there is no caching adapter.
+        """
+        assert AdapterManager._instance
+        if not AdapterManager._instance.ingestion_queue:
+            return None
+        return AdapterManager._instance.ingestion_queue.stats()
+
+    @staticmethod
+    def get_http_pool_stats() -> Optional[HTTPPoolStats]:
+        """
+        Get how many connections the ground truth adapter has opened to the server and
+        how often they have been reused, or ``None`` if the adapter doesn't have an HTTP
+        session.
+        """
+        assert AdapterManager._instance
+        session = AdapterManager._instance.ground_truth_adapter.http_session
+        return session.stats() if session else None
+
+    @staticmethod
+    def get_rate_limit_stats() -> Optional[Dict[str, RateLimitStats]]:
+        """
+        Get the state of the request budget of each endpoint class of the ground truth
+        adapter, or ``None`` if its requests aren't rate limited.
+        """
+        assert AdapterManager._instance
+        session = AdapterManager._instance.ground_truth_adapter.http_session
+        if session is None or session.rate_limiter is None:
+            return None
+        return session.rate_limiter.stats()
+
     @staticmethod
     def cancel_download_songs(song_ids: Sequence[str]):
         assert AdapterManager._instance
@@ -1106,13 +2199,15 @@ class AdapterManager:
         if not AdapterManager._instance.caching_adapter:
             return
 
-        for song_id in song_ids:
-            song = AdapterManager.get_song_details(song_id).result()
-            AdapterManager._instance.caching_adapter.delete_data(
-                CachingAdapter.CachedDataKey.SONG_FILE, song.id
-            )
+        def on_deleted(song_id: str, _: Future):
             on_song_delete(song_id)
 
+        # The song's cached status only changes once the file is deleted.
+        for song in AdapterManager.get_songs_details(song_ids).result():
+            AdapterManager._delete_data(
+                CachingAdapter.CachedDataKey.SONG_FILE, song.id
+            ).add_done_callback(partial(on_deleted, song.id))
+
     @staticmethod
     def get_song_details(
         song_id: str,
@@ -1129,6 +2224,101 @@ class AdapterManager:
             cache_key=CachingAdapter.CachedDataKey.SONG,
         )
 
+    @staticmethod
+    def get_songs_details(
+        song_ids: Sequence[str], allow_download: bool = True
+    ) -> Result[List[Song]]:
+        """
+        Get the details of multiple songs. All of the songs that are in the cache are
+        loaded at once, and the rest are requested from the ground truth adapter, at
+        most :class:`SONG_DETAILS_CONCURRENCY` at a time.
+
+        :param song_ids: the IDs of the songs to get the details for.
+        :param allow_download: whether or not to allow network requests for the songs
+            that aren't in the cache.
+        :returns: a :class:`Result` which resolves to the songs in the same order as
+            ``song_ids``. If any of the songs can't be retrieved, the :class:`Result`
+            raises the error from retrieving that song.
+        """
+        assert AdapterManager._instance
+        unique_ids = list(dict.fromkeys(song_ids))
+        songs: Dict[str, Song] = {}
+
+        # While there are queued writes, all of the songs are read by
+        # get_song_details, which waits for the writes on the cache read pool.
+        if (
+            AdapterManager._can_use_cache(False, "get_song_details")
+            and not AdapterManager._cache_writes_pending()
+        ):
+            assert (caching_adapter := AdapterManager._instance.caching_adapter)
+            object_cache = AdapterManager._instance.object_cache
+            cache_keys = {
+                song_id: AdapterManager._request_key("get_song_details", song_id, {})
+                for song_id in unique_ids
+            }
+            for song_id, cache_key in cache_keys.items():
+                if (song := object_cache.get(cache_key)) is not None:
+                    songs[song_id] = song
+
+            generation = object_cache.generation
+            try:
+                cached_songs = caching_adapter.get_songs_details(
+                    [song_id for song_id in unique_ids if song_id not in songs]
+                )
+            except Exception:
+                logging.exception("Error on get_songs_details retrieving from cache.")
+                cached_songs = {}
+            for song_id, song in cached_songs.items():
+                songs[song_id] = object_cache.put(
+                    cache_keys[song_id],
+                    song,
+                    generation,
+                    eager_fields=AdapterManager._OBJECT_CACHE_FUNCTIONS[
+                        "get_song_details"
+                    ],
+                )
+
+        missing_ids = [song_id for song_id in unique_ids if song_id not in songs]
+        if not missing_ids:
+            return Result([songs[song_id] for song_id in song_ids])
+
+        # Request the rest of the songs. Every time a request finishes, the next one is
+        # started, so that only a limited number of requests are in flight at once.
+        future: Future = Future()
+        lock = threading.Lock()
+        remaining_ids = iter(missing_ids)
+        outstanding = len(missing_ids)
+
+        def request_next_song():
+            with lock:
+                song_id = next(remaining_ids, None)
+            if song_id is None or future.done():
+                return
+            AdapterManager.get_song_details(
+                song_id, allow_download=allow_download
+            ).add_done_callback(partial(on_song_done, song_id))
+
+        def on_song_done(song_id: str, f: Union[Future, Result]):
+            nonlocal outstanding
+            with lock:
+                if future.done():
+                    return
+                try:
+                    songs[song_id] = f.result()
+                except Exception as e:
+                    future.set_exception(e)
+                    return
+                outstanding -= 1
+                if outstanding == 0:
+                    future.set_result([songs[song_id] for song_id in song_ids])
+                    return
+            request_next_song()
+
+        for _ in range(min(SONG_DETAILS_CONCURRENCY, len(missing_ids))):
+            request_next_song()
+
+        return Result(future)
+
     @staticmethod
     def get_genres(force: bool = False) -> Result[Sequence[Genre]]:
         return AdapterManager._get_from_cache_or_ground_truth(
@@ -1220,7 +2410,7 @@ class AdapterManager:
             assert AdapterManager._instance.caching_adapter
             if artist := f.result():
                 for album in artist.albums or []:
-                    AdapterManager._instance.caching_adapter.invalidate_data(
+                    AdapterManager._invalidate_data(
                         CachingAdapter.CachedDataKey.ALBUM, album.id
                     )
 
@@ -1240,7 +2430,16 @@ class AdapterManager:
         sort_direction: str = "ascending",
         before_download: Callable[[], None] = lambda: None,
         use_ground_truth_adapter: bool = False,
+        on_page: Optional[Callable[[Sequence[Album]], None]] = None,
     ) -> Result[Sequence[Album]]:
+        """
+        Get all of the albums that match the query.
+
+        :param on_page: called (on a background thread) with each page of albums, in
+            order, as they are received from the ground truth adapter, so that the
+            first albums can be shown before the rest have loaded. It isn't called if
+            the albums come from the cache, since they are all available at once.
+        """
         return AdapterManager._get_from_cache_or_ground_truth(
             "get_albums",
             query,
@@ -1248,6 +2447,7 @@ class AdapterManager:
             cache_key=CachingAdapter.CachedDataKey.ALBUMS,
             before_download=before_download,
             use_ground_truth_adapter=use_ground_truth_adapter,
+            on_page=on_page,
         )
 
     @staticmethod
@@ -1343,6 +2543,7 @@ class AdapterManager:
             search_result = SearchResult(query)
             if AdapterManager._can_use_cache(False, "search"):
                 assert AdapterManager._instance.caching_adapter
+                AdapterManager._flush_cache_writes()
                 try:
                     logging.info(
                         f"Returning caching adapter search results for '{query}'."
@@ -1380,7 +2581,7 @@ class AdapterManager:
                 )
 
             if AdapterManager._instance.caching_adapter:
-                AdapterManager._instance.caching_adapter.ingest_new_data(
+                AdapterManager._ingest_new_data(
                     CachingAdapter.CachedDataKey.SEARCH_RESULTS,
                     None,
                     ground_truth_search_results,
@@ -1404,6 +2605,9 @@ class AdapterManager:
         if not AdapterManager._instance.caching_adapter:
             return list(itertools.repeat(SongCacheStatus.NOT_CACHED, len(song_ids)))
 
+        # This is called on the main thread, so it doesn't wait for the queued writes.
+        # The download and delete callbacks are only called once the writes are done,
+        # so the statuses are refreshed then.
         cached_statuses = AdapterManager._instance.caching_adapter.get_cached_statuses(
             song_ids
         )
@@ -1422,15 +2626,11 @@ class AdapterManager:
         assert AdapterManager._instance
         if not AdapterManager._instance.caching_adapter:
             return
-        AdapterManager._instance.caching_adapter.delete_data(
-            CachingAdapter.CachedDataKey.ALL_SONGS, None
-        )
+        AdapterManager._delete_data(CachingAdapter.CachedDataKey.ALL_SONGS, None)
 
     @staticmethod
     def clear_entire_cache():
         assert AdapterManager._instance
         if not AdapterManager._instance.caching_adapter:
             return
-        AdapterManager._instance.caching_adapter.delete_data(
-            CachingAdapter.CachedDataKey.EVERYTHING, None
-        )
+        AdapterManager._delete_data(CachingAdapter.CachedDataKey.EVERYTHING, None)
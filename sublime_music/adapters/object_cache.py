@@ -0,0 +1,220 @@
+"""
+Defines the in-memory cache of objects returned by the caching adapter.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Collection, Dict, Iterable, Optional, Set, Tuple
+
+_SCALAR_TYPES = (str, bytes, int, float, bool, datetime, timedelta, Enum)
+
+# The value, estimated size, and expiry time of a cached object.
+_Entry = Tuple[Any, int, Optional[datetime]]
+
+
+class HydratedObject:
+    """
+    An immutable snapshot of an object returned by the caching adapter. Each attribute
+    is read from the underlying object the first time it is accessed, and is then
+    remembered, so related objects (which are lazily loaded from the database by the
+    filesystem adapter) are only ever loaded once.
+    """
+
+    __slots__ = ("_source", "_values")
+
+    def __init__(self, source: Any):
+        object.__setattr__(self, "_source", source)
+        object.__setattr__(self, "_values", {})
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        values = object.__getattribute__(self, "_values")
+        if name not in values:
+            values[name] = hydrate(getattr(self._source, name))
+        return values[name]
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"Cannot set {name}. Hydrated objects are immutable.")
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, HydratedObject):
+            other = other._source
+        return self._source == other
+
+    def __hash__(self) -> int:
+        return hash(self._source)
+
+    def __repr__(self) -> str:
+        return f"<HydratedObject {self._source!r}>"
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (HydratedObject, (self._source,))
+
+
+def hydrate(value: Any) -> Any:
+    """
+    Convert ``value`` into an immutable version of itself. Objects are wrapped in a
+    :class:`HydratedObject` and sequences are converted to tuples.
+    """
+    if value is None or isinstance(value, (HydratedObject, *_SCALAR_TYPES)):
+        return value
+    if isinstance(value, (set, frozenset)):
+        return frozenset(map(hydrate, value))
+    if isinstance(value, dict) or callable(value):
+        return value
+    if hasattr(value, "__iter__"):
+        return tuple(map(hydrate, value))
+    return HydratedObject(value)
+
+
+def _estimate_size(value: Any, seen: Set[int]) -> int:
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, HydratedObject):
+        values = object.__getattribute__(value, "_values")
+        return (
+            sys.getsizeof(value)
+            + _estimate_size(object.__getattribute__(value, "_source"), seen)
+            + sum(_estimate_size(v, seen) for v in values.values())
+        )
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(_estimate_size(v, seen) for v in value)
+    elif hasattr(value, "__dict__"):
+        # Only go one level into the attributes of other objects. This counts the
+        # field values of database models without following their relations.
+        for attribute in vars(value).values():
+            size += sys.getsizeof(attribute)
+            if isinstance(attribute, dict):
+                size += sum(map(sys.getsizeof, attribute.values()))
+    return size
+
+
+class ObjectCache:
+    """
+    An LRU cache of :class:`HydratedObject` instances (and tuples of them) with a
+    memory budget. The sizes of the cached objects are approximations computed when
+    the objects are added to the cache.
+
+    The cache keeps a generation counter which is incremented every time the cache is
+    invalidated. Data that was read before an invalidation is not added to the cache
+    because it may already be stale.
+
+    Each entry can also remember when its data expires, so that checking whether a
+    cached object needs to be refreshed doesn't need to query the caching adapter.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        :param max_size: the maximum size of the cache in bytes.
+        """
+        self.max_size = max_size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Any, ...], _Entry]" = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Any]:
+        return self.get_with_expiry(key)[0]
+
+    def get_with_expiry(
+        self, key: Tuple[Any, ...]
+    ) -> Tuple[Optional[Any], Optional[datetime]]:
+        """
+        Get the value stored under ``key`` and the time that it expires. Either may be
+        ``None`` if the value isn't cached or its expiry time wasn't given.
+        """
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def put(
+        self,
+        key: Tuple[Any, ...],
+        value: Any,
+        generation: int,
+        eager_fields: Iterable[str] = (),
+        expires_at: Optional[datetime] = None,
+    ) -> Any:
+        """
+        Hydrate ``value`` and add it to the cache.
+
+        :param key: the key to store the value under.
+        :param value: the value to cache.
+        :param generation: the value of :class:`generation` from before the value was
+            read.
+        :param eager_fields: the attributes of ``value`` to load immediately instead of
+            on first access.
+        :param expires_at: the time that the data in ``value`` expires, if known.
+        :returns: the hydrated value.
+        """
+        hydrated = hydrate(value)
+        for field_name in eager_fields:
+            try:
+                getattr(hydrated, field_name)
+            except Exception:
+                pass
+
+        size = _estimate_size(hydrated, set())
+        with self._lock:
+            if generation != self.generation or size > self.max_size:
+                return hydrated
+
+            if (old_entry := self._entries.pop(key, None)) is not None:
+                self._size -= old_entry[1]
+
+            while self._entries and self._size + size > self.max_size:
+                evicted_key, (_, evicted_size, _) = self._entries.popitem(last=False)
+                logging.debug(f"Evicting {evicted_key} from the object cache.")
+                self._size -= evicted_size
+
+            self._entries[key] = (hydrated, size, expires_at)
+            self._size += size
+        return hydrated
+
+    def invalidate(self, function_names: Optional[Collection[str]] = None):
+        """
+        Remove entries from the cache.
+
+        :param function_names: if specified, only remove the entries which were stored
+            for these functions. Otherwise, remove everything.
+        """
+        with self._lock:
+            self.generation += 1
+            if function_names is None:
+                self._entries.clear()
+                self._size = 0
+                return
+
+            for key in [k for k in self._entries if k[0] in function_names]:
+                self._size -= self._entries.pop(key)[1]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,253 @@
+"""
+Defines the client-side rate limiting of the requests to a server.
+"""
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Dict, Iterator, Optional
+
+
+@dataclass(frozen=True)
+class EndpointClass:
+    """
+    The request budget of a class of endpoints.
+
+    **Fields:**
+
+    * :class:`EndpointClass.rate` -- the number of requests per second that can be
+      started, on average
+    * :class:`EndpointClass.burst` -- the number of requests that can be started at
+      once after the endpoints have been idle
+    * :class:`EndpointClass.max_concurrency` -- the most requests that can ever be in
+      flight at once
+    * :class:`EndpointClass.initial_concurrency` -- the number of requests that can be
+      in flight at once before the limit has adapted to the server
+    * :class:`EndpointClass.target_latency` -- the response time (in seconds) above
+      which the server is considered to be overloaded
+    """
+
+    rate: float
+    burst: int
+    max_concurrency: int
+    initial_concurrency: int = 2
+    target_latency: float = 2.0
+
+
+@dataclass
+class RateLimitStats:
+    """
+    A snapshot of the budget of one class of endpoints in a :class:`RateLimiter`.
+
+    **Fields:**
+
+    * :class:`RateLimitStats.concurrency_limit` -- the number of requests that can
+      currently be in flight at once
+    * :class:`RateLimitStats.in_flight` -- the number of requests that are in flight
+    * :class:`RateLimitStats.waiting` -- the number of requests that are waiting to be
+      started
+    * :class:`RateLimitStats.requests` -- the number of requests that have finished
+    * :class:`RateLimitStats.overloaded` -- the number of requests that failed, were
+      throttled by the server, or were slower than the target latency
+    * :class:`RateLimitStats.mean_latency` -- the average time (in seconds) that the
+      server took to respond
+    * :class:`RateLimitStats.mean_wait` -- the average time (in seconds) that requests
+      waited to be started
+    """
+
+    concurrency_limit: float
+    in_flight: int
+    waiting: int
+    requests: int
+    overloaded: int
+    mean_latency: float
+    mean_wait: float
+
+
+@dataclass
+class RequestPermit:
+    """
+    Permission to make a single request. The outcome of the request should be recorded
+    on the permit so that the concurrency limit can adapt to it.
+    """
+
+    started_at: float
+    failed: bool = False
+    status_code: Optional[int] = None
+    retry_after: Optional[float] = None
+
+    def record_response(self, status_code: int, retry_after: Optional[str] = None):
+        """
+        :param status_code: the HTTP status code of the response.
+        :param retry_after: the ``Retry-After`` header of the response, if any.
+        """
+        self.status_code = status_code
+        if retry_after:
+            try:
+                self.retry_after = float(retry_after)
+            except ValueError:
+                # Dates aren't supported. The backoff is enough in that case.
+                pass
+
+
+class _Budget:
+    """
+    A token bucket, which limits the rate that requests are started, combined with a
+    concurrency window, which limits the number of requests in flight.
+
+    The window adapts to the server with AIMD (additive increase, multiplicative
+    decrease): every successful response grows the window by about one request per
+    window of responses, and a failed, throttled, or slow response halves it.
+    """
+
+    def __init__(self, endpoint_class: EndpointClass):
+        self.endpoint_class = endpoint_class
+        self._condition = threading.Condition()
+        self._tokens = float(endpoint_class.burst)
+        self._refilled_at = monotonic()
+        self._limit = float(
+            min(endpoint_class.initial_concurrency, endpoint_class.max_concurrency)
+        )
+        self._decreased_at = 0.0
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+
+        self._requests = 0
+        self._overloaded = 0
+        self._latency_total = 0.0
+        self._started = 0
+        self._wait_total = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self._tokens + (now - self._refilled_at) * self.endpoint_class.rate,
+            float(self.endpoint_class.burst),
+        )
+        self._refilled_at = now
+
+    def acquire(self) -> RequestPermit:
+        """Wait until a request can be started."""
+        with self._condition:
+            enqueued_at = monotonic()
+            self._waiting += 1
+            try:
+                while True:
+                    now = monotonic()
+                    self._refill(now)
+                    timeout: Optional[float] = None
+                    if now < self._paused_until:
+                        timeout = self._paused_until - now
+                    elif self._in_flight < int(self._limit):
+                        if self._tokens >= 1:
+                            break
+                        timeout = (1 - self._tokens) / self.endpoint_class.rate
+                    # Otherwise, wait for a request to finish.
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting -= 1
+
+            self._tokens -= 1
+            self._in_flight += 1
+            self._started += 1
+            self._wait_total += now - enqueued_at
+            return RequestPermit(started_at=now)
+
+    def release(self, permit: RequestPermit):
+        """Finish the request of ``permit``, and adapt the window to its outcome."""
+        now = monotonic()
+        latency = now - permit.started_at
+        status = permit.status_code or 0
+        overloaded = (
+            permit.failed
+            or status == 429
+            or status >= 500
+            or latency > self.endpoint_class.target_latency
+        )
+
+        with self._condition:
+            self._in_flight -= 1
+            self._requests += 1
+            self._latency_total += latency
+            if overloaded:
+                self._overloaded += 1
+                # Only the requests that were started after the last decrease can
+                # decrease the window again, so that a burst of failures (which all
+                # happened because of the same window) only halves it once.
+                if permit.started_at >= self._decreased_at:
+                    self._limit = max(self._limit / 2, 1.0)
+                    self._decreased_at = now
+            else:
+                self._limit = min(
+                    self._limit + 1 / self._limit,
+                    float(self.endpoint_class.max_concurrency),
+                )
+
+            if permit.retry_after:
+                self._paused_until = max(self._paused_until, now + permit.retry_after)
+            self._condition.notify_all()
+
+    def stats(self) -> RateLimitStats:
+        with self._condition:
+            return RateLimitStats(
+                concurrency_limit=self._limit,
+                in_flight=self._in_flight,
+                waiting=self._waiting,
+                requests=self._requests,
+                overloaded=self._overloaded,
+                mean_latency=(
+                    self._latency_total / self._requests if self._requests else 0
+                ),
+                mean_wait=self._wait_total / self._started if self._started else 0,
+            )
+
+
+class RateLimiter:
+    """
+    Limits the rate and the concurrency of the requests to a server, so that a burst of
+    requests (for example, from scrolling through the albums) doesn't overwhelm a small
+    server.
+
+    Each endpoint class has its own budget (see :class:`_Budget`), so that the
+    latency-sensitive requests never wait behind a burst of other requests.
+    """
+
+    def __init__(
+        self,
+        endpoint_classes: Dict[str, EndpointClass],
+        classify: Callable[[str], str],
+    ):
+        """
+        :param endpoint_classes: the budget of each endpoint class, by name.
+        :param classify: returns the name of the endpoint class of a URL.
+        """
+        self.endpoint_classes = endpoint_classes
+        self.classify = classify
+        self.reset()
+
+    def reset(self):
+        """Forget everything that has been learned about the server."""
+        self._budgets = {
+            name: _Budget(endpoint_class)
+            for name, endpoint_class in self.endpoint_classes.items()
+        }
+
+    @contextmanager
+    def request(self, url: str) -> Iterator[RequestPermit]:
+        """
+        Wait until a request to ``url`` can be made, and hold its place in the budget
+        until the context exits. If the context exits with an exception, the request
+        is considered to have failed.
+        """
+        budget = self._budgets[self.classify(url)]
+        permit = budget.acquire()
+        try:
+            yield permit
+        except Exception:
+            permit.failed = True
+            raise
+        finally:
+            budget.release(permit)
+
+    def stats(self) -> Dict[str, RateLimitStats]:
+        return {name: budget.stats() for name, budget in self._budgets.items()}
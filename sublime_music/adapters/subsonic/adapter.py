@@ -1,5 +1,5 @@
 import hashlib
-import json
+import itertools
 import logging
 import math
 import multiprocessing
@@ -8,14 +8,17 @@ import pickle
 import random
 import string
 import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
 from typing import (
     Any,
+    Callable,
     cast,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Sequence,
@@ -31,7 +34,9 @@ from gi.repository import Gtk
 
 from sublime_music.util import resolve_path
 
-from .api_objects import Directory, Response
+from .api_objects import ArtistAndArtistInfo, Directory, Playlist, Response, Song
+from .decoder import decode, decode_list, loads
+from .json_stream import JSONItemStream
 from .. import (
     Adapter,
     AlbumSearchQuery,
@@ -41,6 +46,8 @@ from .. import (
     ConfigureServerForm,
     UIInfo,
 )
+from ..http_session import PooledSession
+from ..rate_limiter import EndpointClass, RateLimiter
 
 try:
     import gi
@@ -66,6 +73,55 @@ NETWORK_ALWAYS_ERROR: bool = False
 if always_error := os.environ.get("NETWORK_ALWAYS_ERROR"):
     NETWORK_ALWAYS_ERROR = True
 
+# How long a salted authentication token is reused before a new salt is generated.
+AUTH_TOKEN_LIFETIME = timedelta(minutes=10)
+
+# The number of pages of albums that are requested at once.
+ALBUM_PAGE_CONCURRENCY = 4
+
+# Large responses are parsed as they are received, STREAM_CHUNK_SIZE bytes at a time,
+# and their entries are decoded in batches of STREAM_BATCH_SIZE.
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_BATCH_SIZE = 500
+
+# The request budget of each class of endpoints. The interactive endpoints (such as
+# getting the details of the song that is about to play, or saving the play queue) have
+# their own budget so that they never wait behind the requests that fill the browsing
+# views, and the media (song files and cover art) have theirs so that prefetching
+# doesn't slow down browsing.
+ENDPOINT_CLASSES = {
+    "interactive": EndpointClass(
+        rate=10, burst=10, max_concurrency=4, target_latency=1.0
+    ),
+    "browse": EndpointClass(
+        rate=20, burst=40, max_concurrency=8, initial_concurrency=4
+    ),
+    "media": EndpointClass(
+        rate=20, burst=50, max_concurrency=8, initial_concurrency=4, target_latency=5.0
+    ),
+}
+INTERACTIVE_ENDPOINTS = {
+    "createPlaylist",
+    "deletePlaylist",
+    "getPlayQueue",
+    "getSong",
+    "ping",
+    "savePlayQueue",
+    "scrobble",
+    "updatePlaylist",
+}
+MEDIA_ENDPOINTS = {"download", "getCoverArt", "stream"}
+
+
+def endpoint_class(url: str) -> str:
+    """Get the name of the budget in :class:`ENDPOINT_CLASSES` for a request."""
+    endpoint = urlparse(url).path.rsplit("/", 1)[-1].split(".")[0]
+    if endpoint in INTERACTIVE_ENDPOINTS:
+        return "interactive"
+    if endpoint in MEDIA_ENDPOINTS:
+        return "media"
+    return "browse"
+
 
 class ServerError(Exception):
     def __init__(self, status_code: int, message: str):
@@ -251,6 +307,12 @@ class SubsonicAdapter(Adapter):
         self.password = cast(str, config.get_secret("password"))
         self.verify_cert = config["verify_cert"]
         self.use_salt_auth = config["salt_auth"]
+        self._http_session = PooledSession(
+            verify=self.verify_cert,
+            rate_limiter=RateLimiter(ENDPOINT_CLASSES, endpoint_class),
+        )
+        self._auth_token: Optional[Tuple[str, str]] = None
+        self._auth_token_expiration = 0.0
 
         self.is_shutting_down = False
         self._ping_process: Optional[multiprocessing.Process] = None
@@ -266,6 +328,7 @@ class SubsonicAdapter(Adapter):
     def shutdown(self):
         if self._ping_process:
             self._ping_process.terminate()
+        self._http_session.close()
 
     # Availability Properties
     # ==================================================================================
@@ -308,6 +371,10 @@ class SubsonicAdapter(Adapter):
     def on_offline_mode_change(self, offline_mode: bool):
         self._offline_mode = offline_mode
 
+    @property
+    def http_session(self) -> PooledSession:
+        return self._http_session
+
     @property
     def ping_status(self) -> bool:
         return self._server_available.value
@@ -400,21 +467,28 @@ class SubsonicAdapter(Adapter):
         """
         Generates the necessary authentication data to call the Subsonic API See the
         Authentication section of www.subsonic.org/pages/api.jsp for more information
+
+        The salt and token are reused for :class:`AUTH_TOKEN_LIFETIME` rather than
+        being generated for every request.
         """
-        salt = "".join(random.choices(string.ascii_letters + string.digits, k=8))
-        token = hashlib.md5(f"{self.password}{salt}".encode()).hexdigest()
-        return (salt, token)
+        if self._auth_token is None or monotonic() >= self._auth_token_expiration:
+            salt = "".join(random.choices(string.ascii_letters + string.digits, k=8))
+            token = hashlib.md5(f"{self.password}{salt}".encode()).hexdigest()
+            self._auth_token = (salt, token)
+            self._auth_token_expiration = (
+                monotonic() + AUTH_TOKEN_LIFETIME.total_seconds()
+            )
+        return self._auth_token
 
     def _make_url(self, endpoint: str) -> str:
         return f"{self.hostname}/rest/{endpoint}.view"
 
-    # TODO (#196) figure out some way of rate limiting requests. They often come in too
-    # fast.
     def _get(
         self,
         url: str,
         timeout: Union[float, Tuple[float, float], None] = None,
         is_exponential_backoff_ping: bool = False,
+        stream: bool = False,
         **params,
     ) -> Any:
         params = {**self._get_params(), **params}
@@ -446,11 +520,12 @@ class SubsonicAdapter(Adapter):
                 result = self._get_mock_data()
             else:
                 if url.startswith("http://") or url.startswith("https://"):
-                    result = requests.get(
+                    result = self._http_session.get(
                         url,
                         params=params,
                         verify=self.verify_cert,
                         timeout=timeout,
+                        stream=stream,
                     )
                 else:
                     # if user creates a serverconf address w/o protocol, we'll
@@ -459,24 +534,28 @@ class SubsonicAdapter(Adapter):
                     # protocol isn't defined this might be able to be taken out
                     try:
                         logging.info("Hostname: %r has no protocol", self.hostname)
-                        result = requests.get(
+                        result = self._http_session.get(
                             "https://" + url,
                             params=params,
                             verify=self.verify_cert,
                             timeout=timeout,
+                            stream=stream,
                         )
                         self.hostname = "https://" + url.split("/")[0]
                     except Exception:
-                        result = requests.get(
+                        result = self._http_session.get(
                             "http://" + url,
                             params=params,
                             verify=self.verify_cert,
                             timeout=timeout,
+                            stream=stream,
                         )
 
                         self.hostname = "http://" + url.split("/")[0]
 
             if result.status_code != 200:
+                # Return the connection to the pool, even if the response is streamed.
+                result.close()
                 raise ServerError(
                     result.status_code, f"{url} returned status={result.status_code}."
                 )
@@ -513,10 +592,58 @@ class SubsonicAdapter(Adapter):
             url,
             timeout=timeout,
             is_exponential_backoff_ping=is_exponential_backoff_ping,
+            stream=False,
             **params,
         )
-        subsonic_response = result.json().get("subsonic-response")
+        subsonic_response = self._check_response(
+            url, loads(result.content).get("subsonic-response")
+        )
+        return decode(Response, subsonic_response)
 
+    def _stream_json(
+        self,
+        url: str,
+        prefix: str,
+        on_entries: Callable[[List[Dict[str, Any]]], None],
+        **params: Any,
+    ) -> Dict[str, Any]:
+        """
+        Make a get request to a *Sonic REST API, and parse the response as it is
+        received. This is for the requests that can return a huge list of entries (such
+        as all of the artists in the library), so that the whole response is never in
+        memory at once.
+
+        :param prefix: the path of the entries within the ``subsonic-response`` object
+            (see :class:`JSONItemStream`). For example, ``playlist.entry.item``.
+        :param on_entries: called with each batch of (at most
+            :class:`STREAM_BATCH_SIZE`) entries, in order, as they are parsed.
+        :returns: the rest of the subsonic response, without the entries.
+        """
+        result = self._get(url, stream=True, **params)
+        try:
+            entries = JSONItemStream(
+                result.iter_content(STREAM_CHUNK_SIZE), f"subsonic-response.{prefix}"
+            )
+            batch: List[Dict[str, Any]] = []
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) >= STREAM_BATCH_SIZE:
+                    on_entries(batch)
+                    batch = []
+            if batch:
+                on_entries(batch)
+        finally:
+            result.close()
+
+        return self._check_response(url, entries.document.get("subsonic-response"))
+
+    def _check_response(
+        self, url: str, subsonic_response: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Raise a :class:`ServerError` if the subsonic response is invalid or is an
+        ``<error>`` response.
+        """
         if not subsonic_response:
             raise ServerError(500, f"{url} returned invalid JSON.")
 
@@ -529,7 +656,7 @@ class SubsonicAdapter(Adapter):
         self._version.value = subsonic_response["version"].encode()
 
         logging.debug(f"Response from {url}: {subsonic_response}")
-        return Response.from_dict(subsonic_response)
+        return subsonic_response
 
     # Helper Methods for Testing
     _get_mock_data: Any = None
@@ -542,11 +669,17 @@ class SubsonicAdapter(Adapter):
             def __init__(self, content: Any):
                 self._content = content
 
+            @property
             def content(self) -> Any:
                 return self._content
 
-            def json(self) -> Any:
-                return json.loads(self._content)
+            def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+                content = self._content.encode()
+                for i in range(0, len(content), chunk_size):
+                    yield content[i : i + chunk_size]
+
+            def close(self):
+                pass
 
         def get_mock_data() -> Any:
             if type(data) == Exception:
@@ -568,10 +701,38 @@ class SubsonicAdapter(Adapter):
             return sorted(playlists.playlist, key=lambda p: p.name.lower())
         return []
 
-    def get_playlist_details(self, playlist_id: str) -> API.Playlist:
-        result = self._get_json(self._make_url("getPlaylist"), id=playlist_id).playlist
-        assert result, f"Error getting playlist {playlist_id}"
-        return result
+    def get_playlist_details(
+        self,
+        playlist_id: str,
+        on_page: Optional[Callable[[Sequence[API.Song]], None]] = None,
+    ) -> API.Playlist:
+        # If there is an on_page callback, the songs are passed to it instead of being
+        # collected, so that all of them are never in memory at once.
+        songs: List[Song] = []
+        add_songs = on_page or songs.extend
+        # Old versions of Subsonic don't give the song count and duration, so they are
+        # counted here in case the songs are passed to on_page.
+        song_count, duration = 0, 0.0
+
+        def on_entries(entries: List[Dict[str, Any]]):
+            nonlocal song_count, duration
+            page = decode_list(Song, entries)
+            song_count += len(page)
+            duration += sum(s.duration.total_seconds() for s in page if s.duration)
+            add_songs(page)
+
+        response = self._stream_json(
+            self._make_url("getPlaylist"),
+            "playlist.entry.item",
+            on_entries,
+            id=playlist_id,
+        )
+        playlist = response.get("playlist")
+        assert playlist, f"Error getting playlist {playlist_id}"
+        return decode(
+            Playlist,
+            {"songCount": song_count, "duration": duration, **playlist, "entry": songs},
+        )
 
     def create_playlist(
         self, name: str, songs: Sequence[API.Song] = None
@@ -641,15 +802,22 @@ class SubsonicAdapter(Adapter):
     def scrobble_song(self, song: API.Song):
         self._get(self._make_url("scrobble"), id=song.id)
 
-    def get_artists(self) -> Sequence[API.Artist]:
-        if artist_index := self._get_json(self._make_url("getArtists")).artists:
+    def get_artists(
+        self, on_page: Optional[Callable[[Sequence[API.Artist]], None]] = None
+    ) -> Sequence[API.Artist]:
+        # Like get_playlist_details, the artists are only collected if there is no
+        # on_page callback.
+        artists: List[API.Artist] = []
+        add_artists = on_page or artists.extend
+        response = self._stream_json(
+            self._make_url("getArtists"),
+            "artists.index.item.artist.item",
+            lambda entries: add_artists(decode_list(ArtistAndArtistInfo, entries)),
+        )
+        if artist_index := response.get("artists"):
             with open(self.ignored_articles_cache_file, "wb+") as f:
-                pickle.dump(artist_index.ignored_articles, f)
-
-            artists = []
-            for index in artist_index.index:
-                artists.extend(index.artist)
-            return cast(Sequence[API.Artist], artists)
+                pickle.dump(artist_index.get("ignoredArticles"), f)
+            return artists
         return []
 
     def get_artist(self, artist_id: str) -> API.Artist:
@@ -685,8 +853,21 @@ class SubsonicAdapter(Adapter):
         return set(ignored_articles.split())
 
     def get_albums(
-        self, query: AlbumSearchQuery, sort_direction: str = "ascending"
+        self,
+        query: AlbumSearchQuery,
+        sort_direction: str = "ascending",
+        on_page: Optional[Callable[[Sequence[API.Album]], None]] = None,
     ) -> Sequence[API.Album]:
+        """
+        Get all of the albums that match the query. The server only returns a page of
+        albums at a time and doesn't say how many there are, so the next
+        :class:`ALBUM_PAGE_CONCURRENCY` pages are always requested at once, and the
+        pages are put back in order as they come in. The albums end at the first empty
+        page.
+
+        :param on_page: called with each page of albums, in order, as soon as it and
+            all of the pages before it have been received.
+        """
         type_ = {
             AlbumSearchQuery.Type.RANDOM: "random",
             AlbumSearchQuery.Type.NEWEST: "newest",
@@ -712,24 +893,48 @@ class SubsonicAdapter(Adapter):
 
         albums: List[API.Album] = []
         page_size = 50 if query.type == AlbumSearchQuery.Type.RANDOM else 500
-        offset = 0
 
-        def get_page(offset: int) -> Sequence[API.Album]:
+        def get_page(page: int) -> Sequence[API.Album]:
             album_list = self._get_json(
                 self._make_url("getAlbumList2"),
                 type=type_,
                 size=page_size,
-                offset=offset,
+                offset=page * page_size,
                 **extra_args,
             ).albums
             return album_list.album if album_list else []
 
-        # Get all pages.
-        while len(next_page := get_page(offset)) > 0:
+        def add_page(next_page: Sequence[API.Album]):
             albums.extend(next_page)
-            if query.type == AlbumSearchQuery.Type.RANDOM:
-                break
-            offset += page_size
+            if on_page:
+                on_page(next_page)
+
+        # Every page of random albums is a different random sample, so only get one.
+        if query.type == AlbumSearchQuery.Type.RANDOM:
+            add_page(get_page(0))
+            return albums
+
+        with ThreadPoolExecutor(
+            max_workers=ALBUM_PAGE_CONCURRENCY, thread_name_prefix="album-pages"
+        ) as executor:
+            # The pages that have been requested, but not added yet.
+            in_flight: Dict[int, Future] = {}
+            next_request = 0
+            try:
+                for page in itertools.count():
+                    while len(in_flight) < ALBUM_PAGE_CONCURRENCY:
+                        in_flight[next_request] = executor.submit(
+                            get_page, next_request
+                        )
+                        next_request += 1
+
+                    if len(next_page := in_flight.pop(page).result()) == 0:
+                        break
+                    add_page(next_page)
+            finally:
+                # Don't request the pages past the end (or after an error).
+                for future in in_flight.values():
+                    future.cancel()
 
         return albums
 
@@ -739,14 +944,19 @@ class SubsonicAdapter(Adapter):
         return album
 
     def _get_indexes(self) -> API.Directory:
-        indexes = self._get_json(self._make_url("getIndexes")).indexes
+        root_dir_items: List[Dict[str, Any]] = []
+        response = self._stream_json(
+            self._make_url("getIndexes"),
+            "indexes.index.item.artist.item",
+            lambda entries: root_dir_items.extend(
+                {**x, "isDir": True} for x in entries
+            ),
+        )
+        indexes = response.get("indexes")
         assert indexes, "Error getting indexes"
         with open(self.ignored_articles_cache_file, "wb+") as f:
-            pickle.dump(indexes.ignored_articles, f)
+            pickle.dump(indexes.get("ignoredArticles"), f)
 
-        root_dir_items: List[Dict[str, Any]] = []
-        for index in indexes.index:
-            root_dir_items.extend(map(lambda x: {**x, "isDir": True}, index.artist))
         return Directory(id="root", _children=root_dir_items)
 
     def get_directory(self, directory_id: str) -> API.Directory:
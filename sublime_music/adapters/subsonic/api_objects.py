@@ -13,14 +13,14 @@ from dataclasses_json import (
     DataClassJsonMixin,
     LetterCase,
 )
-from dateutil import parser
 
+from .decoder import decode, parse_datetime
 from .. import api_objects as SublimeAPI
 
 # Translation map for encoding/decoding API results. For instance some servers
 # may return a string where an integer is required.
 decoder_functions = {
-    datetime: (lambda s: parser.parse(s) if s else None),
+    datetime: (lambda s: parse_datetime(s) if s else None),
     timedelta: (lambda s: timedelta(seconds=float(s)) if s else None),
     int: (lambda s: int(s) if s else None),
 }
@@ -166,7 +166,7 @@ class Directory(SublimeAPI.Directory):
 
         self.name = self.name or self.title
         self.children = [
-            Directory.from_dict(c) if c.get("isDir") else Song.from_dict(c)
+            decode(Directory, c) if c.get("isDir") else decode(Song, c)
             for c in self._children
         ]
 
@@ -0,0 +1,224 @@
+"""
+Fast decoding of Subsonic API responses into the API objects.
+
+``dataclasses_json``'s ``from_dict`` looks up the type hints, field names, and decoder
+overrides of every class each time that it decodes an object. Instead, the decoders in
+this module are generated once for each dataclass (the same way that :mod:`dataclasses`
+generates ``__init__``), so decoding an object is a single function call with a
+dictionary lookup and an inline conversion for each field. The decoded objects are the
+same as the ones that ``from_dict`` returns.
+"""
+import json
+import threading
+from dataclasses import fields, is_dataclass, MISSING
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    get_args,
+    get_origin,
+    get_type_hints,
+    Iterable,
+    List,
+    Type,
+    TypeVar,
+    Union,
+)
+
+import dataclasses_json
+from dateutil import parser
+from dateutil.tz import tzoffset, tzutc
+
+try:
+    import orjson
+
+    loads: Callable[[Union[str, bytes]], Any] = orjson.loads
+except ImportError:
+    loads = json.loads
+
+T = TypeVar("T")
+
+_UTC = tzutc()
+
+
+def parse_datetime(value: str) -> datetime:
+    """
+    Parse a datetime from the server. Almost all servers send ISO 8601 timestamps,
+    which are parsed by :class:`datetime.fromisoformat`. Anything else is parsed by
+    ``dateutil``, and the time zones are ``dateutil``'s in either case.
+    """
+    try:
+        if value[-1:] == "Z":
+            return datetime.fromisoformat(value[:-1]).replace(tzinfo=_UTC)
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+    if (offset := parsed.utcoffset()) is None:
+        return parsed
+    seconds = int(offset.total_seconds())
+    return parsed.replace(tzinfo=_UTC if seconds == 0 else tzoffset(None, seconds))
+
+
+def _last_present(data: Dict[str, Any], keys: Iterable[str]) -> Any:
+    """
+    Get the value of whichever of ``keys`` comes last in ``data`` (which is how
+    ``dataclasses_json`` resolves a field that is given under more than one name).
+    """
+    keys = set(keys)
+    for key in reversed(list(data)):
+        if key in keys:
+            return data[key]
+    return MISSING
+
+
+class _DecoderCompiler:
+    """Generates and caches the decoder for each dataclass."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._decoders: Dict[type, Callable[[Dict[str, Any]], Any]] = {}
+        # The generated functions look each other up in this namespace when they are
+        # called, so that recursive classes (like an album's songs, which each have an
+        # album) can be decoded.
+        self._namespace: Dict[str, Any] = {
+            "MISSING": MISSING,
+            "_last_present": _last_present,
+        }
+
+    def decoder(self, cls: Type[T]) -> Callable[[Dict[str, Any]], T]:
+        if (decoder := self._decoders.get(cls)) is None:
+            with self._lock:
+                # This also compiles all of the classes that cls refers to, so only
+                # publish the decoder once they are all done.
+                decoder = self._namespace[self._decoder_name(cls)]
+                self._decoders[cls] = decoder
+        return decoder
+
+    def _add(self, value: Any) -> str:
+        name = f"_c{len(self._namespace)}"
+        self._namespace[name] = value
+        return name
+
+    def _decoder_name(self, cls: Any) -> str:
+        name = f"_decode_{cls.__module__.replace('.', '_')}_{cls.__qualname__}"
+        if name not in self._namespace:
+            # Reserve the name before compiling so that recursive references to the
+            # class don't compile it again.
+            self._namespace[name] = None
+            self._compile(cls, name)
+        return name
+
+    def _value(self, type_: Any, v: str) -> str:
+        """
+        Generate an expression that converts the (non-null) JSON value ``v`` to
+        ``type_`` the same way as ``dataclasses_json``.
+        """
+        if is_dataclass(type_):
+            return f"{self._decoder_name(type_)}({v})"
+
+        origin = get_origin(type_)
+        if origin is list:
+            item_type = (get_args(type_) or (Any,))[0]
+            if is_dataclass(item_type) or get_origin(item_type) is not None:
+                return f"[{self._value(item_type, '_x')} for _x in {v}]"
+            return f"list({v})"
+        if origin is dict:
+            return f"dict({v})"
+        if origin is Union:
+            args = get_args(type_)
+            if len(args) == 2 and type(None) in args:
+                inner = args[0] if args[1] is type(None) else args[1]
+                if is_dataclass(inner) or get_origin(inner) is not None:
+                    return self._value(inner, v)
+                return self._extended_type(inner, v)
+            return v
+        return self._extended_type(type_, v)
+
+    def _extended_type(self, type_: Any, v: str) -> str:
+        if isinstance(type_, type) and issubclass(type_, (int, float, str, bool)):
+            type_name = self._add(type_)
+            return f"({v} if isinstance({v}, {type_name}) else {type_name}({v}))"
+        return v
+
+    def _compile(self, cls: type, name: str):
+        type_hints = get_type_hints(cls)
+        global_decoders: Dict[
+            Any, Callable
+        ] = dataclasses_json.cfg.global_config.decoders
+        class_config = getattr(cls, "dataclass_json_config", None) or {}
+
+        # Map the JSON keys to the fields. Later fields win if two fields have the same
+        # JSON key (such as Album.artist and Album._artist).
+        field_keys: Dict[str, str] = {}
+        for f in fields(cls):
+            letter_case = f.metadata.get("dataclasses_json", {}).get(
+                "letter_case", class_config.get("letter_case")
+            )
+            if letter_case is not None:
+                field_keys[letter_case(f.name)] = f.name
+
+        lines = [
+            f"def {name}(data):",
+            f"    if isinstance(data, {self._add(cls)}):",
+            "        return data",
+            "    get = data.get",
+        ]
+        args = []
+        for i, f in enumerate(fields(cls)):
+            if not f.init:
+                continue
+
+            # A key that isn't the JSON key of any field is used as a field name.
+            keys = [k for k, field_name in field_keys.items() if field_name == f.name]
+            if f.name not in field_keys:
+                keys.append(f.name)
+
+            lines.append(f"    v = get({keys[0]!r}, MISSING)")
+            for key in keys[1:]:
+                lines.append(f"    if {key!r} in data:")
+                lines.append(
+                    f"        v = data[{key!r}] if v is MISSING else "
+                    f"_last_present(data, {tuple(keys)!r})"
+                )
+
+            lines.append("    if v is MISSING:")
+            if f.default is not MISSING:
+                lines.append(f"        a{i} = {self._add(f.default)}")
+            elif f.default_factory is not MISSING:  # type: ignore
+                lines.append(f"        a{i} = {self._add(f.default_factory)}()")
+            else:
+                lines.append(f"        raise KeyError({f.name!r})")
+
+            type_ = type_hints[f.name]
+            if (decoder := global_decoders.get(f.type)) is not None:
+                value = f"{self._add(decoder)}(v)"
+                if isinstance(type_, type):
+                    value = f"(v if v.__class__ is {self._add(type_)} else {value})"
+            else:
+                value = self._value(type_, "v")
+            lines.append("    elif v is None:")
+            lines.append(f"        a{i} = None")
+            lines.append("    else:")
+            lines.append(f"        a{i} = {value}")
+            args.append(f"{f.name}=a{i}")
+
+        lines.append(f"    return {self._add(cls)}({', '.join(args)})")
+        exec("\n".join(lines), self._namespace)
+
+
+_compiler = _DecoderCompiler()
+
+
+def decode(cls: Type[T], data: Dict[str, Any]) -> T:
+    """
+    Decode the JSON object ``data`` into an instance of the dataclass ``cls``. This is
+    equivalent to ``cls.from_dict(data)``.
+    """
+    return _compiler.decoder(cls)(data)
+
+
+def decode_list(cls: Type[T], data: List[Dict[str, Any]]) -> List[T]:
+    decoder = _compiler.decoder(cls)
+    return [decoder(d) for d in data]
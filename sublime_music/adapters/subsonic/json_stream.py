@@ -0,0 +1,183 @@
+"""
+Incremental parsing of large JSON responses.
+
+Responses such as ``getArtists`` on a large library can be tens of megabytes. Rather
+than reading the whole body and building the entire dictionary tree at once,
+:class:`JSONItemStream` parses the body as it arrives and yields the elements of one
+array (for example, each artist) one at a time, so only the current element and the
+unparsed part of the current chunk are ever held in memory.
+"""
+import codecs
+import json
+from typing import Any, Dict, Generator, Iterable, Iterator, List, Tuple
+
+_WHITESPACE = " \t\n\r"
+# The characters that can continue a number.
+_NUMBER = "0123456789.eE+-"
+
+_decoder = json.JSONDecoder()
+
+# Returned by the parser in place of a value that was yielded as an item.
+_ITEM = object()
+
+
+class JSONItemStream:
+    """
+    Parses a JSON document from an iterable of chunks of UTF-8 bytes, and yields each
+    of the values at ``prefix``.
+
+    The prefix is a dot-separated path of object keys, where ``item`` stands for each
+    of the elements of an array (the same notation as ``ijson``). For example,
+    ``subsonic-response.playlist.entry.item`` is each of the songs of a playlist, and
+    ``subsonic-response.artists.index.item.artist.item`` is each of the artists in
+    each of the indexes.
+
+    Once all of the items have been iterated, :class:`document` is the rest of the
+    document, with the streamed values left out of their arrays.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], prefix: str):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._prefix = tuple(prefix.split("."))
+        self._buffer = ""
+        self._position = 0
+        self._at_end = False
+        self._document: Any = None
+        self._done = False
+
+    @property
+    def document(self) -> Any:
+        assert self._done, "The items must be iterated before getting the document"
+        return self._document
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._done:
+            return
+        self._document = yield from self._parse_value(())
+        if self._skip_whitespace():
+            self._error("Extra data")
+        self._done = True
+
+    # Reading the Buffer
+    # ==================================================================================
+    def _read_more(self) -> bool:
+        """
+        Read the next chunk into the buffer, dropping the part of the buffer that has
+        already been parsed. Returns whether there was more data.
+        """
+        while not self._at_end:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._at_end = True
+                text = self._text_decoder.decode(b"", final=True)
+            else:
+                text = self._text_decoder.decode(chunk)
+            if text:
+                self._buffer = self._buffer[self._position :] + text
+                self._position = 0
+                return True
+        return False
+
+    def _skip_whitespace(self) -> str:
+        """Skip any whitespace, and return the next character ("" at the end)."""
+        while True:
+            buffer, position = self._buffer, self._position
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            self._position = position
+            if position < len(buffer):
+                return buffer[position]
+            if not self._read_more():
+                return ""
+
+    def _expect(self, character: str):
+        if self._skip_whitespace() != character:
+            self._error(f"Expecting {character!r}")
+        self._position += 1
+
+    def _decode_value(self) -> Any:
+        """
+        Decode the whole value at the current position, reading more of the document
+        until it is complete.
+        """
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+                # A number at the end of the buffer may continue in the next chunk.
+                if self._at_end or (
+                    end < len(self._buffer) and self._buffer[end] not in _NUMBER
+                ):
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                # The value may just be incomplete.
+                if self._at_end:
+                    raise
+            self._read_more()
+
+    def _error(self, message: str):
+        raise json.JSONDecodeError(message, self._buffer, self._position)
+
+    # Parsing
+    # ==================================================================================
+    def _parse_value(self, path: Tuple[str, ...]) -> Generator[Any, None, Any]:
+        """
+        Parse the value at ``path``, yielding all of the items that are inside of it.
+        Returns the parsed value, or ``_ITEM`` if the value itself is an item.
+        """
+        if path == self._prefix:
+            yield self._decode_value()
+            return _ITEM
+        if self._prefix[: len(path)] != path:
+            # None of the items are inside this value.
+            return self._decode_value()
+
+        character = self._skip_whitespace()
+        if character == "{":
+            return (yield from self._parse_object(path))
+        if character == "[":
+            return (yield from self._parse_array(path))
+        return self._decode_value()
+
+    def _parse_object(self, path: Tuple[str, ...]) -> Generator[Any, None, Any]:
+        self._expect("{")
+        value: Dict[str, Any] = {}
+        if self._skip_whitespace() == "}":
+            self._position += 1
+            return value
+
+        while True:
+            if self._skip_whitespace() != '"':
+                self._error("Expecting property name enclosed in double quotes")
+            key = self._decode_value()
+            self._expect(":")
+            if (item := (yield from self._parse_value((*path, key)))) is not _ITEM:
+                value[key] = item
+
+            character = self._skip_whitespace()
+            if character not in (",", "}"):
+                self._error("Expecting ',' delimiter")
+            self._position += 1
+            if character == "}":
+                return value
+
+    def _parse_array(self, path: Tuple[str, ...]) -> Generator[Any, None, Any]:
+        self._expect("[")
+        value: List[Any] = []
+        if self._skip_whitespace() == "]":
+            self._position += 1
+            return value
+
+        item_path = (*path, "item")
+        while True:
+            if (item := (yield from self._parse_value(item_path))) is not _ITEM:
+                value.append(item)
+
+            character = self._skip_whitespace()
+            if character not in (",", "]"):
+                self._error("Expecting ',' delimiter")
+            self._position += 1
+            if character == "]":
+                return value
@@ -39,6 +39,8 @@ from .adapters import (
     AdapterManager,
     AlbumSearchQuery,
     CacheMissError,
+    CachingAdapter,
+    DownloadPriority,
     DownloadProgress,
     Result,
     SongCacheStatus,
@@ -171,7 +173,9 @@ class SublimeMusicApp(Gtk.Application):
                     self.window.close()
                     return
 
-        AdapterManager.reset(self.app_config, self.on_song_download_progress)
+        AdapterManager.reset(
+            self.app_config, self.on_song_download_progress, self.on_cache_refreshed
+        )
 
         # Connect after we know there's a server configured.
         self.window.stack.connect("notify::visible-child", self.on_stack_change)
@@ -409,13 +413,9 @@ class SublimeMusicApp(Gtk.Application):
 
             # Have to calculate all of the metadatas so that we can deal with
             # repeat song IDs.
-            metadatas: Iterable[Any] = [
-                self.dbus_manager.get_mpris_metadata(
-                    i,
-                    self.app_config.state.play_queue,
-                )
-                for i in range(len(self.app_config.state.play_queue))
-            ]
+            metadatas: Iterable[Any] = self.dbus_manager.get_mpris_tracks_metadata(
+                self.app_config.state.play_queue
+            )
 
             # Get rid of all of the tracks that were not requested.
             metadatas = list(
@@ -582,6 +582,8 @@ class SublimeMusicApp(Gtk.Application):
                 setattr(self.app_config, k, v)
             if (offline_mode := settings.get("offline_mode")) is not None:
                 AdapterManager.on_offline_mode_change(offline_mode)
+            if (cache_size_limit := settings.get("cache_size_limit")) is not None:
+                AdapterManager.on_cache_size_limit_change(cache_size_limit)
 
             del state_updates["__settings__"]
             self.app_config.save()
@@ -808,7 +810,9 @@ class SublimeMusicApp(Gtk.Application):
             self.on_play_pause()
         self.loading_state = True
         self.player_manager.reset()
-        AdapterManager.reset(self.app_config, self.on_song_download_progress)
+        AdapterManager.reset(
+            self.app_config, self.on_song_download_progress, self.on_cache_refreshed
+        )
         self.loading_state = False
 
         # Update the window according to the new server configuration.
@@ -971,6 +975,10 @@ class SublimeMusicApp(Gtk.Application):
         assert self.window
         GLib.idle_add(self.window.update_song_download_progress, song_id, progress)
 
+    def on_cache_refreshed(self, data_key: CachingAdapter.CachedDataKey, param: Any):
+        # Expired data was refreshed in the background, so show the new data.
+        self.update_window()
+
     def on_app_shutdown(self, app: "SublimeMusicApp"):
         self.exiting = True
         if glib_notify_exists:
@@ -1312,7 +1320,17 @@ class SublimeMusicApp(Gtk.Application):
                 and self.app_config.download_on_stream
                 and AdapterManager.can_batch_download_songs()
             ):
-                song_ids = [song.id]
+                # Download the current song ahead of everything else, and then
+                # prefetch the next songs in the play queue in order.
+                self.batch_download_jobs.add(
+                    AdapterManager.batch_download_songs(
+                        [song.id],
+                        before_download=lambda _: self.update_window(),
+                        on_song_download_complete=on_song_download_complete,
+                        delay=5,
+                        priority=DownloadPriority.NOW_PLAYING,
+                    )
+                )
 
                 # Add the prefetch songs.
                 if (
@@ -1328,19 +1346,20 @@ class SublimeMusicApp(Gtk.Application):
                             prefetch_idxs.append(
                                 prefetch_idx % play_queue_len  # noqa: S001
                             )
-                    song_ids.extend(
-                        [self.app_config.state.play_queue[i] for i in prefetch_idxs]
-                    )
 
-                self.batch_download_jobs.add(
-                    AdapterManager.batch_download_songs(
-                        song_ids,
-                        before_download=lambda _: self.update_window(),
-                        on_song_download_complete=on_song_download_complete,
-                        one_at_a_time=True,
-                        delay=5,
+                    self.batch_download_jobs.add(
+                        AdapterManager.batch_download_songs(
+                            [
+                                self.app_config.state.play_queue[i]
+                                for i in prefetch_idxs
+                            ],
+                            before_download=lambda _: self.update_window(),
+                            on_song_download_complete=on_song_download_complete,
+                            one_at_a_time=True,
+                            delay=5,
+                            priority=DownloadPriority.PREFETCH,
+                        )
                     )
-                )
 
         if old_play_queue:
             self.app_config.state.old_play_queue = old_play_queue
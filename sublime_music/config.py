@@ -155,6 +155,9 @@ class AppConfiguration(DataClassJsonMixin):
     download_on_stream: bool = True  # also download when streaming a song
     prefetch_amount: int = 3
     concurrent_download_limit: int = 5
+    object_cache_size: int = 64  # in MiB
+    cache_read_threads: int = 2  # 0 to read from the cache on the calling thread
+    cache_size_limit: int = 0  # in MiB, 0 for no limit
 
     # Deprecated. These have also been renamed to avoid using them elsewhere in the app.
     _sol: bool = field(default=True, metadata=config(field_name="serve_over_lan"))
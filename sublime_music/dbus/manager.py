@@ -346,6 +346,21 @@ class DBusManager:
             "xesam:title": song.title,
         }
 
+    def get_mpris_tracks_metadata(
+        self, play_queue: Tuple[str, ...]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the metadata of every song in the play queue. The details of all of the
+        songs are loaded at once first, so that the individual
+        :class:`get_mpris_metadata` calls don't each have to go to the database.
+        """
+        try:
+            AdapterManager.get_songs_details(play_queue, allow_download=False).result()
+        except Exception:
+            # Some songs aren't cached. The rest have still been loaded.
+            pass
+        return [self.get_mpris_metadata(i, play_queue) for i in range(len(play_queue))]
+
     @staticmethod
     @functools.lru_cache(maxsize=20)
     def get_dbus_playlist(play_queue: Tuple[str, ...]) -> List[str]:
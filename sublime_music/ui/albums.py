@@ -2,7 +2,7 @@ import datetime
 import itertools
 import logging
 import math
-from typing import Any, Callable, cast, Iterable, List, Optional, Tuple
+from typing import Any, Callable, cast, Iterable, List, Optional, Sequence, Tuple
 
 from gi.repository import Gdk, Gio, GLib, GObject, Gtk, Pango
 
@@ -681,6 +681,41 @@ class AlbumsGrid(Gtk.Overlay):
             )
             self.spinner.hide()
 
+        # The albums that have been streamed in so far, and the selected index that the
+        # current page was rendered with once they filled it.
+        streamed_models: List[AlbumsGrid._AlbumModel] = []
+        streamed_selected_index: Optional[int] = None
+        streamed_page_rendered = False
+        rendered_selected_index: Optional[int] = None
+
+        def add_page(page: Sequence[API.Album]):
+            nonlocal streamed_selected_index, streamed_page_rendered
+            nonlocal rendered_selected_index
+            # Don't override more recent results
+            if order_token < self.latest_applied_order_ratchet:
+                return
+            self.latest_applied_order_ratchet = order_token
+
+            for album in page:
+                model = AlbumsGrid._AlbumModel(album)
+                if model.id == self.currently_selected_id:
+                    streamed_selected_index = len(streamed_models)
+                streamed_models.append(model)
+
+            self.current_models = streamed_models
+            self.emit(
+                "num-pages-changed",
+                math.ceil(len(self.current_models) / self.page_size),
+            )
+
+            # Render the current page as soon as all of its albums are here.
+            if not streamed_page_rendered and len(streamed_models) >= self.page_size * (
+                self.page + 1
+            ):
+                streamed_page_rendered = True
+                rendered_selected_index = streamed_selected_index
+                do_update_grid(streamed_selected_index)
+
         def reload_store(f: Result[Iterable[API.Album]]):
             # Don't override more recent results
             if order_token < self.latest_applied_order_ratchet:
@@ -692,6 +727,9 @@ class AlbumsGrid(Gtk.Overlay):
                 albums = list(f.result())
             except CacheMissError as e:
                 albums = cast(Optional[List[API.Album]], e.partial_data) or []
+                # Keep the albums that were streamed in before the error.
+                if len(streamed_models) > len(albums):
+                    albums = [m.album for m in streamed_models]
                 is_partial = True
             except Exception as e:
                 if self.error_dialog:
@@ -733,6 +771,25 @@ class AlbumsGrid(Gtk.Overlay):
             else:
                 self.error_container.hide()
 
+            # If the current page was already rendered from the streamed albums, and
+            # nothing changed, don't render it again.
+            if (
+                streamed_page_rendered
+                and not is_partial
+                and len(albums) == len(streamed_models)
+            ):
+                self.current_models = streamed_models
+                self.emit(
+                    "num-pages-changed",
+                    math.ceil(len(self.current_models) / self.page_size),
+                )
+                # The selected album may be on a page that wasn't loaded yet when the
+                # current page was rendered.
+                if streamed_selected_index != rendered_selected_index:
+                    do_update_grid(streamed_selected_index)
+                self.spinner.hide()
+                return
+
             selected_index = None
             self.current_models = []
             for i, album in enumerate(albums):
@@ -751,7 +808,15 @@ class AlbumsGrid(Gtk.Overlay):
 
         if force_grid_reload_from_master:
             albums_result = AdapterManager.get_albums(
-                self.current_query, use_ground_truth_adapter=use_ground_truth_adapter
+                self.current_query,
+                use_ground_truth_adapter=use_ground_truth_adapter,
+                # Only the ascending pages can be shown before all of the albums are
+                # loaded, since the descending pages start from the last album.
+                on_page=(
+                    (lambda page: GLib.idle_add(add_page, page))
+                    if self.sort_dir == "ascending"
+                    else None
+                ),
             )
             if albums_result.data_is_available:
                 # Don't idle add if the data is already available.
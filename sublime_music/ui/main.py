@@ -350,6 +350,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.max_concurrent_downloads_entry.set_value(
             app_config.concurrent_download_limit
         )
+        self.cache_size_limit_entry.set_value(app_config.cache_size_limit)
         self.download_on_stream_switch.set_sensitive(allow_song_downloads)
         self.prefetch_songs_entry.set_sensitive(allow_song_downloads)
         self.max_concurrent_downloads_entry.set_sensitive(allow_song_downloads)
@@ -864,6 +865,19 @@ class MainWindow(Gtk.ApplicationWindow):
         )
         vbox.add(max_concurrent_downloads)
 
+        # Cache Size Limit
+        (
+            cache_size_limit,
+            self.cache_size_limit_entry,
+        ) = self._create_spin_button_menu_item(
+            "Cache Size Limit in MiB (0 for None)",
+            0,
+            10 * 1024 * 1024,
+            1024,
+            "cache_size_limit",
+        )
+        vbox.add(cache_size_limit)
+
         main_menu.add(vbox)
         return main_menu
 
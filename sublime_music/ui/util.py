@@ -277,9 +277,7 @@ def show_song_popover(
             browse_to_song.set_action_name("app.browse-to")
 
     def batch_get_song_details() -> List[Song]:
-        return [
-            AdapterManager.get_song_details(song_id).result() for song_id in song_ids
-        ]
+        return AdapterManager.get_songs_details(song_ids).result()
 
     get_song_details_result: Result[List[Song]] = Result(batch_get_song_details)
     get_song_details_result.add_done_callback(
@@ -1,15 +1,34 @@
+import hashlib
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
 from pathlib import Path
-from time import sleep
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator, List
 
 import pytest
 
 from sublime_music.adapters import (
     AdapterManager,
+    AlbumSearchQuery,
+    CacheMissError,
+    CachingAdapter,
     ConfigurationStore,
+    manager as manager_module,
     Result,
     SearchResult,
+    SongCacheStatus,
+)
+from sublime_music.adapters.download_scheduler import (
+    DownloadPriority,
+    DownloadScheduler,
 )
 from sublime_music.adapters.filesystem import FilesystemAdapter
+from sublime_music.adapters.http_session import PooledSession
+from sublime_music.adapters.ingestion_queue import IngestionQueue
+from sublime_music.adapters.object_cache import ObjectCache
+from sublime_music.adapters.rate_limiter import EndpointClass, RateLimiter
 from sublime_music.adapters.subsonic import api_objects as SubsonicAPI, SubsonicAdapter
 from sublime_music.config import AppConfiguration, ProviderConfiguration
 
@@ -39,6 +58,10 @@ def adapter_manager(tmp_path: Path):
         current_provider_id="1",
         cache_location=tmp_path,
     )
+    # The executors are shut down at the end of each test, so create new ones.
+    AdapterManager.executor = ThreadPoolExecutor()
+    AdapterManager.download_executor = ThreadPoolExecutor()
+    AdapterManager.is_shutting_down = False
     AdapterManager.reset(config, lambda *a: None)
     yield
     AdapterManager.shutdown()
@@ -201,3 +224,827 @@ def test_search(adapter_manager: AdapterManager):
         sleep(0.1)
 
     assert len(results) == 1
+
+
+def download_session() -> PooledSession:
+    assert AdapterManager._instance
+    session = AdapterManager._instance.ground_truth_adapter.http_session
+    assert session
+    return session
+
+
+class MockDownloadResponse:
+    status_code = 200
+
+    def __init__(self, content: bytes, release: threading.Event):
+        self.headers = {"Content-Length": str(len(content))}
+        self.closed = False
+        self._content = content
+        self._release = release
+
+    def iter_content(self, block_size: int) -> Iterator[bytes]:
+        self._release.wait(5)
+        for i in range(0, len(self._content), block_size):
+            yield self._content[i : i + block_size]
+
+    def close(self):
+        self.closed = True
+
+
+def test_download_single_flight(adapter_manager: AdapterManager, monkeypatch: Any):
+    release = threading.Event()
+    requested_uris = []
+    responses = []
+
+    def mock_get(uri: str, **kwargs) -> MockDownloadResponse:
+        requested_uris.append(uri)
+        responses.append(MockDownloadResponse(b"cover art", release))
+        return responses[-1]
+
+    monkeypatch.setattr(download_session(), "get", mock_get)
+
+    results = [
+        AdapterManager._create_download_result(f"https://example.com/{i}", "ca1")
+        for i in range(10)
+    ]
+    release.set()
+
+    filenames = {r.result() for r in results}
+    assert len(requested_uris) == 1
+    assert len(filenames) == 1
+    # The response should be closed so that its connection can be reused.
+    assert responses[0].closed
+
+    # The downloaded file should be named by its content hash.
+    filename = Path(filenames.pop())
+    assert filename.read_bytes() == b"cover art"
+    assert filename.name == hashlib.sha1(b"cover art").hexdigest()
+
+    # Once the download is finished, a new request should trigger a new download.
+    AdapterManager._create_download_result("https://example.com/new", "ca1").result()
+    assert len(requested_uris) == 2
+
+
+def test_download_single_flight_failure(
+    adapter_manager: AdapterManager, monkeypatch: Any
+):
+    release = threading.Event()
+
+    def mock_get(uri: str, **kwargs) -> MockDownloadResponse:
+        release.wait(5)
+        raise Exception("download failed")
+
+    monkeypatch.setattr(download_session(), "get", mock_get)
+
+    results = [
+        AdapterManager._create_download_result("https://example.com", "ca2")
+        for _ in range(3)
+    ]
+    release.set()
+    for result in results:
+        with pytest.raises(Exception, match="download failed"):
+            result.result()
+
+    # The failed download should not prevent a retry.
+    monkeypatch.setattr(
+        download_session(),
+        "get",
+        lambda uri, **kwargs: MockDownloadResponse(b"retry", release),
+    )
+    filename = AdapterManager._create_download_result(
+        "https://example.com", "ca2"
+    ).result()
+    with open(filename, "rb") as f:
+        assert f.read() == b"retry"
+
+
+def test_download_single_flight_cancel(
+    adapter_manager: AdapterManager, monkeypatch: Any
+):
+    release = threading.Event()
+    monkeypatch.setattr(
+        download_session(),
+        "get",
+        lambda uri, **kwargs: MockDownloadResponse(b"song", release),
+    )
+
+    result1 = AdapterManager._create_download_result("https://example.com", "s1")
+    result2 = AdapterManager._create_download_result("https://example.com", "s1")
+
+    # Cancelling one of the waiters should not cancel the shared download.
+    result1.cancel()
+    release.set()
+    with pytest.raises(CancelledError):
+        result1.result()
+    with open(result2.result(), "rb") as f:
+        assert f.read() == b"song"
+
+
+def test_download_resume(adapter_manager: AdapterManager, monkeypatch: Any):
+    song_data = bytes(range(256)) * 1024
+    range_headers = []
+
+    class MockRangeResponse:
+        def __init__(self, headers: Dict[str, str], fail_after: int = None):
+            self.status_code = 200
+            self.headers = {"Content-Length": str(len(song_data))}
+            self._content = song_data
+            self._fail_after = fail_after
+            if range_header := headers.get("Range"):
+                offset = int(range_header[len("bytes=") : -1])
+                self.status_code = 206
+                self.headers = {
+                    "Content-Length": str(len(song_data) - offset),
+                    "Content-Range": f"bytes {offset}-{len(song_data) - 1}/*",
+                }
+                self._content = song_data[offset:]
+
+        def iter_content(self, block_size: int) -> Iterator[bytes]:
+            for i in range(0, len(self._content), block_size):
+                if self._fail_after is not None and i >= self._fail_after:
+                    raise Exception("connection reset")
+                yield self._content[i : i + block_size]
+
+        def close(self):
+            pass
+
+    def mock_get_fail(uri: str, headers: Dict[str, str], **kwargs) -> Any:
+        range_headers.append(headers.get("Range"))
+        return MockRangeResponse(headers, fail_after=len(song_data) // 2)
+
+    def mock_get(uri: str, headers: Dict[str, str], **kwargs) -> Any:
+        range_headers.append(headers.get("Range"))
+        return MockRangeResponse(headers)
+
+    monkeypatch.setattr(download_session(), "get", mock_get_fail)
+    with pytest.raises(Exception, match="connection reset"):
+        AdapterManager._create_download_result(
+            "https://example.com", "s2", expected_size=len(song_data)
+        ).result()
+
+    # The retry should only request the rest of the file.
+    monkeypatch.setattr(download_session(), "get", mock_get)
+    filename = AdapterManager._create_download_result(
+        "https://example.com", "s2", expected_size=len(song_data)
+    ).result()
+    assert range_headers == [None, f"bytes={len(song_data) // 2}-"]
+    assert Path(filename).read_bytes() == song_data
+    assert Path(filename).name == hashlib.sha1(song_data).hexdigest()
+
+
+def test_download_deleted_once_cached(
+    adapter_manager: AdapterManager, monkeypatch: Any
+):
+    release = threading.Event()
+    release.set()
+    monkeypatch.setattr(
+        download_session(),
+        "get",
+        lambda uri, **kwargs: MockDownloadResponse(b"cover art", release),
+    )
+
+    filename = Path(AdapterManager.get_cover_art_uri("ca9", "file").result())
+    assert filename.read_bytes() == b"cover art"
+
+    # The result should be the cached file, and the download should be deleted so
+    # that evicting the file from the cache frees its space.
+    assert AdapterManager._instance
+    download_path = AdapterManager._instance.download_path
+    assert download_path not in filename.parents
+    assert list(download_path.iterdir()) == []
+
+
+def test_download_scheduler_priority():
+    scheduler = DownloadScheduler(concurrent_download_limit=1)
+    started = []
+    releases = []
+
+    def start(name: str) -> Any:
+        def do_start(release: Any):
+            started.append(name)
+            releases.append(release)
+
+        return do_start
+
+    scheduler.submit("batch", DownloadPriority.BATCH, start("batch1"))
+    scheduler.submit("batch", DownloadPriority.BATCH, start("batch2"))
+    scheduler.submit("prefetch", DownloadPriority.PREFETCH, start("prefetch"))
+    assert started == ["batch1"]
+
+    # Songs that are currently playing should start even when all of the slots are
+    # being used.
+    scheduler.submit("playing", DownloadPriority.NOW_PLAYING, start("playing"))
+    assert started == ["batch1", "playing"]
+
+    stats = scheduler.stats()
+    assert stats.active == 2
+    assert stats.queued[DownloadPriority.PREFETCH] == 1
+    assert stats.queued[DownloadPriority.BATCH] == 1
+
+    # The prefetch should jump ahead of the queued batch download.
+    releases[0]()
+    releases[1]()
+    assert started == ["batch1", "playing", "prefetch"]
+
+    # Releasing twice shouldn't free up two slots.
+    releases[0]()
+    assert started == ["batch1", "playing", "prefetch"]
+
+    releases[2]()
+    assert started == ["batch1", "playing", "prefetch", "batch2"]
+    assert scheduler.stats().active == 1
+
+
+def test_download_scheduler_fairness():
+    scheduler = DownloadScheduler(concurrent_download_limit=1)
+    started = []
+
+    def start(name: str) -> Any:
+        def do_start(release: Any):
+            started.append(name)
+            release()
+
+        return do_start
+
+    # Hold the only slot so that everything else gets queued.
+    held_release = None
+
+    def hold(release: Any):
+        nonlocal held_release
+        held_release = release
+
+    scheduler.submit("hold", DownloadPriority.BATCH, hold)
+    for i in range(3):
+        scheduler.submit("big", DownloadPriority.BATCH, start(f"big{i}"))
+    scheduler.submit("small", DownloadPriority.BATCH, start("small0"))
+
+    # Cancelled jobs should be removed from the queue.
+    scheduler.submit("cancelled", DownloadPriority.BATCH, start("cancelled"))
+    assert scheduler.cancel_job("cancelled") == 1
+
+    assert held_release
+    held_release()
+    assert started == ["big0", "small0", "big1", "big2"]
+    assert scheduler.stats().max_wait[DownloadPriority.BATCH] > 0
+
+
+def test_get_request_coalescing(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    assert AdapterManager._instance.caching_adapter
+    release = threading.Event()
+    requested_ids = []
+    ingested = []
+
+    def mock_get_song_details(song_id: str) -> str:
+        requested_ids.append(song_id)
+        release.wait(5)
+        return f"song {song_id}"
+
+    monkeypatch.setattr(
+        AdapterManager._instance.ground_truth_adapter,
+        "get_song_details",
+        mock_get_song_details,
+    )
+    monkeypatch.setattr(
+        AdapterManager._instance.caching_adapter,
+        "ingest_new_data",
+        lambda *args: ingested.append(args),
+    )
+
+    results = [AdapterManager.get_song_details("1") for _ in range(5)]
+    other_result = AdapterManager.get_song_details("2")
+
+    # The cache is read in the background, so wait for all of the requests to reach
+    # the ground truth adapter.
+    for _ in range(500):
+        flights = AdapterManager._request_flights.values()
+        if sum(flight.waiters for flight in flights) == 6:
+            break
+        sleep(0.01)
+
+    # Cancelling one of the callers should not affect the others.
+    results[0].cancel()
+    release.set()
+
+    assert [r.result() for r in results[1:]] == ["song 1"] * 4
+    assert other_result.result() == "song 2"
+    assert sorted(requested_ids) == ["1", "2"]
+    AdapterManager._flush_cache_writes()
+    assert len(ingested) == 2
+
+    # Once the request is finished, a new request should go to the server again.
+    AdapterManager.get_song_details("1").result()
+    assert len(requested_ids) == 3
+
+
+def test_get_albums_pages(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    assert AdapterManager._instance.caching_adapter
+    releases = [threading.Event(), threading.Event()]
+    pages = [["a1", "a2"], ["a3", "a4"], ["a5"]]
+
+    def mock_get_albums(
+        query: AlbumSearchQuery, sort_direction: str, on_page: Any = None
+    ) -> List[str]:
+        for i, page in enumerate(pages):
+            on_page(page)
+            if i < len(releases):
+                releases[i].wait(5)
+        return [album for page in pages for album in page]
+
+    monkeypatch.setattr(
+        AdapterManager._instance.ground_truth_adapter, "get_albums", mock_get_albums
+    )
+    monkeypatch.setattr(
+        AdapterManager._instance.caching_adapter, "ingest_new_data", lambda *args: None
+    )
+
+    def wait_for_pages(received: List[List[str]]):
+        # The cache is read in the background, so wait for the request to reach the
+        # ground truth adapter.
+        for _ in range(500):
+            if received:
+                break
+            sleep(0.01)
+
+    query = AlbumSearchQuery(AlbumSearchQuery.Type.ALPHABETICAL_BY_NAME)
+    first_pages: List[List[str]] = []
+    first = AdapterManager.get_albums(query, on_page=first_pages.append)
+    wait_for_pages(first_pages)
+    assert first_pages == [["a1", "a2"]]
+    assert not first.data_is_available
+
+    # A caller that joins the request gets the pages that were already received.
+    second_pages: List[List[str]] = []
+    second = AdapterManager.get_albums(query, on_page=second_pages.append)
+    wait_for_pages(second_pages)
+    assert second_pages == [["a1", "a2"]]
+
+    for release in releases:
+        release.set()
+    assert first.result() == second.result() == ["a1", "a2", "a3", "a4", "a5"]
+    assert first_pages == second_pages == pages
+
+
+def test_get_artists_streamed(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    assert (caching_adapter := AdapterManager._instance.caching_adapter)
+    pages = [
+        [
+            SubsonicAPI.ArtistAndArtistInfo(id=f"ar{i}{j}", name=f"Artist {i}{j}")
+            for j in range(3)
+        ]
+        for i in range(3)
+    ]
+    ingested_while_streaming = []
+
+    def mock_get_artists(on_page: Any = None) -> List[SubsonicAPI.ArtistAndArtistInfo]:
+        # The artists that are passed to on_page aren't returned.
+        for page in pages:
+            on_page(page)
+            AdapterManager._flush_cache_writes()
+            ingested_while_streaming.append(
+                len(caching_adapter.get_artists(ignore_cache_miss=True))
+            )
+        return []
+
+    monkeypatch.setattr(
+        AdapterManager._instance.ground_truth_adapter, "get_artists", mock_get_artists
+    )
+    monkeypatch.setattr(AdapterManager, "_get_ignored_articles", lambda _: set())
+
+    # An artist which no longer exists should be deleted once all of the pages have
+    # been received.
+    caching_adapter.ingest_new_data(
+        CachingAdapter.CachedDataKey.ARTIST,
+        "deleted",
+        SubsonicAPI.ArtistAndArtistInfo(id="deleted", name="Deleted"),
+    )
+
+    artists = AdapterManager.get_artists(force=True).result()
+    # Each page should be ingested before the next one is received, and the result
+    # should be read from the cache.
+    assert ingested_while_streaming == [4, 7, 10]
+    assert [a.id for a in artists] == [a.id for page in pages for a in page]
+
+
+def test_object_cache(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    caching_adapter = AdapterManager._instance.caching_adapter
+    assert caching_adapter
+    KEYS = CachingAdapter.CachedDataKey
+
+    AdapterManager._ingest_new_data(
+        KEYS.SONG,
+        "1",
+        SubsonicAPI.Song(
+            "1", title="Song 1", _album="foo", album_id="a1", _artist="bar"
+        ),
+    )
+
+    song = AdapterManager.get_song_details("1").result()
+    assert song.title == "Song 1"
+    assert song.album.name == "foo"
+
+    # Cached objects should be returned without going to the caching adapter, and they
+    # shouldn't be modifiable.
+    monkeypatch.setattr(caching_adapter, "get_song_details", None)
+    assert AdapterManager.get_song_details("1").result() is song
+    with pytest.raises(AttributeError):
+        song.title = "Changed"
+    monkeypatch.undo()
+
+    # Ingesting new data should invalidate the cached objects.
+    AdapterManager._ingest_new_data(
+        KEYS.SONG,
+        "1",
+        SubsonicAPI.Song(
+            "1", title="New Title", _album="foo", album_id="a1", _artist="bar"
+        ),
+    )
+    assert AdapterManager.get_song_details("1").result().title == "New Title"
+
+    # Data read before an invalidation should not be cached.
+    object_cache = AdapterManager._instance.object_cache
+    generation = object_cache.generation
+    object_cache.invalidate()
+    object_cache.put(("get_song_details", "1", ()), song, generation)
+    assert len(object_cache) == 0
+
+
+def test_object_cache_eviction():
+    object_cache = ObjectCache(max_size=2000)
+    object_cache.put(("a",), "a" * 900, object_cache.generation)
+    object_cache.put(("b",), "b" * 900, object_cache.generation)
+    assert object_cache.get(("a",))
+
+    # Adding another item should evict the least recently used item.
+    object_cache.put(("c",), "c" * 900, object_cache.generation)
+    assert object_cache.get(("a",))
+    assert object_cache.get(("b",)) is None
+    assert object_cache.get(("c",))
+    assert object_cache.size <= 2000
+
+    # Items larger than the budget are never cached.
+    object_cache.put(("d",), "d" * 3000, object_cache.generation)
+    assert object_cache.get(("d",)) is None
+
+
+def test_stale_while_revalidate(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    KEYS = CachingAdapter.CachedDataKey
+    release = threading.Event()
+    refreshed = threading.Event()
+    requested_ids = []
+
+    def mock_get_song_details(song_id: str) -> SubsonicAPI.Song:
+        requested_ids.append(song_id)
+        release.wait(5)
+        return SubsonicAPI.Song(song_id, title="New Title")
+
+    monkeypatch.setattr(
+        AdapterManager._instance.ground_truth_adapter,
+        "get_song_details",
+        mock_get_song_details,
+    )
+    monkeypatch.setattr(
+        AdapterManager._instance,
+        "on_cache_refreshed",
+        lambda *args: refreshed.set(),
+    )
+
+    # Expired data should still be served from the cache while it is refreshed in the
+    # background. Only a single refresh should be started.
+    monkeypatch.setitem(manager_module.CACHE_TTLS, KEYS.SONG, timedelta(0))
+    AdapterManager._ingest_new_data(
+        KEYS.SONG, "1", SubsonicAPI.Song("1", title="Old Title")
+    )
+    for _ in range(3):
+        assert AdapterManager.get_song_details("1").result().title == "Old Title"
+    release.set()
+
+    assert refreshed.wait(5)
+    assert AdapterManager.get_song_details("1").result().title == "New Title"
+    assert requested_ids == ["1"]
+
+
+def test_cache_expirations(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    caching_adapter = AdapterManager._instance.caching_adapter
+    assert caching_adapter
+    KEYS = CachingAdapter.CachedDataKey
+    for song_id in ("1", "2"):
+        AdapterManager._ingest_new_data(
+            KEYS.SONG, song_id, SubsonicAPI.Song(song_id, title=f"Song {song_id}")
+        )
+        AdapterManager.get_song_details(song_id).result()
+
+    queried = []
+    get_last_ingestion_time = caching_adapter.get_last_ingestion_time
+
+    def mock_get_last_ingestion_time(*args: Any) -> Any:
+        queried.append(args)
+        return get_last_ingestion_time(*args)
+
+    monkeypatch.setattr(
+        caching_adapter, "get_last_ingestion_time", mock_get_last_ingestion_time
+    )
+
+    # Cache hits know when their data expires.
+    AdapterManager.get_song_details("1").result()
+    assert queried == []
+
+    # Writing a song only forgets the expiry time of that song.
+    AdapterManager._ingest_new_data(
+        KEYS.SONG, "2", SubsonicAPI.Song("2", title="New Title")
+    )
+    assert AdapterManager.get_song_details("1").result().title == "Song 1"
+    assert AdapterManager.get_song_details("2").result().title == "New Title"
+    assert AdapterManager.get_song_details("2").result().title == "New Title"
+    assert queried == [(KEYS.SONG, "2")]
+
+
+def test_get_songs_details(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    KEYS = CachingAdapter.CachedDataKey
+    monkeypatch.setattr(manager_module, "SONG_DETAILS_CONCURRENCY", 2)
+    lock = threading.Lock()
+    in_flight = max_in_flight = 0
+    requested_ids = []
+
+    def mock_get_song_details(song_id: str) -> SubsonicAPI.Song:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            requested_ids.append(song_id)
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+        sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return SubsonicAPI.Song(song_id, title=f"Song {song_id}")
+
+    monkeypatch.setattr(
+        AdapterManager._instance.ground_truth_adapter,
+        "get_song_details",
+        mock_get_song_details,
+    )
+
+    for song_id in ("1", "3"):
+        AdapterManager._ingest_new_data(
+            KEYS.SONG, song_id, SubsonicAPI.Song(song_id, title=f"Song {song_id}")
+        )
+
+    # Cached songs should be returned without any requests.
+    songs = AdapterManager.get_songs_details(["3", "1", "3"]).result()
+    assert [s.title for s in songs] == ["Song 3", "Song 1", "Song 3"]
+    assert requested_ids == []
+
+    # The rest should be requested from the server, a limited number at a time, and
+    # returned in order.
+    song_ids = ["5", "1", "2", "6", "3", "4"]
+    songs = AdapterManager.get_songs_details(song_ids).result()
+    assert [s.id for s in songs] == song_ids
+    assert sorted(requested_ids) == ["2", "4", "5", "6"]
+    assert max_in_flight == 2
+
+    # If downloads aren't allowed, the missing songs cause a cache miss.
+    with pytest.raises(CacheMissError):
+        AdapterManager.get_songs_details(["1", "7"], allow_download=False).result()
+
+
+def test_background_cache_reads(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    assert AdapterManager._instance.read_executor
+    caching_adapter = AdapterManager._instance.caching_adapter
+    assert caching_adapter
+    KEYS = CachingAdapter.CachedDataKey
+    read_threads = []
+    get_song_details = caching_adapter.get_song_details
+
+    def mock_get_song_details(song_id: str) -> Any:
+        read_threads.append(threading.current_thread().name)
+        return get_song_details(song_id)
+
+    monkeypatch.setattr(caching_adapter, "get_song_details", mock_get_song_details)
+    AdapterManager._ingest_new_data(
+        KEYS.SONG, "1", SubsonicAPI.Song("1", title="Song 1")
+    )
+
+    # The database should be read on the read pool.
+    assert AdapterManager.get_song_details("1").result().title == "Song 1"
+    assert len(read_threads) == 1
+    assert read_threads[0].startswith("cache-read")
+
+    # Once the data is in memory, it should be returned immediately.
+    result = AdapterManager.get_song_details("1")
+    assert result.data_is_available
+    assert result.result().title == "Song 1"
+    assert len(read_threads) == 1
+
+    # Reads wait for the queued writes on the read pool, not on the calling thread.
+    release = threading.Event()
+    ingest_new_data = caching_adapter.ingest_new_data
+
+    def slow_ingest_new_data(*args: Any):
+        release.wait(5)
+        ingest_new_data(*args)
+
+    monkeypatch.setattr(caching_adapter, "ingest_new_data", slow_ingest_new_data)
+    AdapterManager._ingest_new_data(
+        KEYS.SONG, "1", SubsonicAPI.Song("1", title="New Title")
+    )
+    start = monotonic()
+    results = [AdapterManager.get_song_details("1") for _ in range(3)]
+    results.append(AdapterManager.get_songs_details(["1"]))
+    # The song statuses are read without waiting for the writes at all.
+    assert AdapterManager.get_cached_statuses(["1"]) == [SongCacheStatus.NOT_CACHED]
+    assert monotonic() - start < 1
+    release.set()
+    assert [r.result().title for r in results[:3]] == ["New Title"] * 3
+    assert results[3].result()[0].title == "New Title"
+
+
+def test_ingestion_queue():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def write_batch(writes: List[int]):
+        started.set()
+        release.wait(5)
+        batches.append(writes)
+
+    queue = IngestionQueue(
+        write_batch, max_size=4, max_batch_size=3, batch_window=timedelta(seconds=5)
+    )
+    start = monotonic()
+
+    # A full batch is written immediately. The writer is blocked, so the queue fills.
+    for i in range(7):
+        queue.put(i)
+        if i == 2:
+            assert started.wait(5)
+    assert queue.stats().depth == 4
+
+    # Once the queue is full, writes wait for the writer to catch up.
+    putter = threading.Thread(target=queue.put, args=(7,))
+    putter.start()
+    sleep(0.1)
+    assert putter.is_alive()
+
+    # Flushing doesn't wait for the batch window.
+    release.set()
+    putter.join()
+    queue.flush()
+    assert monotonic() - start < 5
+    assert batches[:2] == [[0, 1, 2], [3, 4, 5]]
+    assert [w for batch in batches for w in batch] == list(range(8))
+
+    stats = queue.stats()
+    assert stats.depth == 0
+    assert stats.max_depth == 4
+    assert stats.batches == len(batches)
+    assert stats.writes == 8
+    assert stats.max_commit_latency >= stats.mean_commit_latency > 0
+
+    # Shutting down writes everything that is still queued.
+    queue.put(8)
+    queue.shutdown()
+    assert batches[-1] == [8]
+
+    # The main thread (which runs the UI) never waits for room in the queue.
+    started.clear()
+    release.clear()
+    queue = IngestionQueue(write_batch, max_size=1, max_batch_size=1)
+    queue.put(9)
+    assert started.wait(5)
+    queue.put(10)
+    start = monotonic()
+    queue.put(11)
+    assert monotonic() - start < 1
+    release.set()
+    queue.shutdown()
+    assert batches[-3:] == [[9], [10], [11]]
+
+
+def test_batched_cache_writes(adapter_manager: AdapterManager, monkeypatch: Any):
+    assert AdapterManager._instance
+    caching_adapter = AdapterManager._instance.caching_adapter
+    assert caching_adapter
+    batches = 0
+    batch_writes = caching_adapter.batch_writes
+
+    def count_batches() -> Any:
+        nonlocal batches
+        batches += 1
+        return batch_writes()
+
+    monkeypatch.setattr(caching_adapter, "batch_writes", count_batches)
+
+    for i in range(200):
+        AdapterManager._ingest_new_data(
+            CachingAdapter.CachedDataKey.SONG,
+            str(i),
+            SubsonicAPI.Song(str(i), title=f"Song {i}"),
+        )
+    # A write that fails doesn't affect the rest of its batch.
+    AdapterManager._ingest_new_data(CachingAdapter.CachedDataKey.SONG, "bad", None)
+
+    # Reads see all of the writes that were made before them.
+    assert AdapterManager.get_song_details("199").result().title == "Song 199"
+    assert batches < 20
+    stats = AdapterManager.get_ingestion_queue_stats()
+    assert stats and stats.writes == 201 and stats.depth == 0
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(
+        {
+            "slow": EndpointClass(rate=20, burst=2, max_concurrency=2),
+            "fast": EndpointClass(rate=1000, burst=1000, max_concurrency=8),
+        },
+        classify=lambda url: url.split("/")[0],
+    )
+
+    # The burst can start at once, and then the requests are spaced out by the rate.
+    start = monotonic()
+    for _ in range(4):
+        with limiter.request("slow/a"):
+            pass
+    assert monotonic() - start > 0.08
+
+    # Only the concurrency limit's worth of requests are in flight at once.
+    release = threading.Event()
+    max_in_flight = 0
+
+    def hold(url: str):
+        nonlocal max_in_flight
+        with limiter.request(url):
+            max_in_flight = max(max_in_flight, limiter.stats()["slow"].in_flight)
+            release.wait(5)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        holds = [executor.submit(hold, "slow/b") for _ in range(4)]
+        deadline = monotonic() + 5
+        while limiter.stats()["slow"].in_flight < 2 and monotonic() < deadline:
+            sleep(0.01)
+        stats = limiter.stats()["slow"]
+        assert (stats.in_flight, stats.waiting) == (2, 2)
+
+        # The other endpoint classes have their own budgets.
+        start = monotonic()
+        with limiter.request("fast/a"):
+            pass
+        assert monotonic() - start < 0.1
+
+        release.set()
+        for h in holds:
+            h.result()
+    assert max_in_flight == 2
+    assert limiter.stats()["slow"].requests == 8
+
+
+def test_rate_limiter_adapts():
+    limiter = RateLimiter(
+        {
+            "a": EndpointClass(
+                rate=1000,
+                burst=1000,
+                max_concurrency=8,
+                initial_concurrency=4,
+                target_latency=1,
+            )
+        },
+        classify=lambda _: "a",
+    )
+
+    # Successful responses grow the window.
+    for _ in range(20):
+        with limiter.request("a") as permit:
+            permit.record_response(200)
+    limit = limiter.stats()["a"].concurrency_limit
+    assert 6 < limit <= 8
+
+    # A burst of throttled responses only halves the window once.
+    with ExitStack() as stack:
+        permits = [stack.enter_context(limiter.request("a")) for _ in range(4)]
+        for permit in permits:
+            permit.record_response(503)
+    stats = limiter.stats()["a"]
+    assert stats.concurrency_limit == limit / 2
+    assert stats.overloaded == 4
+
+    # Failed requests are overloaded too.
+    with pytest.raises(ConnectionError):
+        with limiter.request("a"):
+            raise ConnectionError()
+    assert limiter.stats()["a"].concurrency_limit == limit / 4
+
+    # The Retry-After of a throttled response pauses the requests.
+    with limiter.request("a") as permit:
+        permit.record_response(429, retry_after="0.2")
+    start = monotonic()
+    with limiter.request("a"):
+        pass
+    assert monotonic() - start > 0.15
+    assert limiter.stats()["a"].overloaded == 6
@@ -1,9 +1,12 @@
+import hashlib
 import json
 import shutil
+import threading
 from dataclasses import asdict
 from datetime import timedelta
 from pathlib import Path
-from typing import Any, cast, Generator, Iterable, Tuple
+from time import monotonic, sleep
+from typing import Any, cast, Generator, Iterable, Set, Tuple
 
 import pytest
 
@@ -13,9 +16,16 @@ from sublime_music.adapters import (
     AlbumSearchQuery,
     api_objects as SublimeAPI,
     CacheMissError,
+    CachingAdapter,
     SongCacheStatus,
 )
-from sublime_music.adapters.filesystem import FilesystemAdapter
+from sublime_music.adapters.filesystem import (
+    FilesystemAdapter,
+    ingestion,
+    migrations,
+    models,
+    search_index,
+)
 from sublime_music.adapters.subsonic import api_objects as SubsonicAPI
 
 MOCK_DATA_FILES = Path(__file__).parent.joinpath("mock_data")
@@ -304,6 +314,36 @@ def test_cache_cover_art(cache_adapter: FilesystemAdapter):
             assert cached.read() == expected.read()
 
 
+def test_ingest_staged_files(cache_adapter: FilesystemAdapter):
+    staging_dir = cache_adapter.download_staging_directory
+    assert staging_dir
+
+    # Files in the staging directory are named by their content hash.
+    song_data = b"song data"
+    staged_song = staging_dir.joinpath(hashlib.sha1(song_data).hexdigest())
+    staged_song.write_bytes(song_data)
+    cover_art_data = b"cover art data"
+    staged_cover_art = staging_dir.joinpath(hashlib.sha1(cover_art_data).hexdigest())
+    staged_cover_art.write_bytes(cover_art_data)
+
+    cache_adapter.ingest_new_data(KEYS.SONG, "1", MOCK_SUBSONIC_SONGS[1])
+    cache_adapter.ingest_new_data(KEYS.SONG_FILE, "1", (None, staged_song, None))
+    cache_adapter.ingest_new_data(KEYS.COVER_ART_FILE, "s1", staged_cover_art)
+
+    song_path = Path(cache_adapter.get_song_file_uri("1", "file")[len("file://") :])
+    assert song_path.read_bytes() == song_data
+    assert song_path.stat().st_ino == staged_song.stat().st_ino
+
+    cover_art_path = Path(cache_adapter.get_cover_art_uri("s1", "file", size=300))
+    assert cover_art_path.name == staged_cover_art.name
+    assert cover_art_path.read_bytes() == cover_art_data
+
+    # Ingesting the same staged file again (for example, when multiple callers were
+    # waiting on the same download) should work as well.
+    cache_adapter.ingest_new_data(KEYS.COVER_ART_FILE, "s1", staged_cover_art)
+    assert cover_art_path.read_bytes() == cover_art_data
+
+
 def test_invalidate_playlist(cache_adapter: FilesystemAdapter):
     cache_adapter.ingest_new_data(
         KEYS.PLAYLISTS,
@@ -400,7 +440,7 @@ def test_malformed_song_path(cache_adapter: FilesystemAdapter):
     )
 
     song_uri = cache_adapter.get_song_file_uri("1", "file")
-    assert song_uri.endswith(f"/music/{MOCK_SONG_FILE_HASH}")
+    assert song_uri.endswith(f"/blobs/fe/{MOCK_SONG_FILE_HASH}")
 
     song_uri2 = cache_adapter.get_song_file_uri("2", "file")
     assert song_uri2.endswith("fine/path/song2.mp3")
@@ -427,6 +467,62 @@ def test_get_cached_statuses(cache_adapter: FilesystemAdapter):
     assert cache_adapter.get_cached_statuses(["1"]) == {"1": SongCacheStatus.NOT_CACHED}
 
 
+def test_cached_status_reconciliation(
+    cache_adapter: FilesystemAdapter, monkeypatch: Any
+):
+    song_ids = [str(i) for i in range(1, 4)]
+    for song_id in song_ids:
+        song = SubsonicAPI.Song(
+            song_id, title=f"Song {song_id}", path=f"s{song_id}.mp3"
+        )
+        cache_adapter.ingest_new_data(KEYS.SONG, song_id, song)
+        cache_adapter.ingest_new_data(
+            KEYS.SONG_FILE, song_id, (None, MOCK_SONG_FILE, None)
+        )
+
+    # The statuses only take one query, and don't check the files.
+    queries = []
+    execute_sql = models.database.execute_sql
+
+    def count_queries(sql: str, *args) -> Any:
+        if threading.current_thread() is threading.main_thread():
+            queries.append(sql)
+        return execute_sql(sql, *args)
+
+    monkeypatch.setattr(models.database, "execute_sql", count_queries)
+    monkeypatch.setattr(Path, "exists", lambda _: 0 / 0)
+    assert cache_adapter.get_cached_statuses(song_ids + ["nope"]) == {
+        **{song_id: SongCacheStatus.CACHED for song_id in song_ids},
+        "nope": SongCacheStatus.NOT_CACHED,
+    }
+    assert len(queries) == 1
+    monkeypatch.undo()
+
+    # Finding that a file was deleted behind the adapter's back requests a
+    # reconciliation. It's run here instead of on the maintenance thread.
+    reconciliation_requests = []
+    monkeypatch.setattr(
+        cache_adapter,
+        "_request_reconciliation",
+        lambda: reconciliation_requests.append(True),
+    )
+    cache_adapter.music_dir.joinpath("s2.mp3").unlink()
+    with pytest.raises(CacheMissError):
+        cache_adapter.get_song_file_uri("2", "file")
+    assert reconciliation_requests
+    cache_adapter._reconcile_cached_files()
+    assert cache_adapter.get_cached_statuses(song_ids) == {
+        "1": SongCacheStatus.CACHED,
+        "2": SongCacheStatus.NOT_CACHED,
+        "3": SongCacheStatus.CACHED,
+    }
+
+    # Files that come back are found as well.
+    shutil.copy(MOCK_SONG_FILE, cache_adapter.music_dir.joinpath("s2.mp3"))
+    cache_adapter._reconcile_cached_files()
+    assert cache_adapter.get_cached_statuses(["2"]) == {"2": SongCacheStatus.CACHED}
+
+
 def test_delete_playlists(cache_adapter: FilesystemAdapter):
     cache_adapter.ingest_new_data(
         KEYS.PLAYLIST_DETAILS,
@@ -460,11 +556,10 @@ def test_delete_playlists(cache_adapter: FilesystemAdapter):
     except CacheMissError as e:
         assert e.partial_data is None
 
-    # Even if the cover art failed to be deleted, it should cache miss.
-    shutil.copy(
-        MOCK_ALBUM_ART,
-        str(cache_adapter.cover_art_dir.joinpath(MOCK_ALBUM_ART_HASH)),
-    )
+    # Even if the cover art hasn't been garbage collected yet, it should cache miss.
+    blob = cache_adapter.blob_store.path(MOCK_ALBUM_ART_HASH)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy(MOCK_ALBUM_ART, str(blob))
     try:
         cache_adapter.get_cover_art_uri("pl_1", "file", size=300)
         assert 0, "DID NOT raise CacheMissError"
@@ -487,7 +582,11 @@ def test_delete_song_data(cache_adapter: FilesystemAdapter):
     cache_adapter.delete_data(KEYS.SONG_FILE, "1")
     cache_adapter.delete_data(KEYS.COVER_ART_FILE, "s1")
 
+    # The blobs are garbage collected in the background.
     assert not Path(music_file_path).exists()
+    deadline = monotonic() + 10
+    while Path(cover_art_path).exists() and monotonic() < deadline:
+        sleep(0.01)
     assert not Path(cover_art_path).exists()
 
     try:
@@ -503,6 +602,48 @@ def test_delete_song_data(cache_adapter: FilesystemAdapter):
         assert e.partial_data is None
 
 
+def test_blob_store(tmp_path: Path):
+    # Cover art from before the blob store is moved into it.
+    legacy_cover_art = tmp_path.joinpath("cover_art", MOCK_ALBUM_ART2_HASH)
+    legacy_cover_art.parent.mkdir()
+    shutil.copy(MOCK_ALBUM_ART2, legacy_cover_art)
+    cache_adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    assert not legacy_cover_art.parent.exists()
+    assert cache_adapter.blob_store.path(MOCK_ALBUM_ART2_HASH).exists()
+
+    # Songs with the same contents share a blob.
+    for song_id in ("1", "2"):
+        song = SubsonicAPI.Song(song_id, title=f"Song {song_id}", path=f"{song_id}.mp3")
+        cache_adapter.ingest_new_data(KEYS.SONG, song_id, song)
+        cache_adapter.ingest_new_data(
+            KEYS.SONG_FILE, song_id, (None, MOCK_SONG_FILE, None)
+        )
+    song_hash = hashlib.sha1(MOCK_SONG_FILE.read_bytes()).hexdigest()
+    blob = cache_adapter.blob_store.path(song_hash)
+    song_files = [cache_adapter.music_dir.joinpath(f"{i}.mp3") for i in ("1", "2")]
+    assert all(f.samefile(blob) for f in song_files)
+    assert models.Blob.get_by_id(song_hash).ref_count == 2
+
+    # The blob is only deleted once nothing references it.
+    cache_adapter.delete_data(KEYS.SONG_FILE, "1")
+    assert models.Blob.get_by_id(song_hash).ref_count == 1
+    assert not song_files[0].exists()
+    assert cache_adapter.get_song_file_uri("2", "file") == f"file://{song_files[1]}"
+
+    cache_adapter.delete_data(KEYS.SONG_FILE, "2")
+    # The blobs are collected in the background, and the files are deleted before the
+    # rows.
+    deadline = monotonic() + 10
+    while (blob.exists() or models.Blob.select().count()) and monotonic() < deadline:
+        sleep(0.01)
+    assert not blob.exists()
+
+    # The legacy cover art isn't referenced by anything, so it's collected as well.
+    assert not cache_adapter.blob_store.path(MOCK_ALBUM_ART2_HASH).exists()
+    assert models.Blob.select().count() == 0
+    cache_adapter.shutdown()
+
+
 def test_caching_get_genres(cache_adapter: FilesystemAdapter):
     with pytest.raises(CacheMissError):
         cache_adapter.get_genres()
@@ -647,6 +788,199 @@ def test_caching_get_song_details_missing_data(cache_adapter: FilesystemAdapter)
         cache_adapter.get_artist("invalid:0beec7b5ea3f0fdbc95d0dd47f3c5bc275da8a33")
 
 
+def test_caching_get_songs_details(cache_adapter: FilesystemAdapter, monkeypatch: Any):
+    assert cache_adapter.get_songs_details(["1", "2"]) == {}
+
+    cache_adapter.ingest_new_data(KEYS.SONG, "1", MOCK_SUBSONIC_SONGS[1])
+    cache_adapter.ingest_new_data(KEYS.SONG, "2", MOCK_SUBSONIC_SONGS[0])
+    cache_adapter.invalidate_data(KEYS.SONG, "2")
+
+    queries = []
+    execute_sql = models.database.execute_sql
+
+    def count_queries(sql: str, *args) -> Any:
+        queries.append(sql)
+        return execute_sql(sql, *args)
+
+    monkeypatch.setattr(models.database, "execute_sql", count_queries)
+
+    # Only the valid songs should be returned, and everything about them should be
+    # loaded with a single query.
+    songs = cache_adapter.get_songs_details(["1", "2", "3"])
+    assert list(songs) == ["1"]
+    song = songs["1"]
+    assert song.title == "Song 1"
+    assert song.album and (song.album.id, song.album.name) == ("a1", "foo")
+    assert song.artist and song.artist.name == "foo"
+    assert song.genre and song.genre.name == "Foo"
+    assert song.path == "foo/song1.mp3"
+    assert len(queries) == 1
+
+
+def test_bulk_ingestion(cache_adapter: FilesystemAdapter, monkeypatch: Any):
+    songs = [
+        SubsonicAPI.Song(
+            str(i),
+            title=f"Song {i}",
+            _album="foo",
+            album_id="a1",
+            _artist="bar",
+            artist_id="art1",
+            path=f"foo/{i}.mp3",
+            cover_art="c1",
+            _genre="Foo",
+        )
+        for i in range(1500)
+    ]
+
+    statements = 0
+    cursor = models.database.cursor
+    test_thread = threading.current_thread()
+
+    def count_statements() -> Any:
+        nonlocal statements
+        # Don't count the statements of the adapter's background threads.
+        if threading.current_thread() is test_thread:
+            statements += 1
+        return cursor()
+
+    monkeypatch.setattr(models.database, "cursor", count_statements)
+
+    # A big playlist should be ingested with a few statements per table.
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS,
+        "p1",
+        SubsonicAPI.Playlist("p1", "Big", songs=songs, comment="Big playlist"),
+    )
+    assert statements < 20
+    monkeypatch.undo()
+
+    playlist = cache_adapter.get_playlist_details("p1")
+    assert playlist.name == "Big"
+    assert [s.id for s in playlist.songs] == [str(i) for i in range(1500)]
+    song = playlist.songs[1000]
+    assert song.title == "Song 1000"
+    assert song.path == "foo/1000.mp3"
+    assert song.cover_art == "c1"
+    assert song.album and song.album.name == "foo"
+    assert song.artist and song.artist.name == "bar"
+    assert song.genre and song.genre.name == "Foo"
+
+    # Partial data shouldn't overwrite existing values with None, or replace the songs.
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLISTS, None, [SubsonicAPI.Playlist("p1", "Renamed")]
+    )
+    playlist = cache_adapter.get_playlist_details("p1")
+    assert playlist.name == "Renamed"
+    assert playlist.comment == "Big playlist"
+    assert len(playlist.songs) == 1500
+
+
+def test_bulk_ingestion_batches(cache_adapter: FilesystemAdapter, monkeypatch: Any):
+    # Huge lists are written a batch at a time, with the same result.
+    monkeypatch.setattr(ingestion, "BATCH_SIZE", 100)
+    songs = [
+        SubsonicAPI.Song(
+            str(i),
+            title=f"Song {i}",
+            _album=f"Album {i % 3}",
+            album_id=f"a{i % 3}",
+            artist_id="art1",
+            _artist="bar",
+        )
+        for i in range(1000)
+    ]
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS,
+        "p1",
+        SubsonicAPI.Playlist("p1", "Big", songs=songs, cover_art="plcover"),
+    )
+    playlist = cache_adapter.get_playlist_details("p1")
+    assert [s.id for s in playlist.songs] == [str(i) for i in range(1000)]
+    # The playlist's cover art shouldn't be lost when the songs are flushed.
+    assert playlist.cover_art == "plcover"
+    assert playlist.songs[500].album and playlist.songs[500].album.name == "Album 2"
+    assert cache_adapter.get_song_details("999").title == "Song 999"
+
+    artists = [
+        SubsonicAPI.ArtistAndArtistInfo(id=f"art{i}", name=f"Artist {i}")
+        for i in range(250)
+    ]
+    cache_adapter.ingest_new_data(KEYS.ARTISTS, None, artists)
+    assert {a.id for a in cache_adapter.get_artists()} == {a.id for a in artists}
+    cache_adapter.ingest_new_data(KEYS.ARTISTS, None, artists[:120])
+    assert len(cache_adapter.get_artists()) == 120
+
+    # Data that is ingested in pages has the same result, and only the IDs of the
+    # objects in the pages are needed at the end.
+    for i in range(0, 100, 30):
+        cache_adapter.ingest_new_data_page(KEYS.ARTISTS, None, artists[i : i + 30])
+    cache_adapter.ingest_paged_data(
+        KEYS.ARTISTS, None, [], [a.id for a in artists[:100]]
+    )
+    assert {a.id for a in cache_adapter.get_artists()} == {a.id for a in artists[:100]}
+
+    for i in range(0, 600, 200):
+        cache_adapter.ingest_new_data_page(
+            KEYS.PLAYLIST_DETAILS, "p2", songs[i : i + 200]
+        )
+    cache_adapter.ingest_paged_data(
+        KEYS.PLAYLIST_DETAILS,
+        "p2",
+        SubsonicAPI.Playlist("p2", "Paged", songs=songs[600:700]),
+        [s.id for s in songs[:600]],
+    )
+    playlist = cache_adapter.get_playlist_details("p2")
+    assert playlist.name == "Paged"
+    assert [s.id for s in playlist.songs] == [str(i) for i in range(700)]
+
+    # By default, caching adapters keep the pages until the rest of the data is
+    # received, and then ingest all of it. Pages from a request that failed are
+    # ignored.
+    CachingAdapter.ingest_new_data_page(
+        cache_adapter, KEYS.PLAYLIST_DETAILS, "p3", songs[100:105]
+    )
+    for i in range(0, 20, 10):
+        CachingAdapter.ingest_new_data_page(
+            cache_adapter, KEYS.PLAYLIST_DETAILS, "p3", songs[i : i + 10]
+        )
+    CachingAdapter.ingest_paged_data(
+        cache_adapter,
+        KEYS.PLAYLIST_DETAILS,
+        "p3",
+        SubsonicAPI.Playlist("p3", "Default", songs=songs[20:25]),
+        [s.id for s in songs[:20]],
+    )
+    playlist = cache_adapter.get_playlist_details("p3")
+    assert [s.id for s in playlist.songs] == [str(i) for i in range(25)]
+
+
+def test_read_during_write(cache_adapter: FilesystemAdapter):
+    cache_adapter.ingest_new_data(KEYS.SONG, "1", MOCK_SUBSONIC_SONGS[1])
+    in_transaction = threading.Event()
+    release = threading.Event()
+
+    def write():
+        with cache_adapter.db_write_lock, models.database.atomic("EXCLUSIVE"):
+            models.Song.update(title="Changed").where(models.Song.id == "1").execute()
+            in_transaction.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    assert in_transaction.wait(5)
+
+    # Reads shouldn't wait for the write to finish, and shouldn't see its changes until
+    # it's committed.
+    start = monotonic()
+    assert cache_adapter.get_song_details("1").title == "Song 1"
+    assert monotonic() - start < 1
+
+    release.set()
+    writer.join()
+    assert cache_adapter.get_song_details("1").title == "Changed"
+
+
 def test_caching_less_info(cache_adapter: FilesystemAdapter):
     cache_adapter.ingest_new_data(
         KEYS.SONG,
@@ -1063,3 +1397,279 @@ def test_search(cache_adapter: FilesystemAdapter):
     ] == [("foo of all foo", "artist4"), ("amazing boo", "artist3")]
     assert [a.name for a in search_result.artists] == ["foo", "better boo"]
     assert [a.name for a in search_result.albums] == ["Foo", "Boo"]
+
+
+def test_search_index(cache_adapter: FilesystemAdapter):
+    songs = [
+        SubsonicAPI.Song(
+            f"s{i}",
+            f"Song {i}",
+            _album="Foo",
+            album_id="al1",
+            _artist="Bar",
+            artist_id="ar1",
+        )
+        for i in range(10)
+    ]
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS, "p1", SubsonicAPI.Playlist("p1", "Mix", songs=songs)
+    )
+
+    # Only the best candidates are returned from the index.
+    assert search_index.search_candidates("song 7", "song", limit=3)[0] == "s7"
+    assert len(search_index.search_candidates("song 7", "song", limit=3)) == 3
+    assert search_index.search_candidates("mix", "playlist") == ["p1"]
+    assert search_index.search_candidates("mix", "song") == []
+    assert search_index.search_candidates(" - ", "song") == []
+
+    # Renaming an artist re-indexes the artist's songs.
+    assert len(search_index.search_candidates("bar", "song")) == 10
+    cache_adapter.ingest_new_data(
+        KEYS.ARTIST, "ar1", SubsonicAPI.ArtistAndArtistInfo(id="ar1", name="Qux")
+    )
+    assert search_index.search_candidates("bar", "song") == []
+    assert len(search_index.search_candidates("qux", "song")) == 10
+    assert [s.title for s in cache_adapter.search("Qux").songs][:1] == ["Song 0"]
+
+    # Deleted rows are removed from the index.
+    cache_adapter.delete_data(KEYS.PLAYLIST_DETAILS, "p1")
+    assert search_index.search_candidates("mix", "playlist") == []
+    assert cache_adapter.search("mix").playlists == []
+
+    # The index is populated from the existing data when it's created.
+    models.SearchIndex.drop_table()
+    search_index.create_search_index()
+    assert search_index.search_candidates("qux", "artist") == ["ar1"]
+    assert len(search_index.search_candidates("song", "song")) == 10
+
+
+def test_query_plans(cache_adapter: FilesystemAdapter):
+    def assert_uses_indexes(query: Any):
+        sql, params = query.sql()
+        plan = [
+            row[-1]
+            for row in models.database.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params)
+        ]
+        for step in plan:
+            assert "TEMP B-TREE" not in step, plan
+            assert not step.startswith("SCAN") or "INDEX" in step, plan
+
+    Type = AlbumSearchQuery.Type
+    for type_ in (
+        Type.NEWEST,
+        Type.FREQUENT,
+        Type.STARRED,
+        Type.ALPHABETICAL_BY_NAME,
+        Type.YEAR_RANGE,
+        Type.GENRE,
+    ):
+        with pytest.raises(CacheMissError) as e:
+            cache_adapter.get_albums(AlbumSearchQuery(type_))
+        assert_uses_indexes(e.value.partial_data)
+
+    assert_uses_indexes(
+        models.Directory.select().where(models.Directory.parent_id == "d1")
+    )
+    assert_uses_indexes(models.Song.select().where(models.Song.parent_id == "d1"))
+    assert_uses_indexes(models.Song.select().where(models.Song.album == "a1"))
+    assert_uses_indexes(models.Album.select().where(models.Album.artist == "ar1"))
+    assert_uses_indexes(
+        models.CacheInfo.select().where(
+            models.CacheInfo.valid == True,  # noqa: 712
+            models.CacheInfo.cache_key == KEYS.ALBUMS,
+        )
+    )
+
+
+def test_migrate_db(tmp_path: Path):
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    assert not models.Version.is_less_than(migrations.SCHEMA_VERSION)
+    assert models.Version.is_less_than("999.0.0")
+    adapter.ingest_new_data(
+        KEYS.ALBUM, "a1", SubsonicAPI.Album(id="a1", name="Foo", year=2020)
+    )
+    adapter.ingest_new_data(
+        KEYS.SONG, "s1", SubsonicAPI.Song("s1", title="Song 1", path="s1.mp3")
+    )
+    adapter.ingest_new_data(KEYS.SONG_FILE, "s1", (None, MOCK_SONG_FILE, None))
+    adapter.shutdown()
+
+    # Make the database look like it was created before there were any migrations.
+    def index_names() -> Set[str]:
+        return {
+            name
+            for (name,) in models.database.execute_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+
+    models.database.connect()
+    all_indexes = index_names()
+    for index in (
+        "album_created",
+        "album_genre_id_name",
+        "album_name",
+        "album_play_count",
+        "album_year_name",
+        "cacheinfo_cache_key_valid",
+        "cacheinfo_last_access_time_disk_size",
+        "directory_parent_id",
+        "song_parent_id",
+    ):
+        models.database.execute_sql(f"DROP INDEX {index}")
+    models.database.execute_sql('CREATE INDEX album_genre_id ON album ("genre_id")')
+    for trigger in ("insert", "update", "delete"):
+        models.database.execute_sql(f"DROP TRIGGER cacheinfo_blob_{trigger}")
+    models.database.execute_sql("DROP TABLE blob")
+    for column in ("last_access_time", "disk_size"):
+        models.database.execute_sql(f"ALTER TABLE cacheinfo DROP COLUMN {column}")
+    models.Version.delete().execute()
+    models.database.close()
+
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    assert index_names() == all_indexes
+    assert not models.Version.is_less_than(migrations.SCHEMA_VERSION)
+    assert adapter.get_album("a1").name == "Foo"
+
+    # The files that were already cached are found before the cache is used.
+    assert adapter.get_song_file_uri("s1", "file").endswith("s1.mp3")
+    assert adapter.get_cached_statuses(["s1"]) == {"s1": SongCacheStatus.CACHED}
+    cache_info = models.CacheInfo.get(models.CacheInfo.cache_key == KEYS.SONG_FILE)
+    assert cache_info.disk_size == MOCK_SONG_FILE.stat().st_size
+    adapter.shutdown()
+
+
+def test_hydrated_songs(cache_adapter: FilesystemAdapter, monkeypatch: Any):
+    songs = [
+        SubsonicAPI.Song(
+            f"s{i}",
+            title=f"Song {i}",
+            parent_id="d1",
+            _album="Foo",
+            album_id="a1",
+            _artist=f"Artist {i}",
+            artist_id=f"ar{i}",
+            _genre=f"Genre {i}",
+            cover_art=f"c{i}",
+            path=f"foo/{i}.mp3",
+            track=10 - i,
+        )
+        for i in range(10)
+    ]
+    cache_adapter.ingest_new_data(
+        KEYS.PLAYLIST_DETAILS, "p1", SubsonicAPI.Playlist("p1", "Foo", songs=songs)
+    )
+    cache_adapter.ingest_new_data(
+        KEYS.ALBUM, "a1", SubsonicAPI.Album(id="a1", name="Foo", songs=songs)
+    )
+    album = cache_adapter.get_album("a1")
+    playlist = cache_adapter.get_playlist_details("p1")
+    directory = models.Directory.create(id="d1", name="Foo")
+
+    queries = []
+    execute_sql = models.database.execute_sql
+
+    def count_queries(sql: str, *args) -> Any:
+        queries.append(sql)
+        return execute_sql(sql, *args)
+
+    monkeypatch.setattr(models.database, "execute_sql", count_queries)
+
+    # Each list of songs should be loaded with everything about the songs in a single
+    # query, no matter how many songs there are.
+    for song_list, expected_order in (
+        (album.songs, list(reversed(range(10)))),
+        (playlist.songs, list(range(10))),
+        (directory.children, list(range(10))),
+        (cache_adapter.search("song").songs, None),
+    ):
+        if expected_order is not None:
+            assert [s.id for s in song_list] == [f"s{i}" for i in expected_order]
+        for song in song_list:
+            i = song.id[1:]
+            assert song.album and song.album.name == "Foo"
+            assert song.artist and song.artist.name == f"Artist {i}"
+            assert song.genre and song.genre.name == f"Genre {i}"
+            assert song.cover_art == f"c{i}"
+            assert song.path == f"foo/{i}.mp3"
+    assert len(queries) == 9
+
+
+def test_can_get_keys(tmp_path: Path, monkeypatch: Any):
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    assert not adapter.can_get_playlists
+    assert not adapter.can_get_playlist_details
+    assert not adapter.can_get_artists
+    assert not adapter.can_get_genres
+
+    adapter.ingest_new_data(KEYS.PLAYLISTS, None, [SubsonicAPI.Playlist("p1", "Foo")])
+    adapter.ingest_new_data(KEYS.ARTISTS, None, [])
+    adapter.invalidate_data(KEYS.ARTISTS, None)
+
+    # The capabilities shouldn't require any queries.
+    queries = []
+    execute_sql = models.database.execute_sql
+
+    def count_queries(sql: str, *args) -> Any:
+        queries.append(sql)
+        return execute_sql(sql, *args)
+
+    monkeypatch.setattr(models.database, "execute_sql", count_queries)
+    assert adapter.can_get_playlists
+    assert adapter.can_get_playlist_details
+    assert adapter.can_get_artists
+    assert not adapter.can_get_genres
+    assert queries == []
+    monkeypatch.undo()
+    adapter.shutdown()
+
+    # The cache keys are loaded from the database on startup.
+    adapter = FilesystemAdapter({}, tmp_path, is_cache=True)
+    assert adapter.can_get_playlists
+    assert adapter.can_get_artists
+    assert not adapter.can_get_genres
+
+    adapter.delete_data(KEYS.EVERYTHING, None)
+    assert not adapter.can_get_playlists
+    assert not adapter.can_get_artists
+    adapter.shutdown()
+
+
+def test_cache_eviction(cache_adapter: FilesystemAdapter):
+    for i in range(1, 5):
+        song = SubsonicAPI.Song(str(i), title=f"Song {i}", path=f"s{i}.mp3")
+        cache_adapter.ingest_new_data(KEYS.SONG, str(i), song)
+        cache_adapter.ingest_new_data(
+            KEYS.SONG_FILE, str(i), (f"s{i}.mp3", MOCK_SONG_FILE, None)
+        )
+    cache_adapter.ingest_new_data(KEYS.SONG_FILE_PERMANENT, "1", None)
+    assert cache_adapter.get_song_file_uri("2", "file").endswith("s2.mp3")
+
+    # Only the permanently cached file and the most recently used file fit.
+    cache_adapter.set_cache_size_limit(2 * MOCK_SONG_FILE.stat().st_size)
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        statuses = cache_adapter.get_cached_statuses(["1", "2", "3", "4"])
+        if statuses["4"] == SongCacheStatus.NOT_CACHED:
+            break
+        sleep(0.05)
+    assert statuses == {
+        "1": SongCacheStatus.PERMANENTLY_CACHED,
+        "2": SongCacheStatus.CACHED,
+        "3": SongCacheStatus.NOT_CACHED,
+        "4": SongCacheStatus.NOT_CACHED,
+    }
+    assert not cache_adapter.music_dir.joinpath("s3.mp3").exists()
+    assert cache_adapter.music_dir.joinpath("s2.mp3").exists()
+
+    # Permanently cached files are never evicted.
+    cache_adapter.set_cache_size_limit(1)
+    deadline = monotonic() + 10
+    while monotonic() < deadline:
+        if cache_adapter.get_cached_statuses(["2"])["2"] == SongCacheStatus.NOT_CACHED:
+            break
+        sleep(0.05)
+    assert cache_adapter.get_cached_statuses(["1", "2"]) == {
+        "1": SongCacheStatus.PERMANENTLY_CACHED,
+        "2": SongCacheStatus.NOT_CACHED,
+    }
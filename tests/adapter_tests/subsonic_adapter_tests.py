@@ -2,15 +2,28 @@ import hashlib
 import json
 import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Any, Generator, List, Tuple
+from time import perf_counter, sleep
+from typing import Any, Generator, List, Sequence, Tuple
 
 import pytest
+from dateutil import parser
 from dateutil.tz import tzutc
 
-from sublime_music.adapters import ConfigurationStore
-from sublime_music.adapters.subsonic import api_objects as SubsonicAPI, SubsonicAdapter
+from sublime_music.adapters import AlbumSearchQuery, ConfigurationStore
+from sublime_music.adapters.http_session import PooledSession
+from sublime_music.adapters.rate_limiter import RateLimiter
+from sublime_music.adapters.subsonic import (
+    adapter as adapter_module,
+    api_objects as SubsonicAPI,
+    decoder,
+    SubsonicAdapter,
+)
+from sublime_music.adapters.subsonic.json_stream import JSONItemStream
 
 MOCK_DATA_FILES = Path(__file__).parent.joinpath("mock_data")
 
@@ -122,6 +135,118 @@ def test_salt_auth_logic(salt_auth_adapter: SubsonicAdapter):
     assert params["t"] == hashlib.md5(f"testpass{salt}".encode()).hexdigest()
     assert all(key in params and params[key] == expected[key] for key in expected)
 
+    # The token is reused until it expires.
+    assert salt_auth_adapter._get_params()["s"] == salt
+    salt_auth_adapter._auth_token_expiration = 0
+    new_params = salt_auth_adapter._get_params()
+    assert (
+        new_params["t"]
+        == hashlib.md5(f"testpass{new_params['s']}".encode()).hexdigest()
+    )
+
+
+def test_pooled_session():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    session = PooledSession(max_connections_per_host=2)
+    try:
+        # Sequential requests all use the same connection.
+        for i in range(5):
+            assert session.get(f"{url}/{i}").text == f"/{i}"
+        stats = session.stats()
+        assert (stats.hosts, stats.requests, stats.connections) == (1, 5, 1)
+        assert stats.reused_connections == 4
+        assert stats.idle_connections == 1
+
+        # Streamed responses give their connection back once they are closed.
+        response = session.get(f"{url}/stream", stream=True)
+        assert session.stats().idle_connections == 0
+        response.close()
+        assert session.stats().idle_connections == 1
+
+        # Each thread has its own session, but they share the connection pool.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(lambda i: session.get(f"{url}/{i}").text, range(20))
+            )
+        assert results == [f"/{i}" for i in range(20)]
+        stats = session.stats()
+        assert stats.requests == 26
+        assert stats.connections < stats.requests
+        assert stats.idle_connections <= 2
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_rate_limited_session():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # The server is too busy to get songs.
+            throttled = self.path.startswith("/rest/getSong.view")
+            self.send_response(503 if throttled else 200)
+            if throttled:
+                self.send_header("Retry-After", "0.2")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args: Any):
+            pass
+
+    endpoint_class = adapter_module.endpoint_class
+    assert endpoint_class("https://a.com/rest/getSong.view?id=1") == "interactive"
+    assert endpoint_class("https://a.com/rest/stream.view?id=1") == "media"
+    assert endpoint_class("https://a.com/rest/getCoverArt") == "media"
+    assert endpoint_class("https://a.com/rest/getAlbumList2.view") == "browse"
+    assert endpoint_class("https://a.com/cover.jpg") == "browse"
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/rest"
+
+    limiter = RateLimiter(adapter_module.ENDPOINT_CLASSES, endpoint_class)
+    session = PooledSession(rate_limiter=limiter)
+    try:
+        for _ in range(3):
+            assert session.get(f"{url}/getAlbumList2.view").status_code == 200
+        assert session.get(f"{url}/getSong.view?id=1").status_code == 503
+
+        # Only the throttled endpoint class backs off.
+        start = perf_counter()
+        session.get(f"{url}/stream.view?id=1")
+        assert perf_counter() - start < 0.15
+        session.get(f"{url}/getSong.view?id=2")
+        assert perf_counter() - start > 0.15
+
+        stats = session.rate_limiter.stats()
+        assert (stats["browse"].requests, stats["browse"].overloaded) == (3, 0)
+        assert (stats["media"].requests, stats["media"].overloaded) == (1, 0)
+        interactive = stats["interactive"]
+        assert (interactive.requests, interactive.overloaded) == (2, 2)
+        assert interactive.concurrency_limit == 1
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
+
 
 def test_migrate_configuration_populate_salt_auth():
     config = ConfigurationStore(
@@ -379,7 +504,8 @@ def test_get_artists(adapter: SubsonicAdapter):
     for filename, data in mock_data_files("get_artists"):
         logging.info(filename)
         logging.debug(data)
-        adapter._set_mock_data(data)
+        data = list(data)
+        adapter._set_mock_data(iter(data))
 
         artists = adapter.get_artists()
         assert len(artists) == 7
@@ -393,6 +519,109 @@ def test_get_artists(adapter: SubsonicAdapter):
             "Zach Williams",
         }
 
+        pages: List[Sequence[SubsonicAPI.ArtistAndArtistInfo]] = []
+        adapter._set_mock_data(iter(data))
+        assert adapter.get_artists(on_page=pages.append) == []
+        assert [a for page in pages for a in page] == artists
+
+
+def test_stream_json(adapter: SubsonicAdapter, monkeypatch: Any):
+    # Parse the responses a few bytes at a time so that the entries (and the numbers
+    # and strings in them) are split across chunks.
+    monkeypatch.setattr(adapter_module, "STREAM_CHUNK_SIZE", 7)
+    monkeypatch.setattr(adapter_module, "STREAM_BATCH_SIZE", 3)
+
+    batches: List[int] = []
+    for filename, data in mock_data_files("get_playlist_details"):
+        logging.info(filename)
+        data = list(data)
+        expected = SubsonicAPI.Response.from_dict(
+            json.loads(data[0])["subsonic-response"]
+        ).playlist
+
+        batches.clear()
+        adapter._set_mock_data(iter(data))
+        response = adapter._stream_json(
+            adapter._make_url("getPlaylist"),
+            "playlist.entry.item",
+            lambda entries: batches.append(len(entries)),
+        )
+        assert expected
+        assert sum(batches) == len(expected.songs)
+        assert all(b == 3 for b in batches[:-1])
+        # The rest of the response doesn't have the entries.
+        assert response["playlist"]["id"] == expected.id
+        assert response["playlist"]["entry"] == []
+
+        adapter._set_mock_data(iter(data))
+        assert adapter.get_playlist_details(expected.id) == expected
+
+        # With an on_page callback, the songs are only passed to it.
+        pages: List[Sequence[SubsonicAPI.Song]] = []
+        adapter._set_mock_data(iter(data))
+        playlist = adapter.get_playlist_details(expected.id, on_page=pages.append)
+        assert playlist.songs == []
+        assert playlist.name == expected.name
+        assert playlist.song_count == expected.song_count
+        assert playlist.duration == expected.duration
+        assert [s for page in pages for s in page] == expected.songs
+
+    adapter._set_mock_data(
+        mock_json(error={"code": 70, "message": "Not found"}, status="failed")
+    )
+    with pytest.raises(adapter_module.ServerError):
+        adapter._stream_json(
+            adapter._make_url("getPlaylist"), "playlist.entry.item", lambda _: None
+        )
+
+    # A response with an error status should be closed so that its connection can be
+    # reused.
+    class ErrorResponse:
+        status_code = 500
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    error_response = ErrorResponse()
+    monkeypatch.setattr(adapter, "_get_mock_data", lambda: error_response)
+    monkeypatch.setattr(adapter, "_exponential_backoff", lambda n: None)
+    with pytest.raises(adapter_module.ServerError):
+        adapter._stream_json(
+            adapter._make_url("getPlaylist"), "playlist.entry.item", lambda _: None
+        )
+    assert error_response.closed
+
+
+def test_json_item_stream():
+    document = {
+        "a": {
+            "b": [
+                {"name": "x", "c": [1, -2.5e10, 'é"', None]},
+                {"name": "y", "c": [{"d": [True, False]}]},
+                {"name": "z"},
+            ],
+            "e": 12345,
+        }
+    }
+    encoded = json.dumps(document, ensure_ascii=False).encode()
+    for chunk_size in (1, 2, 5, len(encoded)):
+        chunks = (
+            encoded[i : i + chunk_size] for i in range(0, len(encoded), chunk_size)
+        )
+        stream = JSONItemStream(chunks, "a.b.item.c.item")
+        assert list(stream) == [1, -2.5e10, 'é"', None, {"d": [True, False]}]
+        assert stream.document == {
+            "a": {
+                "b": [{"name": "x", "c": []}, {"name": "y", "c": []}, {"name": "z"}],
+                "e": 12345,
+            }
+        }
+
+    for invalid in (b'{"a": {"b": [1, 2', b'{"a": {"b": [1 2]}}', b'{"a": 1} 2', b""):
+        with pytest.raises(json.JSONDecodeError):
+            list(JSONItemStream([invalid], "a.b.item"))
+
 
 def test_get_ignored_articles(adapter: SubsonicAdapter):
     for filename, data in mock_data_files("get_artists"):
@@ -567,3 +796,132 @@ def test_search(adapter: SubsonicAdapter):
         assert len(search_results._songs) == 7
         assert len(search_results._artists) == 2
         assert len(search_results._albums) == 4
+
+
+def test_get_albums(adapter: SubsonicAdapter, monkeypatch: Any):
+    total = 1234
+    requested_offsets = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def mock_get_json(
+        url: str, type: str, size: int, offset: int, **kwargs: Any
+    ) -> SubsonicAPI.Response:
+        nonlocal in_flight, max_in_flight
+        with lock:
+            requested_offsets.append(offset)
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+
+        # Make the later pages come back first.
+        sleep(0.05 if offset == 0 else 0.01)
+        with lock:
+            in_flight -= 1
+        return SubsonicAPI.Response(
+            albums=SubsonicAPI.AlbumList2(
+                [
+                    SubsonicAPI.Album(name=f"Album {i}", id=str(i))
+                    for i in range(offset, min(offset + size, total))
+                ]
+            )
+        )
+
+    monkeypatch.setattr(adapter, "_get_json", mock_get_json)
+
+    pages: List[int] = []
+    albums = adapter.get_albums(
+        AlbumSearchQuery(AlbumSearchQuery.Type.ALPHABETICAL_BY_NAME),
+        on_page=lambda page: pages.append(len(page)),
+    )
+    assert [a.id for a in albums] == [str(i) for i in range(total)]
+    assert pages == [500, 500, 234]
+    assert 1 < max_in_flight <= adapter_module.ALBUM_PAGE_CONCURRENCY
+    # The requests stop shortly after the first empty page.
+    assert 1500 in requested_offsets
+    assert max(requested_offsets) < 1500 + 500 * adapter_module.ALBUM_PAGE_CONCURRENCY
+
+    # Only one page of random albums is requested.
+    requested_offsets.clear()
+    albums = adapter.get_albums(AlbumSearchQuery(AlbumSearchQuery.Type.RANDOM))
+    assert len(albums) == 50
+    assert requested_offsets == [0]
+
+
+def recorded_responses() -> Generator[Tuple[Path, dict], None, None]:
+    sep_re = re.compile(r"^=+$", re.MULTILINE)
+    for file in sorted(MOCK_DATA_FILES.glob("*.json")):
+        # These are deliberately invalid.
+        if file.name.startswith("ping_failed"):
+            continue
+        for part in sep_re.split(file.read_text()):
+            if response := json.loads(part).get("subsonic-response"):
+                yield file, response
+
+
+def test_decode_recorded_responses():
+    num_responses = 0
+    for filename, response in recorded_responses():
+        logging.info(filename)
+        assert decoder.decode(SubsonicAPI.Response, response) == (
+            SubsonicAPI.Response.from_dict(response)
+        )
+        num_responses += 1
+    assert num_responses > 20
+
+
+def test_decode_extra_fields():
+    # Unknown fields are ignored, and fields can be given by either name.
+    song = decoder.decode(
+        SubsonicAPI.Song,
+        {"id": 1, "title": "Song", "track": "3", "unknown": [], "parent_id": "2"},
+    )
+    assert song == SubsonicAPI.Song("1", title="Song", track=3, parent_id="2")
+
+    with pytest.raises(KeyError):
+        decoder.decode(SubsonicAPI.Song, {"title": "Song"})
+
+
+def test_parse_datetime():
+    for value, expected in (
+        ("2020-03-27T05:38:45.487Z", datetime(2020, 3, 27, 5, 38, 45, 487000)),
+        ("2020-03-27T05:38:45.000Z", datetime(2020, 3, 27, 5, 38, 45)),
+        ("2020-03-27T07:38:45+02:00", datetime(2020, 3, 27, 5, 38, 45)),
+        ("2020-03-27T00:08:45-05:30", datetime(2020, 3, 27, 5, 38, 45)),
+        ("2020-03-27T05:38:45+00:00", datetime(2020, 3, 27, 5, 38, 45)),
+        ("Fri, 27 Mar 2020 05:38:45 GMT", datetime(2020, 3, 27, 5, 38, 45)),
+    ):
+        parsed = decoder.parse_datetime(value)
+        assert parsed == expected.replace(tzinfo=timezone.utc)
+        assert parsed == parser.parse(value)
+
+    # Timestamps without a time zone stay naive.
+    assert decoder.parse_datetime("2020-03-27T05:38:45") == datetime(
+        2020, 3, 27, 5, 38, 45
+    )
+    assert decoder.parse_datetime("2020-03-27") == datetime(2020, 3, 27)
+
+
+@pytest.mark.benchmark
+def test_decoder_benchmark():
+    # This only reports the timings (run it with ``pytest -m benchmark``). The results
+    # are checked by test_decode_recorded_responses.
+    responses = [response for _, response in recorded_responses()]
+
+    def time_decoder(decode: Any) -> float:
+        start = perf_counter()
+        for _ in range(100):
+            for response in responses:
+                decode(response)
+        return perf_counter() - start
+
+    # Compile the decoders before timing them.
+    decoder.decode(SubsonicAPI.Response, responses[0])
+    fast_time = time_decoder(
+        lambda response: decoder.decode(SubsonicAPI.Response, response)
+    )
+    slow_time = time_decoder(SubsonicAPI.Response.from_dict)
+    logging.info(
+        f"Decoded {len(responses)} responses 100 times in {fast_time:.3f}s "
+        f"(from_dict took {slow_time:.3f}s, {slow_time / fast_time:.1f}x slower)"
+    )